@@ -0,0 +1,98 @@
+"""collection_profiles.py
+
+Benchmark recall, search latency and memory of each Qdrant collection profile on synthetic clustered vectors.
+
+Needs a running Qdrant.
+Run with `python -m app.benchmarks.collection_profiles --host http://localhost:6333 --points 50000`.
+"""
+
+import argparse
+import time
+
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.models import Batch, SearchParams
+
+from app.database.profiles import PROFILES, CollectionProfile
+
+
+def build_vectors(count: int, dim: int, clusters: int, seed: int) -> np.ndarray:
+    """Unit vectors around random centres, roughly how log embeddings bunch up by template."""
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(clusters, dim))
+    vectors = centres[rng.integers(0, clusters, size=count)] + 0.3 * rng.normal(size=(count, dim))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+def load_collection(client: QdrantClient, name: str, profile: CollectionProfile, vectors: np.ndarray) -> float:
+    """Create the collection and upload the vectors. Returns seconds until it is indexed."""
+    if client.collection_exists(name):
+        client.delete_collection(name)
+    client.create_collection(
+        collection_name=name,
+        vectors_config=profile.vectors_config(vectors.shape[1]),
+        hnsw_config=profile.hnsw_config(),
+        quantization_config=profile.quantization_config(),
+        on_disk_payload=profile.on_disk_payload,
+    )
+    started = time.perf_counter()
+    for start in range(0, len(vectors), 1024):
+        end = min(start + 1024, len(vectors))
+        rows: list[list[float]] = vectors[start:end].tolist()  # type: ignore[assignment]
+        ids: list = list(range(start, end))
+        client.upsert(collection_name=name, points=Batch(ids=ids, vectors=rows), wait=False)
+    while client.get_collection(name).status.value != "green":
+        time.sleep(0.5)
+    return time.perf_counter() - started
+
+
+def measure(
+    client: QdrantClient, name: str, profile: CollectionProfile, queries: np.ndarray, limit: int
+) -> tuple[float, float, float]:
+    """Return recall@limit against exact search, and p50 and p95 latency in milliseconds."""
+    recalls: list[float] = []
+    latencies: list[float] = []
+    for query in queries:
+        exact = client.search(name, query_vector=query, limit=limit, search_params=SearchParams(exact=True))
+        started = time.perf_counter()
+        found = client.search(name, query_vector=query, limit=limit, search_params=profile.search_params())
+        latencies.append((time.perf_counter() - started) * 1000)
+        truth = {point.id for point in exact}
+        recalls.append(len(truth & {point.id for point in found}) / len(truth))
+    p50, p95 = np.percentile(latencies, [50, 95])
+    return float(np.mean(recalls)), float(p50), float(p95)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="http://localhost:6333")
+    parser.add_argument("--points", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=96)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--profiles", default=",".join(PROFILES), help="Comma separated profile names.")
+    parser.add_argument("--keep", action="store_true", help="Keep the benchmark collections.")
+    args = parser.parse_args()
+
+    client = QdrantClient(args.host)
+    vectors = build_vectors(args.points, args.dim, args.clusters, seed=0)
+    # Queries are perturbed points, so they land in the same clusters as the data.
+    rng = np.random.default_rng(1)
+    noise = 0.1 * rng.normal(size=(args.queries, args.dim))
+    queries = vectors[rng.integers(0, len(vectors), size=args.queries)] + noise
+    print(f"{args.points} points of dim {args.dim}, {args.queries} queries, recall@{args.limit}")
+    print(f"{'profile':<16}{'index s':>9}{'recall':>8}{'p50 ms':>9}{'p95 ms':>9}{'est. RAM MB':>13}")
+    for name in args.profiles.split(","):
+        profile = PROFILES[name]
+        collection = f"benchmark_profile_{name}"
+        indexed = load_collection(client, collection, profile, vectors)
+        recall, p50, p95 = measure(client, collection, profile, queries, args.limit)
+        ram = profile.estimated_ram_bytes(args.points, args.dim) / 2**20
+        print(f"{name:<16}{indexed:>9.1f}{recall:>8.3f}{p50:>9.2f}{p95:>9.2f}{ram:>13.1f}")
+        if not args.keep:
+            client.delete_collection(collection)
+
+
+if __name__ == "__main__":
+    main()
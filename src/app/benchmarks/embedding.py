@@ -0,0 +1,57 @@
+"""embedding.py
+
+Benchmark embedding throughput of the batched embedding pool by number of worker processes.
+
+Run with `python -m app.benchmarks.embedding --lines 20000 --workers 1,2,4 --batch-size 256`.
+"""
+
+import argparse
+import time
+
+from app.database.processors import EmbeddingPool
+
+
+def build_lines(count: int) -> list[str]:
+    """Build synthetic log messages with some variety in wording and numbers."""
+    templates = [
+        "connection refused to db-{i} after {n} ms",
+        "user {i} logged in from 10.0.{n}.{i}",
+        "request GET /api/orders/{i} completed in {n} ms",
+        "CPU usage at {n}% on worker {i}",
+        "failed to parse payload for order {i}: unexpected token at {n}",
+    ]
+    return [templates[i % len(templates)].format(i=i % 97, n=i % 1000) for i in range(count)]
+
+
+def measure(lines: list[str], processes: int, batch_size: int) -> float:
+    """Return lines per second, excluding worker start-up and model load."""
+    pool = EmbeddingPool(processes=processes, batch_size=batch_size)
+    try:
+        # Warm up every worker so model loading is not timed.
+        for _ in pool.embed_batches(lines[: batch_size * max(processes, 1)]):
+            pass
+        started = time.perf_counter()
+        count = sum(len(embeddings) for embeddings in pool.embed_batches(lines))
+        return count / (time.perf_counter() - started)
+    finally:
+        pool.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, default=20000)
+    parser.add_argument("--workers", default="1,2,4", help="Comma separated worker process counts.")
+    parser.add_argument("--batch-size", type=int, default=256)
+    args = parser.parse_args()
+
+    lines = build_lines(args.lines)
+    print(f"Embedding {len(lines)} lines, batch size {args.batch_size}")
+    baseline = None
+    for processes in (int(workers) for workers in args.workers.split(",")):
+        rate = measure(lines, processes, args.batch_size)
+        baseline = baseline or rate
+        print(f"{processes:>3} workers {rate:12,.0f} lines/s {rate / baseline:6.2f}x")
+
+
+if __name__ == "__main__":
+    main()
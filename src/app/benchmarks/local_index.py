@@ -0,0 +1,61 @@
+"""local_index.py
+
+Benchmark the in-process vector store against Qdrant on the same synthetic clustered vectors: load time,
+recall@k against exact search and search latency. Qdrant is skipped unless `--host` is given.
+
+Run with `python -m app.benchmarks.local_index --points 200000 --host http://localhost:6333`.
+"""
+
+import argparse
+import tempfile
+
+import numpy as np
+from qdrant_client import QdrantClient
+
+from app.benchmarks.collection_profiles import build_vectors, load_collection, measure
+from app.database.local_store import LocalVectorStore
+from app.database.profiles import get_profile
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=None, help="Qdrant URL, e.g. http://localhost:6333.")
+    parser.add_argument("--points", type=int, default=200000)
+    parser.add_argument("--dim", type=int, default=96)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--ann-min-points", type=int, default=50000)
+    parser.add_argument("--nprobe", default="4,16,64", help="Comma separated IVF probe counts for the local store.")
+    args = parser.parse_args()
+
+    vectors = build_vectors(args.points, args.dim, args.clusters, seed=0)
+    rng = np.random.default_rng(1)
+    noise = 0.1 * rng.normal(size=(args.queries, args.dim))
+    queries = vectors[rng.integers(0, len(vectors), size=args.queries)] + noise
+    profile = get_profile("default")
+    print(f"{args.points} points of dim {args.dim}, {args.queries} queries, recall@{args.limit}")
+    print(f"{'backend':<22}{'load s':>9}{'recall':>8}{'p50 ms':>9}{'p95 ms':>9}")
+
+    backends = []
+    with tempfile.TemporaryDirectory() as directory:
+        local = LocalVectorStore(directory, ann_min_points=args.ann_min_points)
+        backends.append(("local", local))
+        if args.host:
+            backends.append(("qdrant", QdrantClient(args.host)))
+        for name, client in backends:
+            loaded = load_collection(client, "benchmark_local_index", profile, vectors)
+            if isinstance(client, LocalVectorStore):
+                collection = client.collection("benchmark_local_index")
+                for nprobe in (int(value) for value in args.nprobe.split(",")):
+                    collection.nprobe = nprobe
+                    recall, p50, p95 = measure(client, "benchmark_local_index", profile, queries, args.limit)
+                    print(f"{f'{name} nprobe={nprobe}':<22}{loaded:>9.1f}{recall:>8.3f}{p50:>9.2f}{p95:>9.2f}")
+            else:
+                recall, p50, p95 = measure(client, "benchmark_local_index", profile, queries, args.limit)
+                print(f"{name:<22}{loaded:>9.1f}{recall:>8.3f}{p50:>9.2f}{p95:>9.2f}")
+            client.delete_collection("benchmark_local_index")
+
+
+if __name__ == "__main__":
+    main()
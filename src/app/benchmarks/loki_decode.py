@@ -0,0 +1,73 @@
+"""loki_decode.py
+
+Benchmark decoding of Loki query_range responses: whole-body `json.loads` against the streaming decoder.
+
+Run with `python -m app.benchmarks.loki_decode --streams 50 --lines 2000`.
+"""
+
+import argparse
+import io
+import json
+import time
+import tracemalloc
+from typing import Callable
+
+from app.connectors import decode_loki_streams, flatten_streams
+
+
+def build_response(streams: int, lines: int) -> bytes:
+    """Build a synthetic query_range response body."""
+    result = []
+    for s in range(streams):
+        values = [
+            [
+                str(1_700_000_000_000_000_000 + s * lines + i),
+                json.dumps({"level": "ERROR", "message": f"connection refused to db-{i % 7} after {i} ms", "line": i}),
+            ]
+            for i in range(lines)
+        ]
+        result.append({"stream": {"job": "bench", "service": f"svc-{s}", "level": "ERROR"}, "values": values})
+    return json.dumps({"status": "success", "data": {"resultType": "streams", "result": result}}).encode("utf-8")
+
+
+def decode_json(body: bytes) -> int:
+    return len(flatten_streams(json.loads(body)["data"]["result"]))
+
+
+def decode_streaming(body: bytes) -> int:
+    return sum(1 for _ in decode_loki_streams(io.BytesIO(body)))
+
+
+def measure(name: str, decode: Callable[[bytes], int], body: bytes, repeat: int):
+    """Print throughput over `repeat` runs and the peak traced memory of one run."""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        count = decode(body)
+    elapsed = (time.perf_counter() - started) / repeat
+
+    tracemalloc.start()
+    decode(body)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(
+        f"{name:<10} {len(body) / elapsed / 1e6:8.1f} MB/s {count / elapsed:12,.0f} lines/s "
+        f"peak {peak / 1e6:8.1f} MB"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--streams", type=int, default=50)
+    parser.add_argument("--lines", type=int, default=2000, help="Lines per stream.")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    body = build_response(args.streams, args.lines)
+    print(f"Response: {len(body) / 1e6:.1f} MB, {args.streams} streams x {args.lines} lines")
+    measure("json", decode_json, body, args.repeat)
+    measure("streaming", decode_streaming, body, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
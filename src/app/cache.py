@@ -0,0 +1,252 @@
+"""cache.py
+
+In-memory and on-disk caches shared by the connectors and clients."""
+
+import hashlib
+import logging
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Protocol
+
+logger = logging.getLogger(__name__)
+
+
+class SupportsStats(Protocol):
+    def stats(self) -> dict: ...
+
+
+_registry: dict[str, SupportsStats] = {}
+
+
+def register_cache(name: str, cache: SupportsStats) -> None:
+    """Make a cache's counters visible through `cache_stats`."""
+    _registry[name] = cache
+
+
+def cache_stats() -> dict[str, dict]:
+    """Hit/miss counters of every registered cache."""
+    return {name: cache.stats() for name, cache in _registry.items()}
+
+
+class LRUCache:
+    """
+    Thread-safe in-memory LRU cache with optional per-entry TTL.
+
+    Args:
+        max_items (int): Entries kept before the least recently used one is evicted.
+        max_bytes (int | None): Estimated bytes kept before least recently used entries are evicted.
+        sizeof (Callable[[Any], int] | None): Estimate of the bytes of a value, required with `max_bytes`.
+    """
+
+    def __init__(self, max_items: int, max_bytes: int | None = None, sizeof: Callable[[Any], int] | None = None):
+        if max_bytes is not None and sizeof is None:
+            raise ValueError("LRUCache needs a sizeof function to bound its size in bytes.")
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.nbytes = 0
+        self._data: OrderedDict[str, tuple[float | None, Any, int]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Any | None:
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and (item[0] is None or item[0] > time.monotonic()):
+                self._data.move_to_end(key)
+                self.hits += 1
+                return item[1]
+            if item is not None:
+                self._pop(key)
+            self.misses += 1
+            return None
+
+    def _pop(self, key: str) -> None:
+        self.nbytes -= self._data.pop(key)[2]
+
+    def set(self, key: str, value: Any, ttl: float | None = None) -> None:
+        expires = None if ttl is None else time.monotonic() + ttl
+        size = self.sizeof(value) if self.sizeof is not None else 0
+        with self._lock:
+            if key in self._data:
+                self._pop(key)
+            if self.max_bytes is not None and size > self.max_bytes:
+                return
+            self._data[key] = (expires, value, size)
+            self.nbytes += size
+            while len(self._data) > self.max_items or (self.max_bytes is not None and self.nbytes > self.max_bytes):
+                self._pop(next(iter(self._data)))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.nbytes = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "items": len(self._data),
+            "bytes": self.nbytes,
+        }
+
+
+class DiskCache:
+    """
+    Pickle-per-entry cache in a directory, evicting the least recently used files above `max_bytes`.
+
+    Entries may carry a wall-clock expiry. Unreadable files are treated as misses and removed. If the directory
+    cannot be written the disk tier switches itself off and the cache keeps working from memory.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.available = True
+        self._lock = threading.Lock()
+        self._size: int | None = None
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(key.encode("utf-8")).hexdigest() + ".pkl")
+
+    def get(self, key: str) -> Any | None:
+        entry = self.get_entry(key)
+        return None if entry is None else entry[1]
+
+    def get_entry(self, key: str) -> tuple[float | None, Any] | None:
+        """The (wall-clock expiry, value) of a key, the expiry being None for entries that do not expire."""
+        if not self.available:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                stored_key, expires, value = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Discarding unreadable cache file {path}: {e}")
+            self._remove(path)
+            return None
+
+        if stored_key != key or (expires is not None and expires <= time.time()):
+            self._remove(path)
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return expires, value
+
+    def set(self, key: str, value: Any, ttl: float | None = None) -> None:
+        if not self.available:
+            return
+        expires = None if ttl is None else time.time() + ttl
+        path = self._path(key)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump((key, expires, value), f, protocol=pickle.HIGHEST_PROTOCOL)
+            written = os.path.getsize(tmp_path)
+            with self._lock:
+                # An overwritten entry only grows the cache by the difference in size.
+                replaced = self._file_size(path)
+                os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Disabling disk cache in {self.directory}, failed to write {path}: {e}")
+            self.available = False
+            return
+
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += written - replaced
+            if self._size > self.max_bytes:
+                self._evict()
+
+    @staticmethod
+    def _file_size(path: str) -> int:
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return 0
+
+    def _scan_size(self) -> int:
+        return sum(entry.stat().st_size for entry in os.scandir(self.directory) if entry.name.endswith(".pkl"))
+
+    def _evict(self) -> None:
+        """Remove least recently used files until the cache is at 90% of `max_bytes`."""
+        files = sorted(
+            (entry.stat().st_mtime, entry.stat().st_size, entry.path)
+            for entry in os.scandir(self.directory)
+            if entry.name.endswith(".pkl")
+        )
+        size = sum(file_size for _, file_size, _ in files)
+        target = self.max_bytes * 0.9
+        for _, file_size, path in files:
+            if size <= target:
+                break
+            self._remove(path)
+            size -= file_size
+        self._size = size
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class TieredCache:
+    """
+    An `LRUCache` in front of an optional `DiskCache`.
+
+    Disk hits are promoted to memory for the rest of their TTL. Only entries without a TTL, or written with
+    `persist=True`, go to disk.
+    """
+
+    def __init__(self, memory: LRUCache, disk: DiskCache | None = None):
+        self.memory = memory
+        self.disk = disk
+        self.disk_hits = 0
+
+    def get(self, key: str) -> Any | None:
+        value = self.memory.get(key)
+        if value is not None or self.disk is None:
+            return value
+        entry = self.disk.get_entry(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        self.disk_hits += 1
+        if expires is None:
+            self.memory.set(key, value)
+        elif expires > time.time():
+            self.memory.set(key, value, ttl=expires - time.time())
+        return value
+
+    def set(self, key: str, value: Any, ttl: float | None = None, persist: bool | None = None) -> None:
+        self.memory.set(key, value, ttl=ttl)
+        if self.disk is not None and (persist if persist is not None else ttl is None):
+            self.disk.set(key, value, ttl=ttl)
+
+    def stats(self) -> dict:
+        stats = self.memory.stats()
+        # A disk hit was counted as a memory miss; report it as a hit of the cache as a whole.
+        stats["hits"] += self.disk_hits
+        stats["misses"] -= self.disk_hits
+        total = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / total, 4) if total else 0.0
+        stats["disk_hits"] = self.disk_hits
+        return stats
@@ -2,36 +2,233 @@
 
 Ths module contains connections to external data sources."""
 
+import asyncio
+import heapq
+import itertools
+import json
 import logging
+import sys
+import time
+from collections import deque
+from typing import IO, AsyncGenerator, AsyncIterator, Iterable, Iterator, NamedTuple
 from urllib.parse import urljoin
 
+import httpx
+import ijson
 import requests  # type: ignore
 
-from app.settings import LOKI_QUERY_RANGE_ENDPOINT
+from app.cache import DiskCache, LRUCache, TieredCache, register_cache
+from app.settings import (
+    LOKI_CACHE_DIR,
+    LOKI_CACHE_ENABLED,
+    LOKI_CACHE_MAX_BYTES,
+    LOKI_CACHE_MAX_DISK_BYTES,
+    LOKI_CACHE_MAX_ITEMS,
+    LOKI_CACHE_OPEN_TTL_SECONDS,
+    LOKI_INGESTION_DELAY_SECONDS,
+    LOKI_MAX_CONNECTIONS,
+    LOKI_PAGE_SIZE,
+    LOKI_QUERY_ALIGN_SECONDS,
+    LOKI_QUERY_ENDPOINT,
+    LOKI_QUERY_RANGE_ENDPOINT,
+    LOKI_SHARD_MAX_SECONDS,
+    LOKI_SHARD_MIN_SECONDS,
+    LOKI_SHARD_PARALLELISM,
+    LOKI_SHARD_SECONDS,
+    LOKI_SHARD_TARGET_LATENCY_SECONDS,
+    LOKI_TIMEOUT_SECONDS,
+)
 from app.utils import datetime_to_timestamp
 
 logger = logging.getLogger(__name__)
 
+# Shared keep-alive session for the synchronous helpers; requests negotiates gzip by default.
+_session = requests.Session()
 
-def build_loki_query(job_name: str, level: str | None = None, search_word: str | None = None) -> str:
+NANOSECONDS = 1_000_000_000
+LOKI_METRIC_FUNCTIONS = ("count_over_time", "rate")
+
+
+class LokiQueryError(Exception):
+    """A Loki query failed, so the lines it should have returned are missing."""
+
+
+class LokiShardError(LokiQueryError):
+    """A shard of `aiter_loki_logs_sharded` failed. Lines from `start_ns` on may be missing."""
+
+    def __init__(self, start_ns: int, end_ns: int, error: Exception):
+        super().__init__(f"Loki shard [{start_ns}, {end_ns}) failed: {error}")
+        self.start_ns = start_ns
+        self.end_ns = end_ns
+
+
+class LokiEntry(NamedTuple):
+    """A single Loki log line with its nanosecond timestamp and stream labels."""
+
+    timestamp: int
+    line: str
+    stream: dict
+
+
+# Estimated bytes of an entry besides its line: the tuple, its timestamp and the list slot holding it.
+_ENTRY_OVERHEAD_BYTES = 120
+
+
+def _result_nbytes(result: list) -> int:
+    """Estimated memory of a cached result: a list of entries, of streams or of metric samples."""
+    size = 0
+    for item in result:
+        if isinstance(item, LokiEntry):
+            size += sys.getsizeof(item.line) + _ENTRY_OVERHEAD_BYTES
+        else:
+            values = item.get("values") or []
+            size += _ENTRY_OVERHEAD_BYTES * (len(values) + 1) + sum(sys.getsizeof(value[-1]) for value in values)
+    return size
+
+
+class LokiResultCache:
+    """
+    Cache of Loki query results shared by every caller in the process.
+
+    Results are keyed by the normalised (url, LogQL, start, end, limit, direction) of the request. A window
+    that ended more than `ingestion_delay_seconds` ago can no longer change, so its result is kept until it
+    is evicted by size, in memory and on disk. Results of windows reaching closer to now are kept in memory
+    for `open_ttl_seconds` only. Memory use is bounded by `max_bytes`, estimated from the lines held.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = LOKI_CACHE_ENABLED,
+        directory: str | None = LOKI_CACHE_DIR,
+        max_items: int = LOKI_CACHE_MAX_ITEMS,
+        max_bytes: int = LOKI_CACHE_MAX_BYTES,
+        max_disk_bytes: int = LOKI_CACHE_MAX_DISK_BYTES,
+        open_ttl_seconds: float = LOKI_CACHE_OPEN_TTL_SECONDS,
+        ingestion_delay_seconds: float = LOKI_INGESTION_DELAY_SECONDS,
+    ):
+        self.enabled = enabled
+        self.open_ttl_seconds = open_ttl_seconds
+        self.ingestion_delay_ns = int(ingestion_delay_seconds * NANOSECONDS)
+        disk = DiskCache(directory, max_disk_bytes) if directory else None
+        self.cache = TieredCache(LRUCache(max_items, max_bytes, _result_nbytes), disk)
+
+    @staticmethod
+    def key(url: str, params: dict) -> str:
+        normalised = dict(params)
+        if "query" in normalised:
+            normalised["query"] = " ".join(str(normalised["query"]).split())
+        for name in ("start", "end", "time"):
+            if name in normalised:
+                normalised[name] = _param_to_nanoseconds(normalised[name])
+        return json.dumps([url.rstrip("/"), normalised], sort_keys=True)
+
+    def ttl(self, params: dict) -> float | None:
+        """None if the window is closed and cacheable forever, else the TTL of an open window."""
+        end = params.get("end", params.get("time"))
+        if end is not None and _param_to_nanoseconds(end) <= time.time_ns() - self.ingestion_delay_ns:
+            return None
+        return self.open_ttl_seconds
+
+    def get(self, url: str, params: dict):
+        if not self.enabled:
+            return None
+        return self.cache.get(self.key(url, params))
+
+    def set(self, url: str, params: dict, value) -> None:
+        if not self.enabled:
+            return
+        ttl = self.ttl(params)
+        if ttl is not None and ttl <= 0:
+            return
+        self.cache.set(self.key(url, params), value, ttl=ttl)
+
+    def stats(self) -> dict:
+        return self.cache.stats()
+
+
+def _param_to_nanoseconds(value: str | int | float) -> int:
+    """Loki accepts second or nanosecond timestamps; normalise both to nanoseconds."""
+    timestamp = int(value)
+    return timestamp * NANOSECONDS if timestamp < 10**12 else timestamp
+
+
+def aligned_now_ns(step_seconds: float = LOKI_QUERY_ALIGN_SECONDS) -> int:
+    """
+    The current time as a nanosecond timestamp, rounded down to a multiple of `step_seconds`.
+
+    Callers that end their query windows at an aligned "now" issue identical requests within a step, which
+    lets them share cached results.
+    """
+    now_ns = time.time_ns()
+    step_ns = int(step_seconds * NANOSECONDS)
+    return now_ns - now_ns % step_ns if step_ns > 0 else now_ns
+
+
+loki_cache = LokiResultCache()
+register_cache("loki", loki_cache)
+
+
+def build_loki_query(
+    job_name: str,
+    level: str | list[str] | None = None,
+    search_word: str | None = None,
+    service: str | None = None,
+) -> str:
     """
     Build a Loki query string to filter logs by level and search word.
 
     Args:
         job_name (str): The job name to query for logs. Defaults to "cpu_monitor".
-        level (str): The log level to filter by. Defaults to None.
+        level (str | list[str]): The log level, or any of several levels, to filter by. Defaults to None.
         search_word (str): The search word to filter by. Defaults to None.
+        service (str): The service to filter by; "" selects lines without a service label. Defaults to None.
 
     Returns:
         str: The Loki query string.
     """
-    # TODO: unit tests
-    level_filter = f' | level="{level.upper()}"' if level else ""
+    if isinstance(level, list):
+        level_filter = f' | level=~"{"|".join(lvl.upper() for lvl in level)}"' if level else ""
+    else:
+        level_filter = f' | level="{level.upper()}"' if level else ""
+    service_filter = f' | service="{service}"' if service is not None else ""
     search_filter = f' |~ "(?i){search_word}"' if search_word else ""
-    logQL = f'{{job="{job_name}"}} | json {level_filter}{search_filter}'
+    logQL = f'{{job="{job_name}"}} | json {level_filter}{service_filter}{search_filter}'
     return logQL
 
 
+def build_loki_metric_query(
+    job_name: str,
+    function: str = "count_over_time",
+    range_seconds: int = 3600,
+    by: list[str] | None = None,
+    level: str | list[str] | None = None,
+    search_word: str | None = None,
+    service: str | None = None,
+) -> str:
+    """
+    Build a LogQL metric query that aggregates log lines on the Loki server.
+
+    Args:
+        job_name (str): The job name to query for logs.
+        function (str): The range aggregation, "count_over_time" or "rate".
+        range_seconds (int): The range vector length in seconds.
+        by (list[str] | None): Labels to group by, e.g. ["service", "level"]. None sums everything.
+        level (str | list[str]): The log level, or levels, to filter by.
+        search_word (str): The search word to filter by.
+        service (str): The service to filter by.
+
+    Returns:
+        str: The LogQL metric query, e.g. `sum by (service, level) (count_over_time({...} [3600s]))`.
+    """
+    if function not in LOKI_METRIC_FUNCTIONS:
+        raise ValueError(f"Unsupported LogQL metric function: {function}. Expected one of {LOKI_METRIC_FUNCTIONS}.")
+
+    selector = build_loki_query(job_name=job_name, level=level, search_word=search_word, service=service)
+    metric = f"{function}({selector} [{int(range_seconds)}s])"
+    grouping = f" by ({', '.join(by)})" if by else ""
+    return f"sum{grouping} ({metric})"
+
+
 def fetch_loki_logs(
     loki_base_url: str,
     job_name: str,
@@ -92,8 +289,26 @@ def fetch_loki_logs(
 
     logger.info(f"Fetching Loki logs: {params}, from {url}")
 
+    return _query_range(url, params)
+
+
+def _query_range(url: str, params: dict) -> list[dict] | None:
+    """
+    Run a single Loki query request and return the decoded `data.result` list.
+
+    Args:
+        url (str): The full query or query_range URL.
+        params (dict): The query parameters.
+
+    Returns:
+        list[dict] | None: The list of result streams, or None on failure.
+    """
+    cached = loki_cache.get(url, params)
+    if cached is not None:
+        return cached
+
     try:
-        response = requests.get(url, params=params)
+        response = _session.get(url, params=params, timeout=LOKI_TIMEOUT_SECONDS)
         response.raise_for_status()
     except requests.exceptions.RequestException as e:
         logger.error(f"Error fetching logs from Loki: {e}")
@@ -101,10 +316,588 @@ def fetch_loki_logs(
 
     try:
         data = response.json()
-        return data.get("data", {}).get("result", [])
+        result = data.get("data", {}).get("result", [])
+        loki_cache.set(url, params, result)
+        return result
+
+    except ValueError as e:
+        logger.error(f"Error in JSON from Loki: {e}")
+    except Exception as e:
+        logger.error(f"Error: {e}")
+    return None
+
+
+def create_async_loki_session(
+    timeout: float = LOKI_TIMEOUT_SECONDS, max_connections: int = LOKI_MAX_CONNECTIONS
+) -> httpx.AsyncClient:
+    """
+    Create a pooled asyncio HTTP client for Loki.
+
+    Connections are kept alive between requests and responses are requested gzip-encoded.
+
+    Args:
+        timeout (float): Connect/read/write/pool timeout in seconds.
+        max_connections (int): Maximum number of concurrent connections to Loki.
+
+    Returns:
+        httpx.AsyncClient: The client. Close it with `await client.aclose()`.
+    """
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(timeout),
+        limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        headers={"Accept-Encoding": "gzip"},
+    )
+
+
+async def _aquery_range(session: httpx.AsyncClient, url: str, params: dict) -> list[dict] | None:
+    """
+    Async version of `_query_range` using a pooled `httpx.AsyncClient`.
+    """
+    cached = loki_cache.get(url, params)
+    if cached is not None:
+        return cached
+
+    try:
+        response = await session.get(url, params=params)
+        response.raise_for_status()
+    except httpx.HTTPError as e:
+        logger.error(f"Error fetching logs from Loki: {e}")
+        return None
+
+    try:
+        data = response.json()
+        result = data.get("data", {}).get("result", [])
+        loki_cache.set(url, params, result)
+        return result
 
     except ValueError as e:
         logger.error(f"Error in JSON from Loki: {e}")
     except Exception as e:
         logger.error(f"Error: {e}")
     return None
+
+
+def decode_loki_streams(body: IO[bytes]) -> Iterator[LokiEntry]:
+    """
+    Incrementally decode the `data.result[]` streams of a Loki query_range response into entries.
+
+    The body is read in chunks and only one result stream is decoded at a time, so the full response and
+    its nested dict/list tree are never held in memory. Entries of a stream share one labels dict.
+
+    Args:
+        body (IO[bytes]): A file-like object over the (decompressed) response body.
+
+    Yields:
+        LokiEntry: The entries of each stream, in response order.
+    """
+    for stream in ijson.items(body, "data.result.item"):
+        labels = stream.get("stream", {})
+        for timestamp, line in stream.get("values", []):
+            yield LokiEntry(int(timestamp), line, labels)
+
+
+class _AsyncResponseReader:
+    """Adapts an httpx streaming response to the async `read` interface ijson expects."""
+
+    def __init__(self, response: httpx.Response):
+        self._chunks = response.aiter_bytes()
+
+    async def read(self, size: int = -1) -> bytes:
+        # ijson probes the stream type with read(0); that call must not consume a chunk.
+        if size == 0:
+            return b""
+        # An empty chunk would read as end of body, so skip any the transport produces.
+        async for chunk in self._chunks:
+            if chunk:
+                return chunk
+        return b""
+
+
+async def adecode_loki_streams(response: httpx.Response) -> AsyncIterator[LokiEntry]:
+    """
+    Async version of `decode_loki_streams` over an httpx streaming response.
+    """
+    async for stream in ijson.items(_AsyncResponseReader(response), "data.result.item"):
+        labels = stream.get("stream", {})
+        for timestamp, line in stream.get("values", []):
+            yield LokiEntry(int(timestamp), line, labels)
+
+
+def _query_entries(url: str, params: dict) -> list[LokiEntry]:
+    """
+    Run a single Loki `query_range` request, decoding the streamed body straight into entries.
+
+    Args:
+        url (str): The full query_range URL.
+        params (dict): The query parameters.
+
+    Returns:
+        list[LokiEntry]: The entries of the page.
+
+    Raises:
+        LokiQueryError: If the request failed or its body could not be decoded.
+    """
+    cached = loki_cache.get(url, params)
+    if cached is not None:
+        return cached
+
+    try:
+        with _session.get(url, params=params, timeout=LOKI_TIMEOUT_SECONDS, stream=True) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            entries = list(decode_loki_streams(response.raw))
+    except requests.exceptions.RequestException as e:
+        raise LokiQueryError(f"Error fetching logs from Loki: {e}") from e
+    except ijson.JSONError as e:
+        raise LokiQueryError(f"Error in JSON from Loki: {e}") from e
+    loki_cache.set(url, params, entries)
+    return entries
+
+
+async def _aquery_entries(session: httpx.AsyncClient, url: str, params: dict) -> list[LokiEntry]:
+    """
+    Async version of `_query_entries` using a pooled `httpx.AsyncClient`.
+    """
+    cached = loki_cache.get(url, params)
+    if cached is not None:
+        return cached
+
+    try:
+        async with session.stream("GET", url, params=params) as response:
+            response.raise_for_status()
+            entries = [entry async for entry in adecode_loki_streams(response)]
+    except httpx.HTTPError as e:
+        raise LokiQueryError(f"Error fetching logs from Loki: {e}") from e
+    except ijson.JSONError as e:
+        raise LokiQueryError(f"Error in JSON from Loki: {e}") from e
+    loki_cache.set(url, params, entries)
+    return entries
+
+
+def _parse_metric_result(result: list[dict]) -> list[tuple[dict, float]]:
+    """Turn an instant vector result into (labels, value) pairs."""
+    return [(sample.get("metric", {}), float(sample.get("value", [0, 0])[1])) for sample in result]
+
+
+def fetch_loki_metric(loki_base_url: str, query: str, time_ns: int) -> list[tuple[dict, float]] | None:
+    """
+    Evaluate a LogQL metric query at one instant.
+
+    Args:
+        loki_base_url (str): The URL of the Loki server.
+        query (str): The metric query, see `build_loki_metric_query`.
+        time_ns (int): The evaluation time as a nanosecond timestamp.
+
+    Returns:
+        list[tuple[dict, float]] | None: One (labels, value) pair per series, or None on failure.
+    """
+    url = urljoin(loki_base_url, LOKI_QUERY_ENDPOINT)
+    logger.info(f"Fetching Loki metric: {query}, from {url}")
+    result = _query_range(url, {"query": query, "time": time_ns})
+    return None if result is None else _parse_metric_result(result)
+
+
+async def afetch_loki_metric(
+    session: httpx.AsyncClient, loki_base_url: str, query: str, time_ns: int
+) -> list[tuple[dict, float]] | None:
+    """
+    Async version of `fetch_loki_metric` using a pooled `httpx.AsyncClient`.
+    """
+    url = urljoin(loki_base_url, LOKI_QUERY_ENDPOINT)
+    logger.info(f"Fetching Loki metric: {query}, from {url}")
+    result = await _aquery_range(session, url, {"query": query, "time": time_ns})
+    return None if result is None else _parse_metric_result(result)
+
+
+def flatten_streams(streams: list[dict]) -> list[LokiEntry]:
+    """Flatten Loki result streams into individual entries."""
+    return [
+        LokiEntry(int(timestamp), line, stream.get("stream", {}))
+        for stream in streams
+        for timestamp, line in stream.get("values", [])
+    ]
+
+
+def entry_key(entry: LokiEntry) -> tuple:
+    """Identity of an entry, used to drop duplicates at page boundaries and in buffers."""
+    return entry.timestamp, entry.line, tuple(sorted(entry.stream.items()))
+
+
+class _LokiPager:
+    """
+    Cursor state for walking a `query_range` window page by page.
+
+    Each page is at most `page_size` lines. The nanosecond cursor is moved to the last timestamp of the page,
+    and lines already returned at that boundary timestamp are dropped from the next page, so nothing in the
+    window is lost or repeated.
+    """
+
+    def __init__(self, logQL: str, start_ns: int, end_ns: int, page_size: int, direction: str, max_entries: int | None):
+        self.logQL = logQL
+        self.start_ns = start_ns
+        self.end_ns = end_ns
+        self.page_size = page_size
+        self.direction = direction
+        self.max_entries = max_entries
+        self.backward = direction == "backward"
+        self.boundary_ts: int | None = None
+        self.boundary_seen: set[tuple] = set()
+        self.yielded = 0
+        self.pages = 0
+        self.done = start_ns >= end_ns
+
+    def params(self) -> dict:
+        return {
+            "query": self.logQL,
+            "start": self.start_ns,
+            "end": self.end_ns,
+            "limit": self.page_size,
+            "direction": self.direction,
+        }
+
+    def consume(self, entries: list[LokiEntry]) -> list[LokiEntry]:
+        """Take the entries of one page, advance the cursor and return only the new entries."""
+        self.pages += 1
+        # Sort a copy: the page list may be shared with the result cache.
+        entries = sorted(entries, key=lambda e: e.timestamp, reverse=self.backward)
+        new_entries = [
+            e for e in entries if not (e.timestamp == self.boundary_ts and entry_key(e) in self.boundary_seen)
+        ]
+        if self.max_entries is not None and self.yielded + len(new_entries) >= self.max_entries:
+            new_entries = new_entries[: self.max_entries - self.yielded]
+            self.done = True
+        self.yielded += len(new_entries)
+
+        if len(entries) < self.page_size:
+            self.done = True
+        elif not new_entries:
+            logger.warning(f"Loki page at {self.boundary_ts} held only duplicates, stopping pagination.")
+            self.done = True
+        if self.done:
+            return new_entries
+
+        last_ts = entries[-1].timestamp
+        if last_ts != self.boundary_ts:
+            self.boundary_ts = last_ts
+            self.boundary_seen = set()
+        self.boundary_seen.update(entry_key(e) for e in entries if e.timestamp == last_ts)
+
+        # Loki treats `end` as exclusive, so step one nanosecond past the boundary when paging backward.
+        if self.backward:
+            self.end_ns = last_ts + 1
+        else:
+            self.start_ns = last_ts
+        self.done = self.start_ns >= self.end_ns
+        return new_entries
+
+
+def _to_nanoseconds(value: str | int) -> int | None:
+    """Convert a "%Y-%m-%d %H:%M:%S" string to a nanosecond timestamp; integers are taken as nanoseconds."""
+    if isinstance(value, int):
+        return value
+    timestamp = datetime_to_timestamp(value)
+    return None if timestamp is None else timestamp * NANOSECONDS
+
+
+def _build_pager(
+    job_name: str,
+    start_time: str | int,
+    end_time: str | int,
+    page_size: int,
+    level: str | None,
+    search_word: str | None,
+    service: str | None,
+    direction: str,
+    max_entries: int | None,
+) -> _LokiPager | None:
+    start_ns = _to_nanoseconds(start_time)
+    end_ns = _to_nanoseconds(end_time)
+
+    if start_ns is None or end_ns is None:
+        logger.error("Invalid time format, cannot fetch logs.")
+        return None
+
+    logQL = build_loki_query(level=level, search_word=search_word, job_name=job_name, service=service)
+    return _LokiPager(logQL, start_ns, end_ns, page_size, direction, max_entries)
+
+
+def iter_loki_logs(
+    loki_base_url: str,
+    job_name: str,
+    start_time: str | int,
+    end_time: str | int,
+    page_size: int = LOKI_PAGE_SIZE,
+    level: str | None = None,
+    search_word: str | None = None,
+    service: str | None = None,
+    direction: str = "backward",
+    max_entries: int | None = None,
+) -> Iterator[LokiEntry]:
+    """
+    Lazily fetch every log line in a time range, page by page.
+
+    Args:
+        loki_base_url (str): The URL of the Loki server.
+        job_name (str): The job name to query for logs.
+        start_time (str | int): The start time in "%Y-%m-%d %H:%M:%S" format, or a nanosecond timestamp.
+        end_time (str | int): The end time in "%Y-%m-%d %H:%M:%S" format, or a nanosecond timestamp.
+        page_size (int): The number of lines requested per page. Max 5000.
+        level (str): The log level to filter by.
+        search_word (str): The search word to filter by.
+        service (str): The service to filter by.
+        direction (str): "backward" yields newest first, "forward" yields oldest first.
+        max_entries (int | None): Stop after yielding this many entries. None reads the whole range.
+
+    Yields:
+        LokiEntry: Log entries ordered by timestamp in the requested direction.
+
+    Raises:
+        LokiQueryError: If a page could not be fetched. The entries of the pages before it have been yielded.
+    """
+    pager = _build_pager(job_name, start_time, end_time, page_size, level, search_word, service, direction, max_entries)
+    if pager is None:
+        return
+    url = urljoin(loki_base_url, LOKI_QUERY_RANGE_ENDPOINT)
+
+    while not pager.done:
+        entries = _query_entries(url, pager.params())
+        yield from pager.consume(entries)
+
+    logger.info(f"Fetched {pager.yielded} Loki log lines in {pager.pages} pages for job '{job_name}'.")
+
+
+async def aiter_loki_logs(
+    session: httpx.AsyncClient,
+    loki_base_url: str,
+    job_name: str,
+    start_time: str | int,
+    end_time: str | int,
+    page_size: int = LOKI_PAGE_SIZE,
+    level: str | None = None,
+    search_word: str | None = None,
+    service: str | None = None,
+    direction: str = "backward",
+    max_entries: int | None = None,
+) -> AsyncGenerator[LokiEntry, None]:
+    """
+    Async version of `iter_loki_logs` that pages over a pooled `httpx.AsyncClient`.
+    """
+    pager = _build_pager(job_name, start_time, end_time, page_size, level, search_word, service, direction, max_entries)
+    if pager is None:
+        return
+    url = urljoin(loki_base_url, LOKI_QUERY_RANGE_ENDPOINT)
+
+    while not pager.done:
+        entries = await _aquery_entries(session, url, pager.params())
+        for entry in pager.consume(entries):
+            yield entry
+
+    logger.info(f"Fetched {pager.yielded} Loki log lines in {pager.pages} pages for job '{job_name}'.")
+
+
+class ShardPlanner:
+    """
+    Splits a time range into shards for parallel queries and tunes the shard size from observed latency.
+
+    After each shard the size moves halfway towards the span that would have taken `target_latency_seconds`,
+    clamped to [min_shard_seconds, max_shard_seconds]. Shards are cut as they are needed, so the sizes
+    learnt from the first shards of a range apply to its later shards. Keep one planner per client so later
+    calls start from the learnt size too.
+    """
+
+    def __init__(
+        self,
+        shard_seconds: float = LOKI_SHARD_SECONDS,
+        parallelism: int = LOKI_SHARD_PARALLELISM,
+        target_latency_seconds: float = LOKI_SHARD_TARGET_LATENCY_SECONDS,
+        min_shard_seconds: float = LOKI_SHARD_MIN_SECONDS,
+        max_shard_seconds: float = LOKI_SHARD_MAX_SECONDS,
+    ):
+        self.shard_seconds = shard_seconds
+        self.parallelism = parallelism
+        self.target_latency_seconds = target_latency_seconds
+        self.min_shard_seconds = min_shard_seconds
+        self.max_shard_seconds = max_shard_seconds
+
+    def plan(self, start_ns: int, end_ns: int, reverse: bool = False) -> Iterator[tuple[int, int]]:
+        """
+        Split [start_ns, end_ns) into consecutive (start, end) shards, in ascending order or descending if
+        `reverse`. Each shard is cut with the shard size current when it is requested.
+        """
+        cursor = end_ns if reverse else start_ns
+        while start_ns < cursor if reverse else cursor < end_ns:
+            step = max(int(self.shard_seconds * NANOSECONDS), 1)
+            if reverse:
+                shard = (max(cursor - step, start_ns), cursor)
+                cursor = shard[0]
+            else:
+                shard = (cursor, min(cursor + step, end_ns))
+                cursor = shard[1]
+            yield shard
+
+    def record(self, span_ns: int, latency_seconds: float) -> None:
+        """Update the shard size from the latency of one completed shard."""
+        if latency_seconds <= 0 or span_ns <= 0:
+            return
+        ideal = span_ns / NANOSECONDS * self.target_latency_seconds / latency_seconds
+        shard_seconds = (self.shard_seconds + ideal) / 2
+        self.shard_seconds = min(max(shard_seconds, self.min_shard_seconds), self.max_shard_seconds)
+
+
+async def amerge_entries(
+    sources: Iterable[tuple[int, AsyncIterator[LokiEntry]]], reverse: bool = False
+) -> AsyncIterator[LokiEntry]:
+    """
+    K-way heap merge of async entry iterators that are each ordered by timestamp.
+
+    Every source comes with a bound on its first timestamp (the lowest possible for ascending order, the
+    highest for descending). A source is only awaited once its bound reaches the top of the heap, so at most
+    one entry per source is held and sources further along in time are not waited on early. Sources must come
+    in order of their bounds, and each is only taken from `sources` when the one before it is first awaited,
+    so `sources` may create them lazily.
+
+    Args:
+        sources (Iterable[tuple[int, AsyncIterator[LokiEntry]]]): (bound, iterator) pairs in order of bound.
+        reverse (bool): Merge in descending timestamp order.
+
+    Yields:
+        LokiEntry: The entries of all sources in timestamp order.
+    """
+    sign = -1 if reverse else 1
+    pending = iter(sources)
+    iterators: list[AsyncIterator[LokiEntry]] = []
+    heap: list[tuple[int, int, LokiEntry | None]] = []
+
+    def take() -> None:
+        source = next(pending, None)
+        if source is not None:
+            bound, iterator = source
+            heapq.heappush(heap, (sign * bound, len(iterators), None))
+            iterators.append(iterator)
+
+    take()
+    while heap:
+        _, idx, entry = heapq.heappop(heap)
+        if entry is not None:
+            yield entry
+        else:
+            # The heap has reached this source's bound, which the next source's bound is not before.
+            take()
+        try:
+            next_entry = await anext(iterators[idx])
+        except StopAsyncIteration:
+            continue
+        heapq.heappush(heap, (sign * next_entry.timestamp, idx, next_entry))
+
+
+async def aiter_loki_logs_sharded(
+    session: httpx.AsyncClient,
+    loki_base_url: str,
+    job_name: str,
+    start_time: str | int,
+    end_time: str | int,
+    planner: ShardPlanner | None = None,
+    page_size: int = LOKI_PAGE_SIZE,
+    level: str | None = None,
+    search_word: str | None = None,
+    service: str | None = None,
+    direction: str = "forward",
+) -> AsyncIterator[LokiEntry]:
+    """
+    Fetch a wide time range as parallel time shards and yield the lines back in timestamp order.
+
+    At most `planner.parallelism` shards query Loki at once, and shards are started at most that many ahead of
+    the one being yielded, so each is cut with the size the planner learnt from the shards finished so far.
+    Each shard feeds a small bounded queue, and the queues are combined by `amerge_entries`, so the range is
+    never materialised in memory.
+
+    Args:
+        session (httpx.AsyncClient): The pooled client, see `create_async_loki_session`.
+        loki_base_url (str): The URL of the Loki server.
+        job_name (str): The job name to query for logs.
+        start_time (str | int): The start time in "%Y-%m-%d %H:%M:%S" format, or a nanosecond timestamp.
+        end_time (str | int): The end time in "%Y-%m-%d %H:%M:%S" format, or a nanosecond timestamp.
+        planner (ShardPlanner | None): Shard size and parallelism. A default planner is used if None.
+        page_size (int): The number of lines requested per page. Max 5000.
+        level (str): The log level to filter by.
+        search_word (str): The search word to filter by.
+        service (str): The service to filter by.
+        direction (str): "forward" yields oldest first, "backward" yields newest first.
+
+    Yields:
+        LokiEntry: Log entries ordered by timestamp in the requested direction.
+
+    Raises:
+        LokiShardError: If a shard failed. It is raised once the lines before the failure have been yielded, in
+            timestamp order, and the other shards are cancelled.
+    """
+    start_ns = _to_nanoseconds(start_time)
+    end_ns = _to_nanoseconds(end_time)
+    if start_ns is None or end_ns is None:
+        logger.error("Invalid time format, cannot fetch logs.")
+        return
+
+    planner = planner or ShardPlanner()
+    reverse = direction == "backward"
+    shards = planner.plan(start_ns, end_ns, reverse=reverse)
+    semaphore = asyncio.Semaphore(planner.parallelism)
+    loop = asyncio.get_running_loop()
+    tasks: list[asyncio.Task] = []
+
+    async def produce(shard_start: int, shard_end: int, queue: asyncio.Queue):
+        # The shard ends with None, or with the error that stopped it so the merge raises it in order.
+        end: LokiShardError | None = None
+        try:
+            async with semaphore:
+                started = loop.time()
+                blocked = 0.0
+                async for entry in aiter_loki_logs(
+                    session,
+                    loki_base_url=loki_base_url,
+                    job_name=job_name,
+                    start_time=shard_start,
+                    end_time=shard_end,
+                    page_size=page_size,
+                    level=level,
+                    search_word=search_word,
+                    service=service,
+                    direction=direction,
+                ):
+                    put_started = loop.time()
+                    await queue.put(entry)
+                    blocked += loop.time() - put_started
+                planner.record(shard_end - shard_start, loop.time() - started - blocked)
+        except Exception as e:
+            end = LokiShardError(shard_start, shard_end, e)
+            end.__cause__ = e
+        finally:
+            await queue.put(end)
+
+    async def drain(queue: asyncio.Queue) -> AsyncIterator[LokiEntry]:
+        while isinstance(entry := await queue.get(), LokiEntry):
+            yield entry
+        if entry is not None:
+            raise entry
+
+    def start(shard: tuple[int, int]) -> tuple[int, AsyncIterator[LokiEntry]]:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=page_size)
+        tasks.append(asyncio.create_task(produce(*shard, queue)))
+        return (shard[1] if reverse else shard[0]), drain(queue)
+
+    def sources() -> Iterator[tuple[int, AsyncIterator[LokiEntry]]]:
+        # Keep `parallelism` shards started ahead of the merge; the next one is cut when the merge takes one.
+        started = deque(start(shard) for shard in itertools.islice(shards, planner.parallelism))
+        while started:
+            yield started.popleft()
+            shard = next(shards, None)
+            if shard is not None:
+                started.append(start(shard))
+
+    try:
+        async for entry in amerge_entries(sources(), reverse=reverse):
+            yield entry
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    logger.info(f"Fetched {len(tasks)} Loki shards for job '{job_name}', next shard size {planner.shard_seconds:.0f}s.")
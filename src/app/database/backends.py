@@ -0,0 +1,23 @@
+"""backends.py
+
+Vector storage backends of `QdrantDatabaseClient`: a Qdrant server, or the in-process `LocalVectorStore`."""
+
+from qdrant_client import QdrantClient
+
+from app.database.local_store import LocalVectorStore
+from app.settings import LOCAL_INDEX_DIR, QDRANT_HOST, VECTOR_BACKEND
+
+# Both expose the same Qdrant client methods, so callers use either one as `qdrant_client`.
+VectorBackend = QdrantClient | LocalVectorStore
+
+
+def create_backend(backend: str = VECTOR_BACKEND, host: str = QDRANT_HOST) -> VectorBackend:
+    """
+    Args:
+        backend (str): "qdrant" for the server at `host`, or "local" for a store under `LOCAL_INDEX_DIR`.
+    """
+    if backend == "qdrant":
+        return QdrantClient(host)
+    if backend == "local":
+        return LocalVectorStore(LOCAL_INDEX_DIR)
+    raise ValueError(f"Unknown vector backend: {backend}. Expected 'qdrant' or 'local'.")
@@ -0,0 +1,115 @@
+"""bulk_upload.py
+
+Chunked, concurrent upload of points to Qdrant."""
+
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable
+
+import numpy as np
+from qdrant_client.models import Batch
+
+from app.database.backends import VectorBackend
+from app.settings import (
+    QDRANT_UPLOAD_CHUNK_SIZE,
+    QDRANT_UPLOAD_MAX_RETRIES,
+    QDRANT_UPLOAD_PARALLELISM,
+    QDRANT_UPLOAD_WAIT,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class BulkUploader:
+    """
+    Upload points to a collection in chunks, with a bounded number of requests in flight.
+
+    Each chunk is sent as one columnar `Batch` built from a slice of the vector matrix. `submit` blocks while
+    `parallelism` chunks are in flight, so memory stays bounded however many points are submitted. Failed
+    chunks are retried with exponential backoff. With `wait=False` Qdrant acknowledges a chunk before it is
+    indexed.
+
+    Use as a context manager, or call `close`, which waits for every chunk and raises if any failed.
+
+    Args:
+        on_uploaded (Callable[[list], None] | None): Called with the ids of each chunk once it is accepted.
+    """
+
+    def __init__(
+        self,
+        qdrant_client: VectorBackend,
+        collection_name: str,
+        chunk_size: int = QDRANT_UPLOAD_CHUNK_SIZE,
+        parallelism: int = QDRANT_UPLOAD_PARALLELISM,
+        wait: bool = QDRANT_UPLOAD_WAIT,
+        max_retries: int = QDRANT_UPLOAD_MAX_RETRIES,
+        backoff_seconds: float = 0.5,
+        on_uploaded: Callable[[list], None] | None = None,
+    ):
+        self.qdrant_client = qdrant_client
+        self.collection_name = collection_name
+        self.chunk_size = chunk_size
+        self.wait = wait
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.on_uploaded = on_uploaded
+        self.uploaded = 0
+        self.errors: list[Exception] = []
+        self._executor = ThreadPoolExecutor(max_workers=parallelism, thread_name_prefix="qdrant-upload")
+        self._slots = threading.BoundedSemaphore(parallelism)
+        self._futures: list[Future] = []
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> "BulkUploader":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(raise_errors=exc is None)
+
+    def submit(self, ids: list, vectors: np.ndarray, payloads: list) -> None:
+        """Queue points for upload, `vectors` being a (len(ids), dim) array."""
+        for start in range(0, len(ids), self.chunk_size):
+            end = start + self.chunk_size
+            self._slots.acquire()
+            try:
+                future = self._executor.submit(self._upload, ids[start:end], vectors[start:end], payloads[start:end])
+            except BaseException:
+                self._slots.release()
+                raise
+            future.add_done_callback(lambda _: self._slots.release())
+            self._futures.append(future)
+
+    def _upload(self, ids: list, vectors: np.ndarray, payloads: list) -> None:
+        # One C-level conversion of the whole matrix instead of a list per point.
+        rows: list[list[float]] = np.asarray(vectors, dtype=np.float32).tolist()  # type: ignore[assignment]
+        batch = Batch(ids=ids, vectors=rows, payloads=payloads)
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.qdrant_client.upsert(collection_name=self.collection_name, points=batch, wait=self.wait)
+                break
+            except Exception as e:
+                if attempt == self.max_retries:
+                    logger.error(f"Failed to upload {len(ids)} points to '{self.collection_name}': {e}")
+                    with self._lock:
+                        self.errors.append(e)
+                    return
+                delay = self.backoff_seconds * 2**attempt
+                logger.warning(f"Upload of {len(ids)} points failed ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+        with self._lock:
+            self.uploaded += len(ids)
+        if self.on_uploaded is not None:
+            self.on_uploaded(ids)
+
+    def close(self, raise_errors: bool = True) -> int:
+        """Wait for all chunks. Returns the number of points uploaded."""
+        for future in self._futures:
+            future.result()
+        self._futures.clear()
+        self._executor.shutdown()
+        if raise_errors and self.errors:
+            raise self.errors[0]
+        return self.uploaded
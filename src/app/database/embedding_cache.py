@@ -0,0 +1,198 @@
+"""embedding_cache.py
+
+Content-addressed cache of text embeddings, so repeated log messages are embedded once."""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+
+import numpy as np
+
+from app.cache import LRUCache, register_cache
+from app.settings import (
+    EMBEDDING_CACHE_DIR,
+    EMBEDDING_CACHE_DISK_MAX_ROWS,
+    EMBEDDING_CACHE_ENABLED,
+    EMBEDDING_CACHE_MAX_ITEMS,
+    SPACY_MODEL,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def normalise_text(text: str) -> str:
+    """Collapse runs of whitespace, which do not change the embedding of a message."""
+    return " ".join(text.split())
+
+
+def text_key(text: str) -> str:
+    """Content hash of the normalised text."""
+    return hashlib.blake2b(normalise_text(text).encode("utf-8"), digest_size=16).hexdigest()
+
+
+class EmbeddingDiskStore:
+    """
+    Append-only on-disk embedding store.
+
+    `vectors.f32` is a (rows, dim) float32 matrix read through a memory map. Line i of `keys.txt` is the key
+    of row i. `meta.json` records the model and dimension; a store written by another model is discarded.
+    Once `max_rows` is reached new vectors are no longer persisted.
+    """
+
+    def __init__(self, directory: str, model_name: str, max_rows: int = EMBEDDING_CACHE_DISK_MAX_ROWS):
+        self.directory = directory
+        self.model_name = model_name
+        self.max_rows = max_rows
+        self.available = True
+        self.dim: int | None = None
+        self.rows: dict[str, int] = {}
+        self._matrix: np.memmap | None = None
+        self._lock = threading.Lock()
+        self._vectors_path = os.path.join(directory, "vectors.f32")
+        self._keys_path = os.path.join(directory, "keys.txt")
+        self._meta_path = os.path.join(directory, "meta.json")
+        try:
+            self._load()
+        except (OSError, ValueError) as e:
+            logger.warning(f"Disabling embedding disk cache in {directory}: {e}")
+            self.available = False
+
+    def _load(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        if not os.path.exists(self._meta_path):
+            return
+        with open(self._meta_path, "r") as f:
+            meta = json.load(f)
+        if meta.get("model") != self.model_name:
+            logger.info(f"Embedding disk cache was written by '{meta.get('model')}', discarding it.")
+            self._discard()
+            return
+
+        self.dim = int(meta["dim"])
+        keys: list[str] = []
+        if os.path.exists(self._keys_path):
+            with open(self._keys_path, "r") as f:
+                keys = f.read().split()
+        vector_rows = os.path.getsize(self._vectors_path) // (4 * self.dim) if os.path.exists(self._vectors_path) else 0
+        # An interrupted append can leave one file ahead of the other; keep the rows present in both.
+        count = min(len(keys), vector_rows)
+        with open(self._keys_path, "w") as f:
+            f.writelines(f"{key}\n" for key in keys[:count])
+        with open(self._vectors_path, "ab") as f:
+            f.truncate(count * 4 * self.dim)
+        self.rows = {key: row for row, key in enumerate(keys[:count])}
+        logger.info(f"Loaded {count} cached embeddings from {self.directory}.")
+
+    def _discard(self) -> None:
+        """Delete the store's own files, leaving anything else in its directory alone; `meta.json` goes last."""
+        for path in (self._vectors_path, self._keys_path, self._meta_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _map(self) -> np.memmap | None:
+        if self.dim is None or not self.rows:
+            return None
+        if self._matrix is None or len(self._matrix) < len(self.rows):
+            self._matrix = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(len(self.rows), self.dim))
+        return self._matrix
+
+    def get(self, key: str) -> np.ndarray | None:
+        if not self.available:
+            return None
+        with self._lock:
+            row = self.rows.get(key)
+            if row is None:
+                return None
+            matrix = self._map()
+            return None if matrix is None else np.array(matrix[row])
+
+    def add(self, keys: list[str], vectors: np.ndarray) -> None:
+        """Persist vectors for keys not stored yet."""
+        if not self.available or not len(keys):
+            return
+        with self._lock:
+            new = [(key, i) for i, key in enumerate(keys) if key not in self.rows]
+            new = new[: max(self.max_rows - len(self.rows), 0)]
+            if not new:
+                return
+            try:
+                if self.dim is None:
+                    self.dim = int(vectors.shape[1])
+                    with open(self._meta_path, "w") as f:
+                        json.dump({"model": self.model_name, "dim": self.dim}, f)
+                rows = np.ascontiguousarray(vectors[[i for _, i in new]], dtype=np.float32)
+                with open(self._vectors_path, "ab") as f:
+                    f.write(rows.tobytes())
+                with open(self._keys_path, "a") as f:
+                    f.writelines(f"{key}\n" for key, _ in new)
+            except OSError as e:
+                logger.warning(f"Disabling embedding disk cache in {self.directory}: {e}")
+                self.available = False
+                return
+            for key, _ in new:
+                self.rows[key] = len(self.rows)
+
+
+class EmbeddingCache:
+    """
+    Embeddings keyed by a hash of the normalised text, in an in-memory LRU backed by an optional disk store.
+    """
+
+    def __init__(
+        self,
+        model_name: str = SPACY_MODEL,
+        max_items: int = EMBEDDING_CACHE_MAX_ITEMS,
+        directory: str | None = EMBEDDING_CACHE_DIR,
+    ):
+        self.memory = LRUCache(max_items)
+        self.disk = EmbeddingDiskStore(directory, model_name) if directory else None
+        self.disk_hits = 0
+        self.duplicates = 0
+
+    def get(self, key: str) -> np.ndarray | None:
+        vector = self.memory.get(key)
+        if vector is not None or self.disk is None:
+            return vector
+        vector = self.disk.get(key)
+        if vector is not None:
+            self.disk_hits += 1
+            self.memory.set(key, vector)
+        return vector
+
+    def add(self, keys: list[str], vectors: np.ndarray) -> None:
+        for key, vector in zip(keys, vectors):
+            self.memory.set(key, vector)
+        if self.disk is not None:
+            self.disk.add(keys, vectors)
+
+    def stats(self) -> dict:
+        stats = self.memory.stats()
+        stats["hits"] += self.disk_hits
+        stats["misses"] -= self.disk_hits
+        total = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / total, 4) if total else 0.0
+        stats["disk_hits"] = self.disk_hits
+        stats["disk_rows"] = len(self.disk.rows) if self.disk is not None else 0
+        # Repeats inside one call are embedded once without a lookup; count them as saved embeddings too.
+        stats["duplicates"] = self.duplicates
+        texts = total + self.duplicates
+        stats["embeddings_saved_rate"] = round((stats["hits"] + self.duplicates) / texts, 4) if texts else 0.0
+        return stats
+
+
+_embedding_cache: EmbeddingCache | None = None
+_embedding_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache | None:
+    """Return the process-wide embedding cache, or None if it is disabled."""
+    global _embedding_cache
+    if not EMBEDDING_CACHE_ENABLED:
+        return None
+    with _embedding_cache_lock:
+        if _embedding_cache is None:
+            _embedding_cache = EmbeddingCache()
+            register_cache("embeddings", _embedding_cache)
+        return _embedding_cache
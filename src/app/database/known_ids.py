@@ -0,0 +1,116 @@
+"""known_ids.py
+
+Local set of point ids already stored in a Qdrant collection."""
+
+import json
+import logging
+import os
+import threading
+from typing import Iterable
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class KnownIds:
+    """
+    A persistable set of unsigned 64-bit point ids, at about 8 bytes per id.
+
+    Ids live in a sorted numpy array, looked up with one vectorised `searchsorted` per batch. New ids go to
+    a small set first and are merged into the array once it grows past `merge_threshold`.
+
+    The set is a cache of what the collection holds: an id found here is stored, an id missing from it may
+    still be stored by another writer and has to be confirmed against Qdrant. The file is saved with a
+    fingerprint of the collections it was taken from, and only loaded while they still match it.
+    """
+
+    def __init__(self, path: str | None = None, merge_threshold: int = 50_000):
+        self.path = path
+        self.merge_threshold = merge_threshold
+        self._sorted: np.ndarray = np.empty(0, dtype=np.uint64)
+        self._recent: set[int] = set()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._merge()
+            return len(self._sorted)
+
+    def _merge(self) -> None:
+        if self._recent:
+            recent = np.fromiter(self._recent, dtype=np.uint64, count=len(self._recent))
+            self._sorted = np.union1d(self._sorted, recent)
+            self._recent.clear()
+
+    def contains(self, ids: list[int]) -> np.ndarray:
+        """Boolean mask of the given ids that are known."""
+        if not ids:
+            return np.zeros(0, dtype=bool)
+        query = np.asarray(ids, dtype=np.uint64)
+        with self._lock:
+            positions = np.searchsorted(self._sorted, query)
+            found = np.zeros(len(query), dtype=bool)
+            in_range = positions < len(self._sorted)
+            found[in_range] = self._sorted[positions[in_range]] == query[in_range]
+            if self._recent:
+                found |= np.fromiter((i in self._recent for i in ids), dtype=bool, count=len(ids))
+        return found
+
+    def add(self, ids: Iterable[int]) -> None:
+        with self._lock:
+            self._recent.update(ids)
+            if len(self._recent) >= self.merge_threshold:
+                self._merge()
+
+    def discard(self, ids: Iterable[int]) -> None:
+        with self._lock:
+            self._merge()
+            self._sorted = np.setdiff1d(self._sorted, np.fromiter(ids, dtype=np.uint64), assume_unique=True)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._sorted = np.empty(0, dtype=np.uint64)
+            self._recent.clear()
+
+    def save(self, fingerprint: dict | None = None) -> None:
+        """Save the ids with the `fingerprint` of the collections they were taken from. None matches nothing."""
+        if self.path is None:
+            return
+        with self._lock:
+            self._merge()
+            ids = self._sorted
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.savez(f, ids=ids, fingerprint=np.array(json.dumps(fingerprint, sort_keys=True)))
+            os.replace(tmp_path, self.path)
+            logger.info(f"Saved {len(ids)} known point ids to {self.path}")
+        except OSError as e:
+            logger.error(f"Failed to save known point ids to {self.path}: {e}")
+
+    def load(self, fingerprint: dict | None = None) -> bool:
+        """
+        Load the ids saved by `save`. Returns False if there is no usable file, or if `fingerprint` is given
+        and differs from the one saved, as the collections have changed since.
+        """
+        if self.path is None:
+            return False
+        try:
+            with np.load(self.path) as data:
+                ids = data["ids"]
+                saved = json.loads(str(data["fingerprint"]))
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Could not read known point ids from {self.path}: {e}")
+            return False
+        if fingerprint is not None and saved != fingerprint:
+            logger.info(f"Known point ids in {self.path} are from other collections than the current ones: {saved}")
+            return False
+        with self._lock:
+            self._sorted = np.unique(ids.astype(np.uint64))
+            self._recent.clear()
+        logger.info(f"Loaded {len(self._sorted)} known point ids from {self.path}")
+        return True
@@ -0,0 +1,562 @@
+"""local_store.py
+
+In-process vector store implementing the part of the Qdrant client API that `QdrantDatabaseClient` uses."""
+
+import json
+import logging
+import os
+import shutil
+import threading
+from typing import Any, NamedTuple
+
+import numpy as np
+from qdrant_client.models import (
+    AliasDescription,
+    Batch,
+    CollectionDescription,
+    CollectionsAliasesResponse,
+    CollectionsResponse,
+    CollectionStatus,
+    CountResult,
+    CreateAliasOperation,
+    DeleteAliasOperation,
+    FieldCondition,
+    Filter,
+    MatchAny,
+    MatchValue,
+    Range,
+    Record,
+    ScoredPoint,
+    UpdateResult,
+    UpdateStatus,
+)
+
+from app.settings import LOCAL_INDEX_ANN_MIN_POINTS, LOCAL_INDEX_NPROBE
+
+logger = logging.getLogger(__name__)
+
+
+def _normalise(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def _grow(array: np.ndarray, size: int) -> np.ndarray:
+    """`array` with room for at least `size` items, doubling its capacity when full."""
+    if size <= len(array):
+        return array
+    grown = np.zeros(max(size, 2 * len(array), 1024), dtype=array.dtype)
+    grown[: len(array)] = array
+    return grown
+
+
+def _as_list(conditions) -> list:
+    if conditions is None:
+        return []
+    return conditions if isinstance(conditions, list) else [conditions]
+
+
+def kmeans(vectors: np.ndarray, clusters: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """Spherical k-means centroids of unit `vectors`."""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=clusters, replace=False)]
+    for _ in range(iterations):
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        empty = np.bincount(assignments, minlength=clusters) == 0
+        # Re-seed empty clusters with random points so every centroid stays in use.
+        sums[empty] = vectors[rng.choice(len(vectors), size=int(empty.sum()))]
+        centroids = _normalise(sums)
+    return centroids
+
+
+class LocalCollectionInfo(NamedTuple):
+    status: CollectionStatus
+    points_count: int
+    payload_schema: dict
+
+
+class LocalCollection:
+    """
+    One collection of unit vectors with JSON payloads, stored under `directory`:
+
+    - `vectors.f32`: float32 rows, appended to and searched through a read-only memory map.
+    - `points.jsonl`: one `[id, payload]` line per row. A point written again gets a new row and its old
+      row is dead; the live row of each id is rebuilt on load. Dead rows are compacted away once they
+      outnumber the live ones.
+    - `meta.json`: the vector size and payload indexes.
+    - `ivf.npz`: the ANN index, once there are `ann_min_points` live rows.
+
+    Search is an exact brute force cosine over the memory map. The ANN index is an inverted file: k-means
+    centroids with each row listed under its nearest one, so a search scores only the rows of the `nprobe`
+    centroids closest to the query. It is rebuilt whenever the collection has doubled since the last build.
+    Filters on payload fields are evaluated over columns built from the payloads on first use.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        size: int | None = None,
+        ann_min_points: int = LOCAL_INDEX_ANN_MIN_POINTS,
+        nprobe: int = LOCAL_INDEX_NPROBE,
+    ):
+        self.directory = directory
+        self.ann_min_points = ann_min_points
+        self.nprobe = nprobe
+        self._vectors_path = os.path.join(directory, "vectors.f32")
+        self._points_path = os.path.join(directory, "points.jsonl")
+        self._meta_path = os.path.join(directory, "meta.json")
+        self._ivf_path = os.path.join(directory, "ivf.npz")
+        if size is not None:
+            os.makedirs(directory, exist_ok=True)
+            self._write_meta({"size": size, "payload_schema": {}})
+        with open(self._meta_path) as f:
+            meta = json.load(f)
+        self.size: int = meta["size"]
+        self.payload_schema: dict = meta["payload_schema"]
+        self._lock = threading.RLock()
+        self._load()
+
+    def _write_meta(self, meta: dict) -> None:
+        tmp_path = f"{self._meta_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self._meta_path)
+
+    def _reset(self) -> None:
+        self._rows = 0
+        self._ids = np.zeros(0, dtype=np.uint64)
+        self._live = np.zeros(0, dtype=bool)
+        self._payloads: list[dict] = []
+        self._row_of: dict[int, int] = {}
+        self._matrix: np.ndarray | None = None
+        self._columns: dict[tuple[str, bool], tuple[np.ndarray, np.ndarray]] = {}
+        self._centroids: np.ndarray | None = None
+        self._assignments = np.zeros(0, dtype=np.int32)
+        self._lists: tuple[np.ndarray, np.ndarray] | None = None
+        self._indexed_points = 0
+
+    def _load(self) -> None:
+        self._reset()
+        points: list = []
+        ends = [0]
+        if os.path.exists(self._points_path):
+            with open(self._points_path, "rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # A write cut short; it is truncated below.
+                    points.append(json.loads(line))
+                    ends.append(ends[-1] + len(line))
+        row_bytes = self.size * 4
+        vector_rows = os.path.getsize(self._vectors_path) // row_bytes if os.path.exists(self._vectors_path) else 0
+        rows = min(len(points), vector_rows)
+        # Bring both files back to the same number of complete rows.
+        with open(self._vectors_path, "ab") as f:
+            f.truncate(rows * row_bytes)
+        with open(self._points_path, "ab") as f:
+            f.truncate(ends[rows])
+        if rows:
+            ids, payloads = zip(*points[:rows])
+            self._append_rows(list(ids), list(payloads))
+        if os.path.exists(self._ivf_path):
+            ivf = np.load(self._ivf_path)
+            self._centroids = ivf["centroids"]
+            self._indexed_points = int(ivf["indexed_points"])
+            indexed = min(len(ivf["assignments"]), self._rows)
+            self._assignments = _grow(self._assignments, self._rows)
+            self._assignments[:indexed] = ivf["assignments"][:indexed]
+            self._assign(indexed, self._rows)
+
+    def _append_rows(self, ids: list[int], payloads: list[dict]) -> None:
+        start, end = self._rows, self._rows + len(ids)
+        self._rows = end
+        self._ids = _grow(self._ids, end)
+        self._live = _grow(self._live, end)
+        self._ids[start:end] = ids
+        self._live[start:end] = True
+        self._payloads.extend(payloads)
+        for row, point_id in enumerate(ids, start):
+            old_row = self._row_of.get(point_id)
+            if old_row is not None:
+                self._live[old_row] = False
+            self._row_of[point_id] = row
+        self._matrix = None
+
+    def __len__(self) -> int:
+        return len(self._row_of)
+
+    def matrix(self) -> np.ndarray:
+        """Memory map of the stored rows."""
+        with self._lock:
+            if self._matrix is None:
+                if self._rows == 0:
+                    self._matrix = np.zeros((0, self.size), dtype=np.float32)
+                else:
+                    self._matrix = np.memmap(
+                        self._vectors_path, dtype=np.float32, mode="r", shape=(self._rows, self.size)
+                    )
+            return self._matrix
+
+    def upsert(self, ids: list[int], vectors: np.ndarray, payloads: list[dict]) -> None:
+        vectors = _normalise(np.asarray(vectors, dtype=np.float32).reshape(len(ids), self.size))
+        payloads = [payload or {} for payload in payloads]
+        with self._lock:
+            start = self._rows
+            with open(self._vectors_path, "ab") as f:
+                f.write(vectors.tobytes())
+            with open(self._points_path, "a") as f:
+                f.writelines(json.dumps([point_id, payload]) + "\n" for point_id, payload in zip(ids, payloads))
+            self._append_rows(ids, payloads)
+            if self._centroids is not None:
+                self._assign(start, self._rows)
+            if self._rows - len(self) > max(len(self), 10_000):
+                self.compact()
+            if len(self) >= self.ann_min_points and len(self) >= 2 * self._indexed_points:
+                self.build_index()
+
+    def compact(self) -> None:
+        """Rewrite the files without dead rows."""
+        with self._lock:
+            rows = np.flatnonzero(self._live[: self._rows])
+            matrix = self.matrix()
+            vectors_tmp, points_tmp = f"{self._vectors_path}.tmp", f"{self._points_path}.tmp"
+            with open(vectors_tmp, "wb") as f:
+                for start in range(0, len(rows), 65536):
+                    end = start + 65536
+                    f.write(np.ascontiguousarray(matrix[rows[start:end]]).tobytes())
+            with open(points_tmp, "w") as f:
+                f.writelines(json.dumps([int(self._ids[row]), self._payloads[row]]) + "\n" for row in rows)
+            self._matrix = None
+            os.replace(vectors_tmp, self._vectors_path)
+            os.replace(points_tmp, self._points_path)
+            if os.path.exists(self._ivf_path):
+                os.remove(self._ivf_path)
+            logger.info(f"Compacted {self._rows} rows to {len(rows)} in {self.directory}")
+            self._load()
+
+    def build_index(self, sample_size: int = 50_000, iterations: int = 10) -> None:
+        """(Re)build the ANN index over the live rows, with about sqrt(points) centroids."""
+        with self._lock:
+            rows = np.flatnonzero(self._live[: self._rows])
+            rng = np.random.default_rng(0)
+            sample = np.sort(rng.choice(rows, size=min(sample_size, len(rows)), replace=False))
+            clusters = max(1, min(int(np.sqrt(len(rows))), len(sample)))
+            self._centroids = kmeans(np.asarray(self.matrix()[sample]), clusters, iterations)
+            self._assign(0, self._rows)
+            self._indexed_points = len(rows)
+            self.save_index()
+            logger.info(f"Built ANN index of {clusters} centroids over {len(rows)} points in {self.directory}")
+
+    def _assign(self, start: int, end: int) -> None:
+        if self._centroids is None:
+            return
+        self._assignments = _grow(self._assignments, end)
+        self._lists = None
+        matrix = self.matrix()
+        for chunk in range(start, end, 65536):
+            chunk_end = min(chunk + 65536, end)
+            self._assignments[chunk:chunk_end] = np.argmax(matrix[chunk:chunk_end] @ self._centroids.T, axis=1)
+
+    def _inverted_lists(self) -> tuple[np.ndarray, np.ndarray]:
+        """Rows ordered by centroid, and where each centroid's rows start in that order."""
+        if self._lists is None and self._centroids is not None:
+            assignments = self._assignments[: self._rows]
+            counts = np.bincount(assignments, minlength=len(self._centroids))
+            self._lists = (np.argsort(assignments, kind="stable"), np.concatenate([[0], np.cumsum(counts)]))
+        assert self._lists is not None
+        return self._lists
+
+    def save_index(self) -> None:
+        with self._lock:
+            if self._centroids is None:
+                return
+            tmp_path = f"{self._ivf_path}.tmp.npz"
+            np.savez(
+                tmp_path,
+                centroids=self._centroids,
+                assignments=self._assignments[: self._rows],
+                indexed_points=self._indexed_points,
+            )
+            os.replace(tmp_path, self._ivf_path)
+
+    def add_payload_index(self, field_name: str, field_schema: Any) -> None:
+        with self._lock:
+            self.payload_schema[field_name] = str(getattr(field_schema, "value", field_schema))
+            self._write_meta({"size": self.size, "payload_schema": self.payload_schema})
+
+    def _column(self, key: str, numeric: bool) -> tuple[np.ndarray, np.ndarray]:
+        """Values of a payload field for every row, and a mask of the rows having it. Extended as rows are added."""
+        cached = self._columns.get((key, numeric))
+        start, end = 0 if cached is None else len(cached[0]), self._rows
+        if cached is not None and start == end:
+            return cached
+        new = [payload.get(key) for payload in self._payloads[start:end]]
+        if numeric:
+            # Range bounds are floats in Qdrant too.
+            present = np.array([isinstance(value, (int, float)) for value in new], dtype=bool)
+            values = np.array([value if isinstance(value, (int, float)) else 0 for value in new], dtype=float)
+        else:
+            present = np.array([value is not None for value in new], dtype=bool)
+            values = np.empty(len(new), dtype=object)
+            values[:] = new
+        if cached is not None:
+            values, present = np.concatenate([cached[0], values]), np.concatenate([cached[1], present])
+        self._columns[(key, numeric)] = (values, present)
+        return values, present
+
+    def _condition_mask(self, condition) -> np.ndarray:
+        if isinstance(condition, Filter):
+            return self.filter_mask(condition)
+        if not isinstance(condition, FieldCondition):
+            raise ValueError(f"Unsupported filter condition in local store: {type(condition).__name__}")
+        if condition.match is not None:
+            values, present = self._column(condition.key, numeric=False)
+            if isinstance(condition.match, MatchValue):
+                return present & (values == condition.match.value)
+            if isinstance(condition.match, MatchAny):
+                return present & np.isin(values, np.array(condition.match.any, dtype=object))
+            raise ValueError(f"Unsupported match in local store: {type(condition.match).__name__}")
+        if condition.range is not None and isinstance(condition.range, Range):
+            values, present = self._column(condition.key, numeric=True)
+            mask = present.copy()
+            bounds = condition.range
+            for bound, compare in (
+                (bounds.gte, np.greater_equal),
+                (bounds.gt, np.greater),
+                (bounds.lte, np.less_equal),
+                (bounds.lt, np.less),
+            ):
+                if bound is not None:
+                    mask &= compare(values, bound)
+            return mask
+        raise ValueError(f"Unsupported field condition on '{condition.key}' in local store")
+
+    def filter_mask(self, query_filter: Filter | None) -> np.ndarray:
+        """Rows that are live and match the filter."""
+        with self._lock:
+            mask = self._live[: self._rows].copy()
+            if query_filter is None:
+                return mask
+            for condition in _as_list(query_filter.must):
+                mask &= self._condition_mask(condition)
+            should = _as_list(query_filter.should)
+            if should:
+                mask &= np.logical_or.reduce([self._condition_mask(condition) for condition in should])
+            for condition in _as_list(query_filter.must_not):
+                mask &= ~self._condition_mask(condition)
+            return mask
+
+    def search(
+        self, query_vector, limit: int, query_filter: Filter | None = None, exact: bool = False
+    ) -> list[tuple[int, float]]:
+        """The `limit` best (row, score) pairs by cosine similarity."""
+        query = _normalise(np.asarray(query_vector, dtype=np.float32))
+        with self._lock:
+            mask = self.filter_mask(query_filter)
+            matrix = self.matrix()
+            if not exact and self._centroids is not None and np.count_nonzero(mask) > self.ann_min_points:
+                order, offsets = self._inverted_lists()
+                probe = np.argsort(self._centroids @ query)[::-1][: self.nprobe]
+                lists = [order[slice(offsets[cluster], offsets[cluster + 1])] for cluster in probe]
+                candidates = np.concatenate(lists)
+                rows = np.sort(candidates[mask[candidates]])
+            else:
+                rows = np.flatnonzero(mask)
+        if not len(rows):
+            return []
+        # Without a filter every row is scored straight from the memory map, without gathering a copy.
+        scores = (matrix @ query if len(rows) == len(matrix) else matrix[rows] @ query).astype(np.float64)
+        top = np.argpartition(-scores, limit - 1)[:limit] if len(rows) > limit else np.arange(len(rows))
+        top = top[np.argsort(-scores[top])]
+        return [(int(rows[i]), float(scores[i])) for i in top]
+
+    def point(self, row: int, with_payload: bool, with_vectors: bool) -> tuple[int, dict | None, list | None]:
+        payload = self._payloads[row] if with_payload else None
+        vector = self.matrix()[row].tolist() if with_vectors else None
+        return int(self._ids[row]), payload, vector
+
+    def rows_by_id(self, offset: int | None, limit: int) -> tuple[list[int], int | None]:
+        """Rows of the live points in id order from `offset`, and the id to continue from."""
+        with self._lock:
+            ids = np.array(sorted(self._row_of), dtype=np.uint64)
+            start = 0 if offset is None else int(np.searchsorted(ids, np.uint64(offset)))
+            end = start + limit + 1
+            page = ids[start:end]
+            rows = [self._row_of[int(point_id)] for point_id in page[:limit]]
+        return rows, int(page[limit]) if len(page) > limit else None
+
+    def row_of(self, point_id: int) -> int | None:
+        return self._row_of.get(point_id)
+
+
+class LocalVectorStore:
+    """
+    Collections and aliases under `path`, with the methods and return types of `QdrantClient` that
+    `QdrantDatabaseClient`, `BulkUploader` and the migrations call. Vectors always use cosine distance; HNSW
+    and quantization settings are ignored. Point ids must be integers.
+    """
+
+    def __init__(self, path: str, **collection_kwargs):
+        self.path = path
+        self.collection_kwargs = collection_kwargs
+        self._collections: dict[str, LocalCollection] = {}
+        self._lock = threading.Lock()
+        self._aliases_path = os.path.join(path, "aliases.json")
+        os.makedirs(path, exist_ok=True)
+        self._aliases: dict[str, str] = {}
+        if os.path.exists(self._aliases_path):
+            with open(self._aliases_path) as f:
+                self._aliases = json.load(f)
+        for name in os.listdir(path):
+            if os.path.exists(os.path.join(path, name, "meta.json")):
+                self._collections[name] = LocalCollection(os.path.join(path, name), **collection_kwargs)
+        logger.info(f"Opened local vector store at {path} with collections {list(self._collections)}")
+
+    def _save_aliases(self) -> None:
+        tmp_path = f"{self._aliases_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._aliases, f)
+        os.replace(tmp_path, self._aliases_path)
+
+    def collection(self, collection_name: str) -> LocalCollection:
+        collection = self._collections.get(self._aliases.get(collection_name, collection_name))
+        if collection is None:
+            raise ValueError(f"Collection {collection_name} not found")
+        return collection
+
+    def get_collections(self) -> CollectionsResponse:
+        return CollectionsResponse(collections=[CollectionDescription(name=name) for name in self._collections])
+
+    def get_aliases(self) -> CollectionsAliasesResponse:
+        return CollectionsAliasesResponse(
+            aliases=[AliasDescription(alias_name=alias, collection_name=name) for alias, name in self._aliases.items()]
+        )
+
+    def collection_exists(self, collection_name: str) -> bool:
+        return collection_name in self._collections
+
+    def create_collection(self, collection_name: str, vectors_config, **kwargs) -> bool:
+        with self._lock:
+            if collection_name in self._collections or collection_name in self._aliases:
+                raise ValueError(f"Collection {collection_name} already exists")
+            directory = os.path.join(self.path, collection_name)
+            shutil.rmtree(directory, ignore_errors=True)
+            self._collections[collection_name] = LocalCollection(
+                directory, size=vectors_config.size, **self.collection_kwargs
+            )
+        return True
+
+    def get_collection(self, collection_name: str) -> LocalCollectionInfo:
+        collection = self.collection(collection_name)
+        return LocalCollectionInfo(CollectionStatus.GREEN, len(collection), dict(collection.payload_schema))
+
+    def create_payload_index(self, collection_name: str, field_name: str, field_schema=None, **kwargs) -> UpdateResult:
+        self.collection(collection_name).add_payload_index(field_name, field_schema)
+        return UpdateResult(operation_id=0, status=UpdateStatus.COMPLETED)
+
+    def delete_collection(self, collection_name: str, **kwargs) -> bool:
+        with self._lock:
+            name = self._aliases.get(collection_name, collection_name)
+            if self._collections.pop(name, None) is None:
+                return False
+            self._aliases = {alias: target for alias, target in self._aliases.items() if target != name}
+            self._save_aliases()
+            shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+        return True
+
+    def update_collection_aliases(self, change_aliases_operations: list, **kwargs) -> bool:
+        with self._lock:
+            for operation in change_aliases_operations:
+                if isinstance(operation, CreateAliasOperation):
+                    if operation.create_alias.collection_name not in self._collections:
+                        raise ValueError(f"Collection {operation.create_alias.collection_name} not found")
+                    self._aliases[operation.create_alias.alias_name] = operation.create_alias.collection_name
+                elif isinstance(operation, DeleteAliasOperation):
+                    self._aliases.pop(operation.delete_alias.alias_name, None)
+                else:
+                    raise ValueError(f"Unsupported alias operation in local store: {type(operation).__name__}")
+            self._save_aliases()
+        return True
+
+    def upsert(self, collection_name: str, points, wait: bool = True, **kwargs) -> UpdateResult:
+        if isinstance(points, Batch):
+            ids, vectors, payloads = points.ids, points.vectors, points.payloads or [{}] * len(points.ids)
+        else:
+            ids = [point.id for point in points]
+            vectors = [point.vector for point in points]
+            payloads = [point.payload for point in points]
+        int_ids = [point_id for point_id in ids if isinstance(point_id, int)]
+        if len(int_ids) != len(ids):
+            raise ValueError("The local store only supports integer point ids")
+        self.collection(collection_name).upsert(int_ids, np.asarray(vectors, dtype=np.float32), list(payloads))
+        return UpdateResult(operation_id=0, status=UpdateStatus.COMPLETED)
+
+    def count(self, collection_name: str, count_filter: Filter | None = None, exact: bool = True) -> CountResult:
+        return CountResult(count=int(self.collection(collection_name).filter_mask(count_filter).sum()))
+
+    def retrieve(
+        self, collection_name: str, ids, with_payload: bool = True, with_vectors: bool = False, **kwargs
+    ) -> list[Record]:
+        collection = self.collection(collection_name)
+        records = []
+        for point_id in ids:
+            row = collection.row_of(point_id)
+            if row is not None:
+                point_id, payload, vector = collection.point(row, with_payload, with_vectors)
+                records.append(Record(id=point_id, payload=payload, vector=vector))
+        return records
+
+    def scroll(
+        self,
+        collection_name: str,
+        limit: int = 10,
+        offset=None,
+        with_payload: bool = True,
+        with_vectors: bool = False,
+        **kwargs,
+    ) -> tuple[list[Record], int | None]:
+        collection = self.collection(collection_name)
+        rows, next_offset = collection.rows_by_id(offset, limit)
+        records = []
+        for row in rows:
+            point_id, payload, vector = collection.point(row, with_payload, with_vectors)
+            records.append(Record(id=point_id, payload=payload, vector=vector))
+        return records, next_offset
+
+    def search(
+        self,
+        collection_name: str,
+        query_vector,
+        query_filter: Filter | None = None,
+        search_params=None,
+        limit: int = 10,
+        with_payload: bool = True,
+        with_vectors: bool = False,
+        **kwargs,
+    ) -> list[ScoredPoint]:
+        collection = self.collection(collection_name)
+        exact = bool(search_params is not None and search_params.exact)
+        results = []
+        for row, score in collection.search(query_vector, limit, query_filter, exact=exact):
+            point_id, payload, vector = collection.point(row, with_payload, with_vectors)
+            results.append(ScoredPoint(id=point_id, version=0, score=score, payload=payload, vector=vector))
+        return results
+
+    def search_batch(self, collection_name: str, requests: list, **kwargs) -> list[list[ScoredPoint]]:
+        return [
+            self.search(
+                collection_name,
+                request.vector,
+                query_filter=request.filter,
+                search_params=request.params,
+                limit=request.limit,
+                with_payload=request.with_payload,
+                with_vectors=request.with_vector,
+            )
+            for request in requests
+        ]
+
+    def close(self, **kwargs) -> None:
+        for collection in list(self._collections.values()):
+            collection.save_index()
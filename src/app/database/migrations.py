@@ -0,0 +1,111 @@
+"""migrations.py
+
+Recreate a Qdrant collection under a different collection profile.
+
+Run with `python -m app.database.migrations --profile scalar_on_disk`.
+"""
+
+import argparse
+import logging
+import time
+
+import numpy as np
+from qdrant_client.models import (
+    CreateAlias,
+    CreateAliasOperation,
+    DeleteAlias,
+    DeleteAliasOperation,
+)
+
+from app.database.bulk_upload import BulkUploader
+from app.database.profiles import PROFILES, CollectionProfile, get_profile
+from app.database.vector_db import QdrantDatabaseClient
+from app.settings import QDRANT_COLLECTION_NAME
+
+logger = logging.getLogger(__name__)
+
+
+def copy_points(database_client: QdrantDatabaseClient, source: str, target: str, page_size: int = 1000) -> int:
+    """Copy every point with its vector and payload from `source` to `target`. Returns the number copied."""
+    copied = 0
+    offset = None
+    with BulkUploader(database_client.qdrant_client, target, wait=True) as uploader:
+        while True:
+            points, offset = database_client.qdrant_client.scroll(
+                collection_name=source, limit=page_size, offset=offset, with_payload=True, with_vectors=True
+            )
+            if points:
+                vectors = np.asarray([point.vector for point in points], dtype=np.float32)
+                uploader.submit([point.id for point in points], vectors, [point.payload for point in points])
+                copied += len(points)
+            if offset is None:
+                break
+    return copied
+
+
+def migrate_collection(
+    database_client: QdrantDatabaseClient, profile: CollectionProfile, name: str | None = None, keep_old: bool = False
+) -> str:
+    """
+    Recreate the collection `name` under `profile` and serve it from the new collection through an alias.
+
+    The points are copied into a new collection named `{name}_{profile}_{unix time}`, then `name` is made
+    an alias of it. If `name` was a plain collection it is deleted just before the alias is created, so
+    searches fail for that moment. Points written to the old collection during the copy are not carried
+    over, so pause ingestion while migrating; Loki watermarks make re-ingesting the gap safe.
+
+    Returns:
+        str: The name of the new collection.
+    """
+    name = name or database_client.collection_name
+    source = database_client.resolve_alias(name) or name
+    target = f"{name}_{profile.name}_{int(time.time())}"
+
+    database_client.create_collection(collection_name=target, profile=profile)
+    logger.info(f"Copying '{source}' into '{target}' with profile '{profile.name}'.")
+    copied = copy_points(database_client, source, target)
+
+    stored = database_client.qdrant_client.count(collection_name=target, exact=True).count
+    if stored != copied:
+        raise RuntimeError(f"Copied {copied} points from '{source}' but '{target}' holds {stored}; keeping '{source}'.")
+
+    client = database_client.qdrant_client
+    if source == name:
+        # A collection and an alias cannot share a name: the old collection has to go first.
+        client.delete_collection(collection_name=source)
+        client.update_collection_aliases(
+            change_aliases_operations=[
+                CreateAliasOperation(create_alias=CreateAlias(collection_name=target, alias_name=name))
+            ]
+        )
+    else:
+        client.update_collection_aliases(
+            change_aliases_operations=[
+                DeleteAliasOperation(delete_alias=DeleteAlias(alias_name=name)),
+                CreateAliasOperation(create_alias=CreateAlias(collection_name=target, alias_name=name)),
+            ]
+        )
+        if not keep_old:
+            client.delete_collection(collection_name=source)
+
+    logger.info(f"'{name}' now serves {copied} points from '{target}' with profile '{profile.name}'.")
+    return target
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profile", required=True, choices=list(PROFILES))
+    parser.add_argument("--collection", default=QDRANT_COLLECTION_NAME)
+    parser.add_argument("--keep-old", action="store_true", help="Keep the previous collection if it was aliased.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    profile = get_profile(args.profile)
+    database_client = QdrantDatabaseClient(collection_name=args.collection, profile=profile.name)
+    # With partitioning, every day partition (and any unpartitioned collection) is migrated.
+    for name in database_client.collections():
+        print(migrate_collection(database_client, profile, name=name, keep_old=args.keep_old))
+
+
+if __name__ == "__main__":
+    main()
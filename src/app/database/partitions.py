@@ -0,0 +1,66 @@
+"""partitions.py
+
+Naming and time arithmetic of day-partitioned collections."""
+
+import re
+from datetime import date, datetime, timedelta, timezone
+
+from app.connectors import NANOSECONDS
+
+DAY_NS = 24 * 60 * 60 * NANOSECONDS
+
+
+def partition_day(timestamp_ns: int) -> date:
+    """The UTC day a nanosecond timestamp falls on."""
+    return datetime.fromtimestamp(timestamp_ns // NANOSECONDS, tz=timezone.utc).date()
+
+
+def day_start_ns(day: date) -> int:
+    return int(datetime(day.year, day.month, day.day, tzinfo=timezone.utc).timestamp()) * NANOSECONDS
+
+
+def partition_name(base_name: str, day: date) -> str:
+    return f"{base_name}_{day:%Y%m%d}"
+
+
+def parse_partition_day(base_name: str, name: str) -> date | None:
+    """The day of a partition of `base_name`, or None if `name` is not one."""
+    match = re.fullmatch(rf"{re.escape(base_name)}_(\d{{8}})", name)
+    if match is None:
+        return None
+    try:
+        return datetime.strptime(match.group(1), "%Y%m%d").date()
+    except ValueError:
+        return None
+
+
+def overlapping(partitions: dict[str, date], since_ns: int | None, until_ns: int | None) -> list[str]:
+    """Names of the partitions holding points in [since_ns, until_ns], newest first. None leaves a side open."""
+    names = []
+    for name, day in partitions.items():
+        start = day_start_ns(day)
+        if since_ns is not None and start + DAY_NS <= since_ns:
+            continue
+        if until_ns is not None and start > until_ns:
+            continue
+        names.append(name)
+    return sorted(names, key=partitions.__getitem__, reverse=True)
+
+
+def oldest_kept_day(retention_days: int, now_ns: int) -> date:
+    """The first day still within `retention_days`, today counting as one."""
+    return partition_day(now_ns) - timedelta(days=retention_days - 1)
+
+
+def expired(partitions: dict[str, date], retention_days: int, now_ns: int) -> list[str]:
+    """Names of the partitions whose whole day is older than `retention_days`."""
+    oldest_kept = oldest_kept_day(retention_days, now_ns)
+    return [name for name, day in partitions.items() if day < oldest_kept]
+
+
+def route(payloads: list[dict], default_ns: int) -> dict[date, list[int]]:
+    """Indexes of the payloads by the day of their `ts`; payloads without one go to `default_ns`'s day."""
+    routes: dict[date, list[int]] = {}
+    for i, payload in enumerate(payloads):
+        routes.setdefault(partition_day(int(payload.get("ts", default_ns))), []).append(i)
+    return routes
@@ -6,15 +6,183 @@ Contains nlp functions to process data.
 import hashlib
 import json
 import logging
+import multiprocessing
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Iterable, Iterator
 
+import numpy as np
 import spacy
+from spacy.language import Language
+
+from app.database.embedding_cache import get_embedding_cache, text_key
+from app.settings import (
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_PROCESSES,
+    SPACY_EXCLUDED_COMPONENTS,
+    SPACY_MODEL,
+)
+from app.utils import chunked
 
 logger = logging.getLogger(__name__)
 
 
+class SpacyEmbedder:
+    """
+    A spaCy pipeline loaded once and reused for every embedding call.
+
+    Only the components needed for `doc.vector` are loaded; the parser, NER and lemmatizer are excluded.
+    Loading is lazy and thread-safe, or can be triggered up front with `load`.
+    """
+
+    def __init__(self, model_name: str = SPACY_MODEL, exclude: list[str] = SPACY_EXCLUDED_COMPONENTS):
+        self.model_name = model_name
+        self.exclude = exclude
+        self._nlp: Language | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self._nlp is not None
+
+    def load(self) -> Language:
+        if self._nlp is None:
+            with self._lock:
+                if self._nlp is None:
+                    logger.info(f"Loading spaCy model '{self.model_name}' without {self.exclude}.")
+                    self._nlp = spacy.load(self.model_name, exclude=self.exclude)
+                    logger.info(f"Loaded spaCy model '{self.model_name}'.")
+        return self._nlp
+
+    def embed(self, texts: list) -> list:
+        return [doc.vector for doc in self.load().pipe(texts)]
+
+    def embed_array(self, texts: list[str], batch_size: int = EMBEDDING_BATCH_SIZE) -> np.ndarray:
+        """Embed `texts` into a (len(texts), dim) float32 array."""
+        vectors = [doc.vector for doc in self.load().pipe(texts, batch_size=batch_size)]
+        if not vectors:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.asarray(vectors, dtype=np.float32)
+
+
+_embedders: dict[str, SpacyEmbedder] = {}
+_embedders_lock = threading.Lock()
+
+
+def get_embedder(model_name: str = SPACY_MODEL) -> SpacyEmbedder:
+    """Return the process-wide embedder for `model_name`, creating it on first use."""
+    with _embedders_lock:
+        if model_name not in _embedders:
+            _embedders[model_name] = SpacyEmbedder(model_name)
+        return _embedders[model_name]
+
+
+_worker_embedder: SpacyEmbedder | None = None
+
+
+def _init_worker(model_name: str) -> None:
+    global _worker_embedder
+    _worker_embedder = SpacyEmbedder(model_name)
+    _worker_embedder.load()
+
+
+def _embed_in_worker(texts: list[str], batch_size: int) -> np.ndarray:
+    assert _worker_embedder is not None
+    return _worker_embedder.embed_array(texts, batch_size=batch_size)
+
+
+class EmbeddingPool:
+    """
+    Embed texts in batches on a pool of worker processes, each holding its own copy of the model.
+
+    Results are yielded in input order, one array per batch, as soon as the next batch is done. At most
+    `2 * processes` batches are in flight, so arbitrarily long inputs are streamed rather than queued.
+    With `processes <= 1` batches are embedded in the calling process.
+    """
+
+    def __init__(
+        self,
+        processes: int = EMBEDDING_PROCESSES,
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+        model_name: str = SPACY_MODEL,
+    ):
+        self.processes = processes
+        self.batch_size = batch_size
+        self.model_name = model_name
+        self._executor: ProcessPoolExecutor | None = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                logger.info(f"Starting {self.processes} embedding worker processes.")
+                # Spawn rather than fork: the API process runs threads and an event loop.
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.processes,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(self.model_name,),
+                )
+            return self._executor
+
+    def embed_batches(self, texts: Iterable[str], batch_size: int | None = None) -> Iterator[np.ndarray]:
+        """
+        Embed `texts`, yielding a float32 array for each consecutive batch of `batch_size` texts.
+        """
+        batch_size = batch_size or self.batch_size
+        if self.processes <= 1:
+            embedder = get_embedder(self.model_name)
+            for batch in chunked(texts, batch_size):
+                yield embedder.embed_array(batch, batch_size=batch_size)
+            return
+
+        executor = self._get_executor()
+        pending: deque[Future] = deque()
+        try:
+            for batch in chunked(texts, batch_size):
+                pending.append(executor.submit(_embed_in_worker, batch, batch_size))
+                if len(pending) >= 2 * self.processes:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(cancel_futures=True)
+                self._executor = None
+
+
+_embedding_pool: EmbeddingPool | None = None
+
+
+def get_embedding_pool() -> EmbeddingPool:
+    """Return the process-wide embedding pool, configured from settings."""
+    global _embedding_pool
+    with _embedders_lock:
+        if _embedding_pool is None:
+            _embedding_pool = EmbeddingPool()
+        return _embedding_pool
+
+
+def shutdown_embedding_pool() -> None:
+    if _embedding_pool is not None:
+        _embedding_pool.shutdown()
+
+
+def embedder_ready(model_name: str = SPACY_MODEL) -> bool:
+    """True once the embedding model is loaded and requests will not pay the load time."""
+    embedder = _embedders.get(model_name)
+    return embedder is not None and embedder.ready
+
+
 def generate_embeddings(texts: list) -> list:
     """
-    Generate embeddings for the given texts using SentenceTransformer model.
+    Generate embeddings for the given texts using the shared spaCy model.
 
     Args:
         texts (list): List of texts to generate embeddings for.
@@ -24,10 +192,80 @@ def generate_embeddings(texts: list) -> list:
     """
     try:
         logger.info("Generating embeddings for the given texts.")
+        if get_embedding_cache() is None:
+            return get_embedder().embed(texts)
+        return [vector for batch in _cached_embedding_batches(texts, batch_size=None) for vector in batch]
+
+    except Exception as e:
+        logger.error(f"Failed to generate embeddings. Error: {e}")
+        raise Exception("Failed embedding text to vectors") from e
+
+
+def _cached_embedding_batches(texts: list, batch_size: int | None) -> Iterator[np.ndarray]:
+    """
+    Like `EmbeddingPool.embed_batches`, but only texts missing from the embedding cache are embedded, once each.
 
-        nlp = spacy.load("en_core_web_sm")
-        return [doc.vector for doc in nlp.pipe(texts)]
+    Misses are sent to the pool in order of first occurrence, so every output batch can be yielded as soon as
+    the misses it contains are embedded.
+    """
+    cache = get_embedding_cache()
+    assert cache is not None
+    pool = get_embedding_pool()
+    batch_size = batch_size or pool.batch_size
+
+    keys = [text_key(text) for text in texts]
+    vectors: dict[str, np.ndarray] = {}
+    missing: dict[str, str] = {}
+    for key, text in zip(keys, texts):
+        if key in vectors or key in missing:
+            cache.duplicates += 1
+            continue
+        vector = cache.get(key)
+        if vector is None:
+            missing[key] = text
+        else:
+            vectors[key] = vector
+    if missing:
+        logger.info(f"Embedding {len(missing)} of {len(texts)} texts, the rest are cached.")
+
+    batches = chunked(keys, batch_size)
+    ready = next(batches, None)
+
+    def resolved(batch_keys: list[str]) -> np.ndarray:
+        return np.stack([vectors[key] for key in batch_keys])
 
+    missing_keys = list(missing)
+    done = 0
+    for embeddings in pool.embed_batches(missing.values(), batch_size=batch_size):
+        start, done = done, done + len(embeddings)
+        new_keys = missing_keys[start:done]
+        cache.add(new_keys, embeddings)
+        vectors.update(zip(new_keys, embeddings))
+        while ready is not None and all(key in vectors for key in ready):
+            yield resolved(ready)
+            ready = next(batches, None)
+
+    while ready is not None:
+        yield resolved(ready)
+        ready = next(batches, None)
+
+
+def generate_embedding_batches(texts: list, batch_size: int | None = None) -> Iterator[np.ndarray]:
+    """
+    Generate embeddings batch by batch on the shared embedding pool, in input order.
+
+    Args:
+        texts (list): List of texts to generate embeddings for.
+        batch_size (int | None): Texts per batch. Defaults to EMBEDDING_BATCH_SIZE.
+
+    Returns:
+        Iterator[np.ndarray]: One (batch, dim) float32 array per batch.
+    """
+    try:
+        if get_embedding_cache() is None:
+            yield from get_embedding_pool().embed_batches(texts, batch_size=batch_size)
+        else:
+            yield from _cached_embedding_batches(texts, batch_size=batch_size)
     except Exception as e:
         logger.error(f"Failed to generate embeddings. Error: {e}")
         raise Exception("Failed embedding text to vectors") from e
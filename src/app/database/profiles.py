@@ -0,0 +1,109 @@
+"""profiles.py
+
+Qdrant collection profiles trading memory for recall and latency."""
+
+from typing import NamedTuple
+
+from qdrant_client.models import (
+    BinaryQuantization,
+    BinaryQuantizationConfig,
+    Distance,
+    HnswConfigDiff,
+    QuantizationConfig,
+    QuantizationSearchParams,
+    ScalarQuantization,
+    ScalarQuantizationConfig,
+    ScalarType,
+    SearchParams,
+    VectorParams,
+)
+
+from app.settings import QDRANT_VECTOR_SIZE
+
+
+class CollectionProfile(NamedTuple):
+    """
+    Storage and index settings of a collection.
+
+    - `quantization`: None, "scalar" (int8, 4x smaller) or "binary" (1 bit per dimension, 32x smaller).
+      Quantized vectors are kept in RAM; the original vectors are used to rescore the best
+      `oversampling * limit` candidates.
+    - `on_disk_vectors` / `on_disk_payload`: keep original vectors / payloads memory-mapped on disk.
+    - `hnsw_m` / `hnsw_ef_construct`: graph degree and build-time beam width. Lower `m` means a smaller graph.
+    - `search_ef`: search-time beam width; None uses Qdrant's default.
+    """
+
+    name: str
+    quantization: str | None = None
+    oversampling: float = 1.0
+    on_disk_vectors: bool = False
+    on_disk_payload: bool = False
+    hnsw_m: int = 16
+    hnsw_ef_construct: int = 100
+    search_ef: int | None = None
+
+    def vectors_config(self, size: int = QDRANT_VECTOR_SIZE) -> VectorParams:
+        return VectorParams(size=size, distance=Distance.COSINE, on_disk=self.on_disk_vectors)
+
+    def hnsw_config(self) -> HnswConfigDiff:
+        return HnswConfigDiff(m=self.hnsw_m, ef_construct=self.hnsw_ef_construct)
+
+    def quantization_config(self) -> QuantizationConfig | None:
+        if self.quantization == "scalar":
+            return ScalarQuantization(
+                scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=True)
+            )
+        if self.quantization == "binary":
+            return BinaryQuantization(binary=BinaryQuantizationConfig(always_ram=True))
+        return None
+
+    def search_params(self) -> SearchParams | None:
+        if self.quantization is None and self.search_ef is None:
+            return None
+        quantization = None
+        if self.quantization is not None:
+            quantization = QuantizationSearchParams(rescore=True, oversampling=self.oversampling)
+        return SearchParams(hnsw_ef=self.search_ef, quantization=quantization)
+
+    def estimated_ram_bytes(self, points: int, size: int = QDRANT_VECTOR_SIZE) -> int:
+        """Rough resident memory of vectors and graph, ignoring payloads and the page cache."""
+        vectors = 0 if self.on_disk_vectors else points * size * 4
+        if self.quantization == "scalar":
+            vectors += points * size
+        elif self.quantization == "binary":
+            vectors += points * ((size + 7) // 8)
+        graph = points * self.hnsw_m * 2 * 4
+        return vectors + graph
+
+
+PROFILES = {
+    profile.name: profile
+    for profile in (
+        CollectionProfile(name="default"),
+        CollectionProfile(name="scalar", quantization="scalar", oversampling=2.0, search_ef=128),
+        CollectionProfile(
+            name="scalar_on_disk",
+            quantization="scalar",
+            oversampling=2.0,
+            on_disk_vectors=True,
+            on_disk_payload=True,
+            search_ef=128,
+        ),
+        CollectionProfile(
+            name="binary_on_disk",
+            quantization="binary",
+            oversampling=3.0,
+            on_disk_vectors=True,
+            on_disk_payload=True,
+            hnsw_m=8,
+            search_ef=128,
+        ),
+    )
+}
+
+
+def get_profile(name: str) -> CollectionProfile:
+    try:
+        return PROFILES[name]
+    except KeyError:
+        raise ValueError(f"Unknown collection profile: {name}. Expected one of {list(PROFILES)}.") from None
@@ -0,0 +1,101 @@
+"""query_vectors.py
+
+Memoised embeddings of search queries, precomputed at startup for the standing queries of scans and reports."""
+
+import logging
+import threading
+
+import numpy as np
+
+from app.cache import LRUCache, register_cache
+from app.database.embedding_cache import normalise_text
+from app.database.processors import generate_embeddings
+from app.settings import QUERY_VECTORS_MAX_ITEMS, STANDING_QUERIES
+
+logger = logging.getLogger(__name__)
+
+
+class QueryVectors:
+    """
+    Embeddings of query texts, keyed on the normalised text.
+
+    Standing queries, the fixed phrases searched on every scan or report, are embedded together by
+    `precompute` and never evicted. Other queries are kept in an LRU of `max_items`. Misses of one
+    `get_many` call are embedded in a single call.
+    """
+
+    def __init__(self, standing: list[str] | None = None, max_items: int = QUERY_VECTORS_MAX_ITEMS):
+        self._standing: dict[str, list[float] | None] = {}
+        self._recent = LRUCache(max_items)
+        self._lock = threading.Lock()
+        self.standing_hits = 0
+        self.standing_misses = 0
+        self.register(*(standing or []))
+
+    def register(self, *queries: str) -> None:
+        """Register standing queries; they are embedded by the next `precompute` or on first use."""
+        with self._lock:
+            for query in queries:
+                self._standing.setdefault(normalise_text(query), None)
+
+    def precompute(self) -> None:
+        """Embed every standing query not embedded yet."""
+        with self._lock:
+            missing = [key for key, vector in self._standing.items() if vector is None]
+        if missing:
+            self.get_many(missing)
+            logger.info(f"Precomputed embeddings of {len(missing)} standing queries.")
+
+    def _lookup(self, key: str) -> list[float] | None:
+        with self._lock:
+            vector = self._standing.get(key)
+            if vector is not None:
+                self.standing_hits += 1
+                return vector
+            if key in self._standing:
+                self.standing_misses += 1
+                return None
+        return self._recent.get(key)
+
+    def get_many(self, queries: list[str]) -> list[list[float]]:
+        keys = [normalise_text(query) for query in queries]
+        vectors = {key: self._lookup(key) for key in dict.fromkeys(keys)}
+        missing = [key for key, vector in vectors.items() if vector is None]
+        if missing:
+            matrix = np.asarray(generate_embeddings(missing), dtype=np.float32)
+            embeddings: list[list[float]] = matrix.tolist()  # type: ignore[assignment]
+            with self._lock:
+                for key, vector in zip(missing, embeddings):
+                    vectors[key] = vector
+                    if key in self._standing:
+                        self._standing[key] = vector
+                    else:
+                        self._recent.set(key, vector)
+        return [vectors[key] for key in keys]  # type: ignore[misc]
+
+    def get(self, query: str) -> list[float]:
+        return self.get_many([query])[0]
+
+    def stats(self) -> dict:
+        stats = self._recent.stats()
+        stats["hits"] += self.standing_hits
+        stats["misses"] += self.standing_misses
+        total = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / total, 4) if total else 0.0
+        stats["standing"] = len(self._standing)
+        stats["standing_hits"] = self.standing_hits
+        return stats
+
+
+_query_vectors: QueryVectors | None = None
+_query_vectors_lock = threading.Lock()
+
+
+def get_query_vectors() -> QueryVectors:
+    """Return the process-wide query vector cache, with `STANDING_QUERIES` registered."""
+    global _query_vectors
+    with _query_vectors_lock:
+        if _query_vectors is None:
+            _query_vectors = QueryVectors(standing=STANDING_QUERIES)
+            register_cache("query_vectors", _query_vectors)
+        return _query_vectors
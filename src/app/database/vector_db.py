@@ -4,98 +4,523 @@ This script creates a new collection in Qdrant instance.
 """
 
 import logging
+import os
+import time
+from datetime import date
+from typing import Iterator, Sequence
 
-from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams
+import numpy as np
+from qdrant_client.models import (
+    Condition,
+    DeleteAlias,
+    DeleteAliasOperation,
+    FieldCondition,
+    Filter,
+    MatchAny,
+    MatchValue,
+    PayloadSchemaType,
+    Range,
+    SearchRequest,
+)
 
-from app.database.processors import generate_embeddings, generate_id
-from app.settings import QDRANT_COLLECTION_NAME, QDRANT_HOST, QDRANT_VECTOR_SIZE
-from app.utils import singleton
+from app.database.backends import create_backend
+from app.database.bulk_upload import BulkUploader
+from app.database.known_ids import KnownIds
+from app.database.partitions import (
+    expired,
+    oldest_kept_day,
+    overlapping,
+    parse_partition_day,
+    partition_name,
+    route,
+)
+from app.database.processors import generate_embedding_batches, generate_id
+from app.database.profiles import CollectionProfile, get_profile
+from app.database.query_vectors import get_query_vectors
+from app.log_batch import LogBatch
+from app.log_templates import LogTemplate, get_template_miner, save_template_miner
+from app.settings import (
+    LOG_TEMPLATES_ENABLED,
+    QDRANT_COLLECTION_NAME,
+    QDRANT_COLLECTION_PROFILE,
+    QDRANT_EXISTS_CHECK_BATCH_SIZE,
+    QDRANT_HOST,
+    QDRANT_KNOWN_IDS_DIR,
+    QDRANT_PARTITIONING_ENABLED,
+    QDRANT_RETENTION_DAYS,
+    QDRANT_VECTOR_SIZE,
+    VECTOR_BACKEND,
+)
+from app.utils import chunked, singleton
 
 logger = logging.getLogger(__name__)
 
+# Payload fields filtered on by searches. `ts` is the nanosecond timestamp of the line, or of the latest
+# occurrence for a log template.
+PAYLOAD_INDEXES = {
+    "level": PayloadSchemaType.KEYWORD,
+    "service": PayloadSchemaType.KEYWORD,
+    "job": PayloadSchemaType.KEYWORD,
+    "ts": PayloadSchemaType.INTEGER,
+}
+
+
+def build_log_filter(
+    levels: list[str] | None = None,
+    services: list[str] | None = None,
+    job: str | None = None,
+    since_ns: int | None = None,
+    until_ns: int | None = None,
+) -> Filter | None:
+    """
+    Build a Qdrant filter on the indexed log payload fields. Returns None if no condition is given.
+
+    Levels match case-insensitively for the common spellings: "error", "ERROR" and "Error".
+    """
+    conditions: list[Condition] = []
+    if levels:
+        spellings = sorted({spelling for level in levels for spelling in (level.upper(), level.lower(), level.title())})
+        conditions.append(FieldCondition(key="level", match=MatchAny(any=spellings)))
+    if services:
+        conditions.append(FieldCondition(key="service", match=MatchAny(any=services)))
+    if job:
+        conditions.append(FieldCondition(key="job", match=MatchValue(value=job)))
+    if since_ns is not None or until_ns is not None:
+        conditions.append(FieldCondition(key="ts", range=Range(gte=since_ns, lte=until_ns)))
+    return Filter(must=conditions) if conditions else None
+
+
+def _vector_to_list(vector: Sequence[float] | np.ndarray) -> list[float]:
+    return np.asarray(vector, dtype=np.float32).tolist()  # type: ignore[return-value]
+
+
+def _merge_search_results(results: list, limit: int) -> list:
+    """
+    Best `limit` results of searches over several collections. A log template is stored once per day it was
+    seen, so of points sharing an id only the best scoring, most recent one is kept.
+    """
+    results = sorted(results, key=lambda point: (-point.score, -(point.payload or {}).get("ts", 0)))
+    merged: dict = {}
+    for point in results:
+        merged.setdefault(point.id, point)
+    return list(merged.values())[:limit]
+
 
 @singleton
 class QdrantDatabaseClient:
-    def __init__(self, host: str = QDRANT_HOST, collection_name: str = QDRANT_COLLECTION_NAME):
+    def __init__(
+        self,
+        host: str = QDRANT_HOST,
+        collection_name: str = QDRANT_COLLECTION_NAME,
+        profile: str = QDRANT_COLLECTION_PROFILE,
+        partitioned: bool = QDRANT_PARTITIONING_ENABLED,
+        backend: str = VECTOR_BACKEND,
+    ):
+        """
+        `backend` is "qdrant" for the Qdrant server at `host` or "local" for the in-process store.
+
+        With `partitioned`, points are stored in one collection per UTC day of their `ts`, named
+        `{collection_name}_YYYYMMDD`. A collection named `collection_name` left from before partitioning is
+        still searched, but not written to or expired.
+        """
         self.QDRANT_HOST = host
         self.collection_name = collection_name
-        self.qdrant_client = QdrantClient(self.QDRANT_HOST)
+        self.profile = get_profile(profile)
+        self.partitioned = partitioned
+        self.qdrant_client = create_backend(backend, self.QDRANT_HOST)
+        self.known_ids = KnownIds(os.path.join(QDRANT_KNOWN_IDS_DIR, f"{collection_name}.npz"))
+        self._created_partitions: set[str] = set()
+
+    def close(self):
+        """Persist the known point ids and the log templates, and close the backend."""
+        self.save_known_ids()
+        save_template_miner()
+        self.qdrant_client.close()
 
     def setup(self):
-        self.create_collection()
+        if self.partitioned:
+            self.drop_expired_partitions()
+        else:
+            self.create_collection()
+        self.warm_known_ids()
+        return self
+
+    def warm_known_ids(self, page_size: int = 10_000):
+        """
+        Fill the local set of stored point ids from its file, or else by scrolling the collections' ids. The
+        file is only used if the collections still hold the number of points they held when it was saved, so
+        ids of a recreated or cleared collection are not taken as stored.
+        """
+        self.known_ids.clear()
+        try:
+            fingerprint = self.known_ids_fingerprint()
+            if self.known_ids.load(fingerprint):
+                return
+            for collection_name in fingerprint:
+                for ids in self.iter_ids(collection_name, page_size):
+                    self.known_ids.add(ids)
+        except Exception as e:
+            logger.error(f"Failed to load point ids of collection '{self.collection_name}'. Error: {e}")
+            self.known_ids.clear()
+            return
+        logger.info(f"Loaded {len(self.known_ids)} point ids of collection '{self.collection_name}'.")
+        self.known_ids.save(fingerprint)
+
+    def known_ids_fingerprint(self) -> dict[str, int]:
+        """The number of points in each collection the known point ids cover, by collection name."""
+        return {
+            collection_name: self.qdrant_client.count(collection_name=collection_name, exact=True).count
+            for collection_name in self.collections()
+        }
+
+    def save_known_ids(self):
+        """Persist the known point ids with the current fingerprint of the collections."""
+        try:
+            fingerprint = self.known_ids_fingerprint()
+        except Exception as e:
+            logger.error(f"Failed to count the points of collection '{self.collection_name}'. Error: {e}")
+            fingerprint = None
+        self.known_ids.save(fingerprint)
+
+    def iter_ids(self, collection_name: str, page_size: int = 10_000) -> Iterator[list[int]]:
+        """Yield the integer point ids of a collection, a page at a time."""
+        offset = None
+        while True:
+            points, offset = self.qdrant_client.scroll(
+                collection_name=collection_name,
+                limit=page_size,
+                offset=offset,
+                with_payload=False,
+                with_vectors=False,
+            )
+            yield [point.id for point in points if isinstance(point.id, int)]
+            if offset is None:
+                break
+
+    def _collection_names(self) -> set[str]:
+        """Names of every collection and alias."""
+        names = {collection.name for collection in self.qdrant_client.get_collections().collections}
+        return names | {alias.alias_name for alias in self.qdrant_client.get_aliases().aliases}
+
+    def collection_exists(self, collection_name: str | None = None) -> bool:
+        """True if a collection, or an alias, with this name exists."""
+        collection_name = collection_name or self.collection_name
+        if self.qdrant_client.collection_exists(collection_name):
+            return True
+        return any(alias.alias_name == collection_name for alias in self.qdrant_client.get_aliases().aliases)
 
-    def create_collection(self):
+    def resolve_alias(self, name: str) -> str | None:
+        """The collection an alias points to, or None if `name` is not an alias."""
+        for alias in self.qdrant_client.get_aliases().aliases:
+            if alias.alias_name == name:
+                return alias.collection_name
+        return None
+
+    def list_partitions(self, names: set[str] | None = None) -> dict[str, date]:
+        """The day of every partition of this client's collection, by partition name."""
+        partitions = {}
+        for name in self._collection_names() if names is None else names:
+            day = parse_partition_day(self.collection_name, name)
+            if day is not None:
+                partitions[name] = day
+        return partitions
+
+    def collections(self, since_ns: int | None = None, until_ns: int | None = None) -> list[str]:
         """
-        Create a new collection in Qdrant instance if it doesn't already exist.
+        The collections that can hold points with a `ts` in [since_ns, until_ns]: the collection itself, or
+        with partitioning the overlapping day partitions, newest first, and any unpartitioned collection.
+        """
+        if not self.partitioned:
+            return [self.collection_name]
+        names = self._collection_names()
+        collections = overlapping(self.list_partitions(names), since_ns, until_ns)
+        if self.collection_name in names:
+            collections.append(self.collection_name)
+        return collections
+
+    def drop_expired_partitions(self, retention_days: int = QDRANT_RETENTION_DAYS, now_ns: int | None = None):
+        """
+        Delete the partitions older than `retention_days`, a whole collection each. Returns their names.
+        """
+        if not self.partitioned or retention_days <= 0:
+            return []
+        try:
+            names = expired(self.list_partitions(), retention_days, now_ns or time.time_ns())
+        except Exception as e:
+            logger.error(f"Failed to list the partitions of collection '{self.collection_name}'. Error: {e}")
+            return []
+        dropped = []
+        for name in names:
+            try:
+                self.drop_partition(name)
+                dropped.append(name)
+            except Exception as e:
+                logger.error(f"Failed to drop expired partition '{name}'. Error: {e}")
+        if dropped:
+            logger.info(f"Dropped {len(dropped)} partitions older than {retention_days} days: {dropped}")
+            self.save_known_ids()
+        return dropped
+
+    def drop_partition(self, name: str):
+        """Delete a partition, and the collection behind it if it is an alias, and forget its point ids."""
+        ids = [point_id for page in self.iter_ids(name) for point_id in page]
+        target = self.resolve_alias(name)
+        if target is not None:
+            self.qdrant_client.update_collection_aliases(
+                change_aliases_operations=[DeleteAliasOperation(delete_alias=DeleteAlias(alias_name=name))]
+            )
+        self.qdrant_client.delete_collection(collection_name=target or name)
+        self.known_ids.discard(ids)
+        self._created_partitions.discard(name)
+
+    def create_collection(self, collection_name: str | None = None, profile: CollectionProfile | None = None):
+        """
+        Create a new collection in Qdrant instance if it doesn't already exist, and index the payload fields
+        searches filter on.
 
         Args:
-            collection_name (str): The name of the collection to create.
+            collection_name (str | None): The name of the collection to create. Defaults to the client's.
+            profile (CollectionProfile | None): Storage and index settings. Defaults to the client's profile.
         Returns:
             None
         """
+        collection_name = collection_name or self.collection_name
+        profile = profile or self.profile
         try:
-            logger.info(f"Creating collection '{self.collection_name}' in Qdrant.")
-            self.qdrant_client.create_collection(
-                collection_name=self.collection_name,
-                vectors_config=VectorParams(size=QDRANT_VECTOR_SIZE, distance=Distance.COSINE),
-            )
-            logger.info(f"Created collection '{self.collection_name}' in Qdrant.")
+            if not self.collection_exists(collection_name):
+                logger.info(f"Creating collection '{collection_name}' in Qdrant with profile '{profile.name}'.")
+                self.qdrant_client.create_collection(
+                    collection_name=collection_name,
+                    vectors_config=profile.vectors_config(QDRANT_VECTOR_SIZE),
+                    hnsw_config=profile.hnsw_config(),
+                    quantization_config=profile.quantization_config(),
+                    on_disk_payload=profile.on_disk_payload,
+                )
+                logger.info(f"Created collection '{collection_name}' in Qdrant.")
+            self.create_payload_indexes(collection_name)
         except Exception as e:
-            logger.error(f"Failed to create collection '{self.collection_name}'. Error: {e}")
+            logger.error(f"Failed to create collection '{collection_name}'. Error: {e}")
+
+    def create_payload_indexes(self, collection_name: str | None = None):
+        """Create the payload indexes in `PAYLOAD_INDEXES`; existing indexes are left as they are."""
+        collection_name = collection_name or self.collection_name
+        info = self.qdrant_client.get_collection(collection_name)
+        existing = info.payload_schema or {}
+        for field_name, schema in PAYLOAD_INDEXES.items():
+            if field_name in existing:
+                continue
+            self.qdrant_client.create_payload_index(
+                collection_name=collection_name, field_name=field_name, field_schema=schema
+            )
+            logger.info(f"Created {schema.value} payload index on '{field_name}' in '{collection_name}'.")
 
-    def upsert(self, data_to_embed: list, payloads: list):
+    def upsert(self, data_to_embed: list, payloads: list, ids: list | None = None):
         """
         Insert logs into Qdrant, ensuring no duplicates are added.
+
+        Point ids are derived from the payloads unless given. Derived ids are content addresses, so points
+        already stored are skipped before embedding. Points with given ids are always written.
+
+        With partitioning, each point goes to the partition of its payload's `ts`, created on first use.
+        Points older than the retention period are dropped.
         """
-        logger.info(f"Upserting {len(data_to_embed)} logs into collection '{self.collection_name}'.")
+        if not self.partitioned:
+            self._upsert(self.collection_name, data_to_embed, payloads, ids)
+            return
 
-        ids = [generate_id(payload) for payload in payloads]
-        embeddings = generate_embeddings(data_to_embed)
+        now_ns = time.time_ns()
+        for day, indexes in sorted(route(payloads, now_ns).items()):
+            if QDRANT_RETENTION_DAYS > 0 and day < oldest_kept_day(QDRANT_RETENTION_DAYS, now_ns):
+                logger.info(f"Skipping {len(indexes)} logs from {day}, past the {QDRANT_RETENTION_DAYS} day retention.")
+                continue
+            collection_name = partition_name(self.collection_name, day)
+            if collection_name not in self._created_partitions:
+                self.create_collection(collection_name)
+                self._created_partitions.add(collection_name)
+            self._upsert(
+                collection_name,
+                [data_to_embed[i] for i in indexes],
+                [payloads[i] for i in indexes],
+                None if ids is None else [ids[i] for i in indexes],
+            )
 
-        points = [
-            {"id": ids[idx], "vector": embeddings[idx], "payload": payloads[idx]} for idx in range(len(data_to_embed))
-        ]
+    def _upsert(self, collection_name: str, data_to_embed: list, payloads: list, ids: list | None):
+        logger.info(f"Upserting {len(data_to_embed)} logs into collection '{collection_name}'.")
 
-        if points:
-            self.qdrant_client.upsert(collection_name=self.collection_name, points=points)
-            logger.info(f"Upserted {len(points)} logs into collection '{self.collection_name}'.")
+        if ids is None:
+            ids = [generate_id(payload) for payload in payloads]
+            data_to_embed, payloads, ids = self._drop_existing(collection_name, data_to_embed, payloads, ids)
+
+        # Each batch is uploaded as soon as it is embedded, while the pool works on the following batches.
+        with BulkUploader(self.qdrant_client, collection_name, on_uploaded=self.known_ids.add) as uploader:
+            embedded = 0
+            for embeddings in generate_embedding_batches(data_to_embed):
+                start, embedded = embedded, embedded + len(embeddings)
+                uploader.submit(ids[start:embedded], embeddings, payloads[start:embedded])
+
+        if uploader.uploaded:
+            logger.info(f"Upserted {uploader.uploaded} logs into collection '{collection_name}'.")
         else:
             logger.info("No new logs to insert.")
 
-    def search(self, query_text: str, limit: int = 5, collection_name: str | None = None) -> list:
+    def upsert_log_batch(self, batch: LogBatch):
+        """
+        Insert a batch of log lines into Qdrant.
+
+        With log templates enabled, lines are mined into templates and one point per touched template is
+        upserted, carrying its occurrence counts. Otherwise each line's message is embedded with its stream
+        labels as payload.
         """
-        Search in Qdrant.
+        if not LOG_TEMPLATES_ENABLED:
+            self.upsert(data_to_embed=batch.texts(), payloads=batch.payloads())
+            return
+
+        miner = get_template_miner()
+        templates = miner.add_batch(batch)
+        logger.info(f"Mined {len(batch)} log lines into {len(templates)} templates.")
+        self.upsert_templates(templates)
+        miner.prune()
+        # Saving writes every template, so it is done at most every LOG_TEMPLATES_SAVE_SECONDS and on close.
+        miner.save_if_due()
+
+    def upsert_templates(self, templates: list[LogTemplate]):
+        """
+        Insert or update one point per log template. The point id depends only on the template id, so later
+        occurrences update the same point.
+        """
+        self.upsert(
+            data_to_embed=[template.template for template in templates],
+            payloads=[template.payload() for template in templates],
+            ids=[generate_id({"template_id": template.id}) for template in templates],
+        )
+
+    def search(
+        self,
+        query_text: str | None = None,
+        limit: int = 5,
+        collection_name: str | None = None,
+        levels: list[str] | None = None,
+        services: list[str] | None = None,
+        job: str | None = None,
+        since_ns: int | None = None,
+        until_ns: int | None = None,
+        query_vector: Sequence[float] | np.ndarray | None = None,
+    ) -> list:
+        """
+        Search in Qdrant, optionally only among points matching the given payload filters.
+
+        With partitioning and no `collection_name`, only the partitions overlapping [since_ns, until_ns] are
+        searched and their results merged.
 
         Args:
             collection_name (str | None): The name of the collection to search in.
-            query_text (str): The query text to search for.
+            query_text (str | None): The query text to search for, embedded through the query vector cache.
             limit (int): The number of search results to return.
+            levels (list[str] | None): Only return logs at these levels, e.g. ["ERROR", "WARN"].
+            services (list[str] | None): Only return logs of these services.
+            job (str | None): Only return logs of this Loki job.
+            since_ns (int | None): Only return logs at or after this nanosecond timestamp.
+            until_ns (int | None): Only return logs at or before this nanosecond timestamp.
+            query_vector (Sequence[float] | np.ndarray | None): An already embedded query, used instead of
+                `query_text`.
         Returns:
             list: List of search results.
         """
-        logger.info(f"Searching for '{query_text}' in collection '{collection_name}'.")
-        if collection_name is None:
-            collection_name = self.collection_name
-        query_embedding = generate_embeddings([query_text])[0]
+        query = query_vector if query_vector is not None else query_text
+        if query is None:
+            raise ValueError("Either query_text or query_vector is required")
+        return self.search_batch(
+            [query],
+            limit=limit,
+            collection_name=collection_name,
+            levels=levels,
+            services=services,
+            job=job,
+            since_ns=since_ns,
+            until_ns=until_ns,
+        )[0]
 
-        search_results = self.qdrant_client.search(
-            collection_name=collection_name, query_vector=query_embedding, limit=limit, with_payload=True
-        )
+    def search_batch(
+        self,
+        queries: list[str | Sequence[float] | np.ndarray],
+        limit: int = 5,
+        collection_name: str | None = None,
+        levels: list[str] | None = None,
+        services: list[str] | None = None,
+        job: str | None = None,
+        since_ns: int | None = None,
+        until_ns: int | None = None,
+    ) -> list[list]:
+        """
+        Run several searches with the same filters, in one request per collection searched.
+
+        Each query is a text, embedded through the query vector cache, or an already embedded vector. The
+        other arguments are as for `search`. Returns the results of each query in order.
+        """
+        texts = [query for query in queries if isinstance(query, str)]
+        embedded = iter(get_query_vectors().get_many(texts))
+        vectors = [next(embedded) if isinstance(query, str) else _vector_to_list(query) for query in queries]
+        collections = [collection_name] if collection_name else self.collections(since_ns, until_ns)
+        logger.info(f"Searching for {texts or f'{len(queries)} vectors'} in collections {collections}.")
+        query_filter = build_log_filter(levels=levels, services=services, job=job, since_ns=since_ns, until_ns=until_ns)
+        requests = [
+            SearchRequest(
+                vector=vector,
+                filter=query_filter,
+                params=self.profile.search_params(),
+                limit=limit,
+                with_payload=True,
+            )
+            for vector in vectors
+        ]
+
+        search_results: list[list] = [[] for _ in queries]
+        for name in collections:
+            for results, batch_results in zip(
+                search_results, self.qdrant_client.search_batch(collection_name=name, requests=requests)
+            ):
+                results.extend(batch_results)
+        if len(collections) == 1:
+            return search_results
+        return [_merge_search_results(results, limit) for results in search_results]
+
+    def _drop_existing(
+        self, collection_name: str, data_to_embed: list, payloads: list, ids: list
+    ) -> tuple[list, list, list]:
+        """Keep the first occurrence of each id that is not stored yet."""
+        known = self.known_ids.contains(ids)
+        unknown = list(dict.fromkeys(_id for _id, is_known in zip(ids, known) if not is_known))
+        stored = set(self.get_existing_ids(unknown, collection_name=collection_name)) if unknown else set()
+        self.known_ids.add(stored)
 
-        return search_results
+        kept: tuple[list, list, list] = ([], [], [])
+        seen = set(stored)
+        for text, payload, _id, is_known in zip(data_to_embed, payloads, ids, known):
+            if is_known or _id in seen:
+                continue
+            seen.add(_id)
+            kept[0].append(text)
+            kept[1].append(payload)
+            kept[2].append(_id)
+        if len(kept[2]) < len(ids):
+            logger.info(f"Skipping {len(ids) - len(kept[2])} logs already in collection '{collection_name}'.")
+        return kept
 
-    def get_existing_ids(self, ids):
+    def get_existing_ids(
+        self, ids, batch_size: int = QDRANT_EXISTS_CHECK_BATCH_SIZE, collection_name: str | None = None
+    ):
         """
-        Check which IDs already exist in Qdrant.
+        Check which IDs already exist in Qdrant, with one retrieve request per `batch_size` ids.
         """
-        existing_ids = []
-        for _id in ids:
+        collection_name = collection_name or self.collection_name
+        existing_ids: list = []
+        for chunk in chunked(ids, batch_size):
             try:
-                res = self.qdrant_client.retrieve(collection_name=self.collection_name, ids=[_id])
-                if res:
-                    existing_ids.append(_id)
+                res = self.qdrant_client.retrieve(
+                    collection_name=collection_name, ids=chunk, with_payload=False, with_vectors=False
+                )
+                existing_ids.extend(point.id for point in res)
             except Exception as e:
-                logger.warning(f"Error checking ID {_id}: {e}")
-        logger.info(f"Found {len(existing_ids)} existing logs in collection '{self.collection_name}'.")
+                logger.warning(f"Error checking {len(chunk)} IDs: {e}")
+        logger.info(f"Found {len(existing_ids)} existing logs in collection '{collection_name}'.")
         return existing_ids
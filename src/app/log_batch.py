@@ -0,0 +1,166 @@
+"""log_batch.py
+
+Columnar storage for batches of log lines."""
+
+from array import array
+from typing import Iterable, Iterator
+
+import numpy as np
+import numpy.typing as npt
+
+from app.connectors import LokiEntry
+
+
+def _to_list(column: npt.NDArray[np.integer]) -> list[int]:
+    """Convert a one-dimensional integer column to Python ints in one pass."""
+    return column.tolist()  # type: ignore[return-value]
+
+
+class LogBatch:
+    """
+    A batch of log lines stored as columns.
+
+    - `timestamps`: int64 nanosecond timestamps.
+    - `stream_ids`: int32 indexes into `streams`, the interned stream label dicts.
+    - `starts` / `ends`: byte offsets of each message in `buffer`, one contiguous UTF-8 buffer.
+
+    Slicing returns a view that shares every column and the buffer. Filtering copies only the small
+    index columns. Messages are decoded on access.
+    """
+
+    def __init__(
+        self,
+        timestamps: np.ndarray,
+        stream_ids: np.ndarray,
+        starts: np.ndarray,
+        ends: np.ndarray,
+        buffer: bytes,
+        streams: list[dict],
+    ):
+        self.timestamps = timestamps
+        self.stream_ids = stream_ids
+        self.starts = starts
+        self.ends = ends
+        self.buffer = buffer
+        self.streams = streams
+
+    @classmethod
+    def from_entries(cls, entries: Iterable[LokiEntry]) -> "LogBatch":
+        """Build a batch from Loki entries, interning identical stream labels."""
+        timestamps = array("q")
+        stream_ids = array("i")
+        offsets = array("q", [0])
+        buffer = bytearray()
+        streams: list[dict] = []
+        ids_by_labels: dict[tuple, int] = {}
+        # Entries of one Loki stream share a labels dict, so most lookups hit this cache. The dicts are kept
+        # alive in `seen` while building so their ids cannot be reused.
+        ids_by_object: dict[int, int] = {}
+        seen: list[dict] = []
+
+        for entry in entries:
+            stream_id = ids_by_object.get(id(entry.stream))
+            if stream_id is None:
+                key = tuple(sorted(entry.stream.items()))
+                stream_id = ids_by_labels.get(key)
+                if stream_id is None:
+                    stream_id = ids_by_labels[key] = len(streams)
+                    streams.append(entry.stream)
+                ids_by_object[id(entry.stream)] = stream_id
+                seen.append(entry.stream)
+
+            timestamps.append(entry.timestamp)
+            stream_ids.append(stream_id)
+            buffer += entry.line.encode("utf-8")
+            offsets.append(len(buffer))
+
+        offsets_array = np.frombuffer(offsets, dtype=np.int64)
+        return cls(
+            timestamps=np.frombuffer(timestamps, dtype=np.int64),
+            stream_ids=np.frombuffer(stream_ids, dtype=np.int32),
+            starts=offsets_array[:-1],
+            ends=offsets_array[1:],
+            buffer=bytes(buffer),
+            streams=streams,
+        )
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def __getitem__(self, index: int | slice) -> "LogBatch | LokiEntry":
+        if isinstance(index, slice):
+            return self._select(index)
+        i = range(len(self))[index]
+        return LokiEntry(int(self.timestamps[i]), self.message(i), self.streams[self.stream_ids[i]])
+
+    def __iter__(self) -> Iterator[LokiEntry]:
+        for timestamp, stream_id, message in zip(_to_list(self.timestamps), _to_list(self.stream_ids), self.messages()):
+            yield LokiEntry(timestamp, message, self.streams[stream_id])
+
+    def _select(self, index: slice | np.ndarray) -> "LogBatch":
+        return LogBatch(
+            timestamps=self.timestamps[index],
+            stream_ids=self.stream_ids[index],
+            starts=self.starts[index],
+            ends=self.ends[index],
+            buffer=self.buffer,
+            streams=self.streams,
+        )
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the columns and the message buffer."""
+        columns = self.timestamps.nbytes + self.stream_ids.nbytes + self.starts.nbytes + self.ends.nbytes
+        return columns + len(self.buffer)
+
+    def message(self, i: int) -> str:
+        start, end = int(self.starts[i]), int(self.ends[i])
+        return self.buffer[start:end].decode("utf-8")
+
+    def messages(self) -> Iterator[str]:
+        buffer = self.buffer
+        for start, end in zip(_to_list(self.starts), _to_list(self.ends)):
+            yield buffer[start:end].decode("utf-8")
+
+    def filter(self, level: str | None = None, service: str | None = None) -> "LogBatch":
+        """Keep only lines whose stream matches the given level and/or service."""
+        matches = np.array(
+            [
+                (level is None or str(labels.get("level", "")).upper() == level.upper())
+                and (service is None or labels.get("service") == service)
+                for labels in self.streams
+            ],
+            dtype=bool,
+        )
+        if not len(matches):
+            return self
+        return self._select(np.flatnonzero(matches[self.stream_ids]))
+
+    def sort(self, reverse: bool = False) -> "LogBatch":
+        """Return the lines ordered by timestamp."""
+        order = np.argsort(self.timestamps, kind="stable")
+        return self._select(order[::-1] if reverse else order)
+
+    def texts(self) -> list[str]:
+        """The text to embed for each line: the parsed `message` label if present, else the raw line."""
+        return [
+            self.streams[stream_id].get("message", message)
+            for stream_id, message in zip(_to_list(self.stream_ids), self.messages())
+        ]
+
+    def labels(self) -> list[dict]:
+        """The stream labels of each line, shared between lines of the same stream."""
+        return [self.streams[stream_id] for stream_id in _to_list(self.stream_ids)]
+
+    def payloads(self) -> list[dict]:
+        """The stream labels of each line with its nanosecond timestamp as `ts`."""
+        return [
+            {**self.streams[stream_id], "ts": timestamp}
+            for stream_id, timestamp in zip(_to_list(self.stream_ids), _to_list(self.timestamps))
+        ]
+
+    def formatted(self) -> Iterator[str]:
+        """Lines prefixed with their level and service, as shown to the LLM."""
+        prefixes = [f"[{labels.get('level', 'INFO')}] {labels.get('service', 'unknown')}: " for labels in self.streams]
+        for stream_id, message in zip(_to_list(self.stream_ids), self.messages()):
+            yield prefixes[stream_id] + message
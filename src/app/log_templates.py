@@ -0,0 +1,361 @@
+"""log_templates.py
+
+Online log template mining (Drain), so repeated log lines are stored and analysed once per template."""
+
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from contextlib import suppress
+from typing import Any, Iterable
+
+from app.log_batch import LogBatch
+from app.settings import (
+    LOG_TEMPLATES_DEPTH,
+    LOG_TEMPLATES_FILE_PATH,
+    LOG_TEMPLATES_MAX_AGE_DAYS,
+    LOG_TEMPLATES_MAX_CHILDREN,
+    LOG_TEMPLATES_MAX_COUNT,
+    LOG_TEMPLATES_SAVE_SECONDS,
+    LOG_TEMPLATES_SIMILARITY,
+)
+
+logger = logging.getLogger(__name__)
+
+PARAM = "<*>"
+
+# Tokens that are a variable as a whole: UUIDs, IPs with optional port, hex ids and numbers with an optional unit.
+_PARAM_TOKEN = re.compile(
+    r"[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}"
+    r"|\d{1,3}(\.\d{1,3}){3}(:\d+)?"
+    r"|(0x)?[0-9a-fA-F]*\d[0-9a-fA-F]*"
+    r"|[-+]?\d+([.,:]\d+)*(ms|s|m|h|%|[kKMG]i?B)?"
+)
+_PUNCTUATION = "\"'()[]{},;"
+
+
+def tokenize(message: str) -> tuple[list[str], list[str]]:
+    """Split a line on whitespace. Returns the raw tokens and the tokens with obvious variables masked."""
+    raw_tokens = message.split()
+    return raw_tokens, [PARAM if _PARAM_TOKEN.fullmatch(token.strip(_PUNCTUATION)) else token for token in raw_tokens]
+
+
+class LogTemplate:
+    """A log template with its occurrence statistics."""
+
+    __slots__ = ("id", "group", "tokens", "count", "first_seen", "last_seen", "labels", "example")
+
+    def __init__(
+        self,
+        id: int,
+        group: tuple,
+        tokens: list[str],
+        count: int = 0,
+        first_seen: int | None = None,
+        last_seen: int | None = None,
+        labels: dict | None = None,
+        example: str = "",
+    ):
+        self.id = id
+        self.group = group
+        self.tokens = tokens
+        self.count = count
+        self.first_seen = first_seen
+        self.last_seen = last_seen
+        self.labels = labels or {}
+        self.example = example
+
+    @property
+    def template(self) -> str:
+        return " ".join(self.tokens)
+
+    def parameters(self, tokens: list[str]) -> list[str]:
+        """The values of the template's variable tokens in a matching line."""
+        return [token for template_token, token in zip(self.tokens, tokens) if template_token == PARAM]
+
+    def observe(self, timestamp: int, labels: dict, message: str) -> None:
+        self.count += 1
+        if self.first_seen is None or timestamp < self.first_seen:
+            self.first_seen = timestamp
+        if self.last_seen is None or timestamp >= self.last_seen:
+            self.last_seen = timestamp
+            self.labels = labels
+            self.example = message
+
+    def payload(self) -> dict:
+        """Qdrant payload: the labels of the latest line, with the template in place of the message."""
+        return {
+            **self.labels,
+            "message": self.template,
+            "template": self.template,
+            "template_id": self.id,
+            "count": self.count,
+            "first_seen": self.first_seen,
+            "last_seen": self.last_seen,
+            "ts": self.last_seen,
+            "example": self.example,
+        }
+
+    def to_dict(self) -> dict:
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "LogTemplate":
+        return cls(**{**data, "group": tuple(data["group"])})
+
+
+class TemplateMiner:
+    """
+    Drain log parser: a fixed-depth tree routes each line by (group, token count, leading tokens) to a few
+    candidate templates, and the line joins the most similar one or starts a new template.
+
+    Tokens that look like numbers, ids or addresses are treated as variables up front. Differing tokens of
+    lines joining a template become `<*>`, so a template only gets more general over time. Template ids are
+    stable, never reused, and can be persisted with `save`. `prune` drops templates not seen for a while, so
+    the state stays bounded.
+
+    Args:
+        depth (int): Tree depth; lines are routed on their first `depth - 2` tokens.
+        similarity (float): Minimum share of matching constant tokens to join a template.
+        max_children (int): Maximum distinct tokens per tree node before routing through `<*>`.
+        max_templates (int): Templates kept by `prune`, the most recently seen first. 0 keeps them all.
+        max_age_days (int): Days since a template was last seen before `prune` drops it. 0 keeps them all.
+    """
+
+    def __init__(
+        self,
+        depth: int = LOG_TEMPLATES_DEPTH,
+        similarity: float = LOG_TEMPLATES_SIMILARITY,
+        max_children: int = LOG_TEMPLATES_MAX_CHILDREN,
+        max_templates: int = LOG_TEMPLATES_MAX_COUNT,
+        max_age_days: int = LOG_TEMPLATES_MAX_AGE_DAYS,
+    ):
+        self.depth = depth
+        self.similarity = similarity
+        self.max_children = max_children
+        self.max_templates = max_templates
+        self.max_age_days = max_age_days
+        self.templates: dict[int, LogTemplate] = {}
+        self._tree: dict[Any, Any] = {}
+        self._next_id = 1
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._saved_at = time.monotonic()
+
+    def _leaf(self, group: tuple, tokens: list[str]) -> list[int]:
+        node = self._tree.setdefault((group, len(tokens)), {})
+        for token in tokens[: max(self.depth - 2, 0)]:
+            key = PARAM if token == PARAM or any(c.isdigit() for c in token) else token
+            if key not in node and len(node) >= self.max_children:
+                key = PARAM
+            node = node.setdefault(key, {})
+        return node.setdefault(None, [])
+
+    def _insert(self, template: LogTemplate) -> None:
+        """Add a restored template to the tree."""
+        self.templates[template.id] = template
+        # Route by a line that matched the template: its leading tokens may since have become `<*>`.
+        _, tokens = tokenize(template.example)
+        self._leaf(template.group, tokens if len(tokens) == len(template.tokens) else template.tokens).append(
+            template.id
+        )
+        self._next_id = max(self._next_id, template.id + 1)
+
+    def _score(self, template: LogTemplate, tokens: list[str]) -> tuple[float, int]:
+        if not tokens:
+            return 1.0, 0
+        same = params = 0
+        for template_token, token in zip(template.tokens, tokens):
+            if template_token == PARAM:
+                params += 1
+            elif template_token == token:
+                same += 1
+        return same / len(tokens), params
+
+    def add(
+        self, message: str, timestamp: int, group: tuple = (), labels: dict | None = None
+    ) -> tuple[LogTemplate, list[str]]:
+        """
+        Add one line.
+
+        Returns:
+            tuple[LogTemplate, list[str]]: The template the line belongs to and the line's parameter values.
+        """
+        raw_tokens, tokens = tokenize(message)
+        with self._lock:
+            leaf = self._leaf(group, tokens)
+            best: LogTemplate | None = None
+            best_score = (-1.0, 0)
+            for template_id in leaf:
+                candidate = self.templates[template_id]
+                score = self._score(candidate, tokens)
+                if score > best_score:
+                    best, best_score = candidate, score
+
+            if best is None or best_score[0] < self.similarity:
+                best = LogTemplate(id=self._next_id, group=group, tokens=tokens)
+                self._next_id += 1
+                self.templates[best.id] = best
+                leaf.append(best.id)
+            else:
+                best.tokens = [t if t == token else PARAM for t, token in zip(best.tokens, tokens)]
+            best.observe(timestamp, labels or {}, message)
+        return best, best.parameters(raw_tokens)
+
+    def add_batch(self, batch: LogBatch) -> list[LogTemplate]:
+        """Add every line of a batch, grouped by job, service and level. Returns the templates touched."""
+        touched: dict[int, LogTemplate] = {}
+        for timestamp, text, labels in zip(batch.timestamps.tolist(), batch.texts(), batch.labels()):
+            group = (labels.get("job", ""), labels.get("service", ""), str(labels.get("level", "")).upper())
+            template, _ = self.add(str(text), int(timestamp), group, labels)
+            touched[template.id] = template
+        return list(touched.values())
+
+    def prune(self, now_ns: int | None = None) -> int:
+        """
+        Drop templates last seen more than `max_age_days` ago, then the least recently seen ones above
+        `max_templates`. A dropped template that shows up again starts over with a new id.
+
+        Returns:
+            int: The number of templates dropped.
+        """
+        now_ns = time.time_ns() if now_ns is None else now_ns
+        with self._lock:
+            kept = sorted(self.templates.values(), key=lambda template: template.last_seen or 0, reverse=True)
+            if self.max_age_days:
+                cutoff_ns = now_ns - self.max_age_days * 24 * 60 * 60 * 10**9
+                kept = [template for template in kept if (template.last_seen or 0) >= cutoff_ns]
+            if self.max_templates:
+                kept = kept[: self.max_templates]
+            dropped = len(self.templates) - len(kept)
+            if dropped:
+                self.templates, self._tree = {}, {}
+                for template in sorted(kept, key=lambda template: template.id):
+                    self._insert(template)
+        if dropped:
+            logger.info(f"Pruned {dropped} stale log templates, {len(kept)} left.")
+        return dropped
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "next_id": self._next_id,
+                "templates": [template.to_dict() for template in self.templates.values()],
+            }
+
+    @classmethod
+    def from_dict(cls, data: dict, **kwargs) -> "TemplateMiner":
+        miner = cls(**kwargs)
+        for item in data.get("templates", []):
+            miner._insert(LogTemplate.from_dict(item))
+        # Ids of pruned templates are not handed out again: their points may still be in Qdrant.
+        miner._next_id = max(miner._next_id, int(data.get("next_id", 1)))
+        return miner
+
+    def save(self, path: str = LOG_TEMPLATES_FILE_PATH) -> None:
+        """
+        Write the templates to `path` atomically. Each save writes its own temporary file, and saves are
+        serialised so the file never goes back to an older state.
+        """
+        directory = os.path.dirname(path) or "."
+        tmp_path = None
+        with self._save_lock:
+            self._saved_at = time.monotonic()
+            state = self.to_dict()
+            try:
+                os.makedirs(directory, exist_ok=True)
+                with tempfile.NamedTemporaryFile(
+                    "w", dir=directory, prefix=f"{os.path.basename(path)}.", suffix=".tmp", delete=False
+                ) as f:
+                    tmp_path = f.name
+                    json.dump(state, f)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                logger.error(f"Failed to save log templates to {path}: {e}")
+                if tmp_path is not None:
+                    with suppress(OSError):
+                        os.remove(tmp_path)
+
+    def save_if_due(
+        self, path: str = LOG_TEMPLATES_FILE_PATH, interval_seconds: float = LOG_TEMPLATES_SAVE_SECONDS
+    ) -> bool:
+        """Save if `interval_seconds` have passed since the last save. Returns True if it saved."""
+        if time.monotonic() - self._saved_at < interval_seconds:
+            return False
+        self.save(path)
+        return True
+
+    @classmethod
+    def load(cls, path: str = LOG_TEMPLATES_FILE_PATH) -> "TemplateMiner":
+        try:
+            with open(path, "r") as f:
+                return cls.from_dict(json.load(f))
+        except FileNotFoundError:
+            return cls()
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Could not read log templates from {path}, starting fresh: {e}")
+            return cls()
+
+
+_miner: TemplateMiner | None = None
+_miner_lock = threading.Lock()
+
+
+def get_template_miner() -> TemplateMiner:
+    """Return the process-wide template miner, restored from disk on first use."""
+    global _miner
+    with _miner_lock:
+        if _miner is None:
+            _miner = TemplateMiner.load()
+            logger.info(f"Loaded {len(_miner.templates)} log templates.")
+        return _miner
+
+
+def save_template_miner() -> None:
+    """Save the process-wide template miner, if it has been used."""
+    with _miner_lock:
+        miner = _miner
+    if miner is not None:
+        miner.save()
+
+
+def format_template(labels: dict, template: str, count: int) -> str:
+    """One prompt line for a template: "[level] service: template (xN)"."""
+    line = f"[{labels.get('level', 'INFO')}] {labels.get('service', 'unknown')}: {template}"
+    return f"{line} (x{count})" if count > 1 else line
+
+
+def summarise_batch(batch: LogBatch) -> list[dict]:
+    """
+    Collapse a batch into one entry per template, in order of last occurrence.
+
+    Returns:
+        list[dict]: {"full": prompt line with the count, "message": the latest matching line, "count": int}.
+    """
+    templates = TemplateMiner().add_batch(batch)
+    templates.sort(key=lambda template: template.last_seen or 0)
+    return [
+        {
+            "full": format_template(template.labels, template.template, template.count),
+            "message": template.example,
+            "count": template.count,
+        }
+        for template in templates
+    ]
+
+
+def format_points(points: Iterable) -> list[str]:
+    """Prompt lines for vector search results, using template counts when the payload has them."""
+    lines = []
+    for point in points:
+        payload = getattr(point, "payload", None) or {}
+        if "template" in payload:
+            lines.append(format_template(payload, payload["template"], int(payload.get("count", 1))))
+        elif payload:
+            lines.append(format_template(payload, str(payload.get("message", "")), 1))
+        else:
+            lines.append(str(point))
+    return lines
@@ -3,19 +3,27 @@
 Main FastAPI entrypoint
 """
 
+import asyncio
 import logging
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, status
 from fastapi.openapi.docs import get_swagger_ui_html
-from fastapi.responses import RedirectResponse
+from fastapi.responses import JSONResponse, RedirectResponse
 from fastapi.staticfiles import StaticFiles
 
+from app.database.processors import (
+    embedder_ready,
+    get_embedder,
+    shutdown_embedding_pool,
+)
+from app.database.query_vectors import get_query_vectors
 from app.logger import set_logging
 from app.routers.bugs import router as bugs_router
 from app.routers.config import router as config_router
 from app.routers.investigation import router as investigation_router
-from app.settings import APP_TITLE
+from app.routers.reports import router as reports_router
+from app.settings import APP_TITLE, EMBEDDER_EAGER_LOAD
 from app.startup import preprocess
 
 set_logging()
@@ -30,19 +38,33 @@ async def lifespan(app: FastAPI):
     logger.info("FastAPI startup: Running setup.")
     preprocess(app)
 
+    if EMBEDDER_EAGER_LOAD:
+        logger.info("FastAPI startup: Loading embedding model")
+        await asyncio.to_thread(get_embedder().load)
+        await asyncio.to_thread(get_query_vectors().precompute)
+
     # Start the scheduler
     logger.info("FastAPI startup: Starting report scheduler")
     await app.state.scheduler.start()
     logger.info("FastAPI startup: Report scheduler started")
+    if app.state.tail_ingestor is not None:
+        await app.state.tail_ingestor.start()
     yield
 
+    if app.state.tail_ingestor is not None:
+        await app.state.tail_ingestor.stop()
+
     # Stop the  scheduler
     logger.info("FastAPI shutdown: Stopping report scheduler")
     await app.state.scheduler.stop()
     logger.info("FastAPI shutdown: Report scheduler stopped")
 
+    shutdown_embedding_pool()
+    if app.state.qdrant_client is not None:
+        app.state.qdrant_client.close()
+
 
-routes = [config_router, bugs_router, investigation_router]
+routes = [config_router, bugs_router, investigation_router, reports_router]
 
 app = FastAPI(docs_url=None, redoc_url=None, title=APP_TITLE, lifespan=lifespan)
 for r in routes:
@@ -60,6 +82,14 @@ def health_controller():
     return {"status": "Healthy"}
 
 
+@app.get("/ready")
+def readiness_controller():
+    """Ready once the embedding model is loaded."""
+    if embedder_ready():
+        return {"status": "Ready"}
+    return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content={"status": "Loading"})
+
+
 @app.get("/", include_in_schema=False)
 def docs_redirect_controller():
     return RedirectResponse(url="/docs", status_code=status.HTTP_303_SEE_OTHER)
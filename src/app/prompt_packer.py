@@ -0,0 +1,216 @@
+"""prompt_packer.py
+
+Fit log lines into a prompt under a token budget. Identical lines are merged with their counts, and when the
+lines do not all fit, the most severe and most recent are kept.
+"""
+
+import math
+import re
+import threading
+from typing import Any, Iterable, NamedTuple
+
+from app.connectors import LokiEntry
+from app.log_batch import LogBatch
+from app.log_templates import TemplateMiner, format_template
+from app.settings import (
+    LOG_TEMPLATES_ENABLED,
+    MODEL_CONTEXT_TOKENS,
+    OPENAI_MODEL,
+    PROMPT_MAX_TOKENS,
+)
+
+# Context size of models missing from `MODEL_CONTEXT_TOKENS`.
+DEFAULT_CONTEXT_TOKENS = 8192
+# Tokens of framing OpenAI adds per message.
+TOKENS_PER_MESSAGE = 4
+# Tokens kept for the line saying how many lines were left out.
+OMITTED_LINE_TOKENS = 16
+
+SEVERITY = {"FATAL": 0, "CRITICAL": 0, "ERROR": 1, "WARN": 2, "WARNING": 2, "INFO": 3, "DEBUG": 4, "TRACE": 5}
+
+_LEVEL_PATTERN = re.compile(r"\b(FATAL|CRITICAL|ERROR|WARN(?:ING)?|INFO|DEBUG|TRACE)\b", re.IGNORECASE)
+# The pieces BPE tokenizers split text into before merging: letter runs, up to three digits, single symbols.
+_PIECE_PATTERN = re.compile(r"[A-Za-z]+|\d{1,3}|[^\sA-Za-z\d]")
+
+
+def severity(level: str | None) -> int:
+    """Rank of a log level, 0 being the most severe. Unknown levels rank with INFO."""
+    return SEVERITY.get((level or "INFO").upper(), SEVERITY["INFO"])
+
+
+class PromptLine(NamedTuple):
+    """A log line to pack: its text without a count, level, nanosecond timestamp and number of occurrences."""
+
+    text: str
+    level: str = "INFO"
+    ts: int = 0
+    occurrences: int = 1
+
+    def render(self) -> str:
+        return f"{self.text} (x{self.occurrences})" if self.occurrences > 1 else self.text
+
+
+class TokenCounter:
+    """
+    Estimate of the tokens of a text under OpenAI's tokenizers, without loading one.
+
+    Text is split into the pieces the tokenizers split on, letter runs counting one token per six letters.
+    `observe` scales the estimate by the ratio of the prompt tokens the API reports to the estimate of the same
+    prompt, so it calibrates itself on the logs actually sent.
+    """
+
+    def __init__(self, ratio: float = 1.0, smoothing: float = 0.2):
+        self.ratio = ratio
+        self.smoothing = smoothing
+        self._lock = threading.Lock()
+
+    def count(self, text: str) -> int:
+        pieces = _PIECE_PATTERN.findall(text)
+        return math.ceil(sum(1 + (len(piece) - 1) // 6 for piece in pieces) * self.ratio)
+
+    def count_messages(self, messages: list) -> int:
+        return sum(self.count(str(message.get("content", ""))) + TOKENS_PER_MESSAGE for message in messages)
+
+    def observe(self, estimated: int, actual: int) -> None:
+        """Calibrate on a prompt estimated at `estimated` tokens that the API counted as `actual`."""
+        if estimated <= 0 or actual <= 0:
+            return
+        with self._lock:
+            ratio = self.ratio * actual / estimated
+            self.ratio = min(4.0, max(0.25, (1 - self.smoothing) * self.ratio + self.smoothing * ratio))
+
+
+_counters: dict[str, TokenCounter] = {}
+_counters_lock = threading.Lock()
+
+
+def get_token_counter(model: str = OPENAI_MODEL) -> TokenCounter:
+    """Return the process-wide token counter of a model, calibrated by its responses."""
+    with _counters_lock:
+        if model not in _counters:
+            _counters[model] = TokenCounter()
+        return _counters[model]
+
+
+def prompt_budget(model: str, max_tokens: int, *fixed: str) -> int:
+    """
+    Tokens left for packed lines in a call to `model`: its context minus the `max_tokens` reserved for the
+    response, capped at `PROMPT_MAX_TOKENS`, minus the fixed parts of the prompt such as the system message.
+    """
+    counter = get_token_counter(model)
+    context = MODEL_CONTEXT_TOKENS.get(model, DEFAULT_CONTEXT_TOKENS)
+    fixed_tokens = sum(counter.count(text) + TOKENS_PER_MESSAGE for text in fixed)
+    return max(0, min(context - max_tokens, PROMPT_MAX_TOKENS) - fixed_tokens)
+
+
+def _truncate(text: str, tokens: int, max_tokens: int) -> str:
+    return text[: max(1, len(text) * max_tokens // tokens)] + "..."
+
+
+def pack(lines: Iterable[PromptLine], budget: int, model: str = OPENAI_MODEL) -> list[str]:
+    """
+    Rendered lines fitting in `budget` tokens, oldest first.
+
+    Lines with the same text are merged, adding up their counts. Merged lines are taken by severity, then
+    recency, until the budget is spent; lines longer than a tenth of the budget are cut short so one stack
+    trace cannot take all of it. A last line says how many lines were left out.
+    """
+    counter = get_token_counter(model)
+    merged: dict[str, PromptLine] = {}
+    for line in lines:
+        seen = merged.get(line.text)
+        if seen is not None:
+            level = seen.level if severity(seen.level) <= severity(line.level) else line.level
+            line = PromptLine(line.text, level, max(seen.ts, line.ts), seen.occurrences + line.occurrences)
+        merged[line.text] = line
+
+    ranked = sorted(merged.values(), key=lambda line: (severity(line.level), -line.ts))
+    line_cap = max(budget // 10, 32)
+    available = budget - OMITTED_LINE_TOKENS
+    kept: list[tuple[int, str]] = []
+    omitted = 0
+    for line in ranked:
+        text = line.render()
+        tokens = counter.count(text)
+        if tokens > line_cap:
+            text = _truncate(text, tokens, line_cap)
+            tokens = line_cap
+        if tokens + 1 > available:
+            omitted += line.occurrences
+            continue
+        available -= tokens + 1
+        kept.append((line.ts, text))
+
+    packed = [text for _, text in sorted(kept, key=lambda item: item[0])]
+    if omitted:
+        packed.append(f"... {omitted} less severe or older lines left out")
+    return packed
+
+
+def _level_of(text: str) -> str:
+    match = _LEVEL_PATTERN.search(text)
+    return match.group(1).upper() if match else "INFO"
+
+
+def _line_of(log: Any, index: int) -> PromptLine:
+    """One prompt line for a Loki entry, vector search result, dict or string, timed by `index` if undated."""
+    if isinstance(log, LokiEntry):
+        level = log.stream.get("level", "INFO")
+        return PromptLine(format_template(log.stream, log.line, 1), level, log.timestamp)
+    payload = getattr(log, "payload", None)
+    if payload:
+        text = format_template(payload, str(payload.get("template", payload.get("message", ""))), 1)
+        return PromptLine(
+            text, payload.get("level", "INFO"), int(payload.get("ts", index)), int(payload.get("count", 1))
+        )
+    if isinstance(log, dict) and "message" in log:
+        text = str(log.get("full", log["message"]))
+        return PromptLine(
+            text, log.get("level") or _level_of(text), int(log.get("ts", index)), int(log.get("count", 1))
+        )
+    if isinstance(log, (list, tuple)):
+        text = ",".join(str(value) for value in log)
+    else:
+        text = str(log)
+    return PromptLine(text, _level_of(text), index)
+
+
+def to_prompt_lines(logs: Any) -> list[PromptLine]:
+    """
+    Prompt lines of a `LogBatch`, one per template if `LOG_TEMPLATES_ENABLED`, of a text, or of a list of Loki
+    entries, Loki streams, vector search results, dicts, rows or strings. Undated lines count as newer the later
+    they come.
+    """
+    if isinstance(logs, LogBatch):
+        if LOG_TEMPLATES_ENABLED:
+            return [
+                PromptLine(
+                    format_template(template.labels, template.template, 1),
+                    template.labels.get("level", "INFO"),
+                    template.last_seen or 0,
+                    template.count,
+                )
+                for template in TemplateMiner().add_batch(logs)
+            ]
+        return [
+            PromptLine(text, payload.get("level", "INFO"), payload["ts"])
+            for text, payload in zip(logs.formatted(), logs.payloads())
+        ]
+
+    if isinstance(logs, str):
+        logs = logs.splitlines()
+    lines: list[PromptLine] = []
+    for log in logs or []:
+        if isinstance(log, dict) and "values" in log and "stream" in log:
+            lines.extend(
+                PromptLine(format_template(log["stream"], message, 1), log["stream"].get("level", "INFO"), int(ts))
+                for ts, message in log["values"]
+            )
+        else:
+            lines.append(_line_of(log, len(lines)))
+    return lines
+
+
+def pack_logs(logs: Any, budget: int, model: str = OPENAI_MODEL) -> str:
+    """The prompt text of `logs` packed into `budget` tokens, one line per log line."""
+    return "\n".join(pack(to_prompt_lines(logs), budget, model))
@@ -2,6 +2,9 @@
 
 Contains the prompts for the Dingus chatbot."""
 
+from app.prompt_packer import pack_logs, prompt_budget
+from app.settings import OPENAI_MODEL
+
 PROMPT_PREFIX = """
 You are a debugging expert. Analyse the logs and k8 infrastructure to report back
 on anything interesting related to the user question.\n
@@ -25,12 +28,16 @@ Structure your response like the example below, where you are to fill in the <CO
 """
 
 
-def get_sre_analysis_prompt(logs, pod_health_data):
-    return f"""
+def get_sre_analysis_prompt(logs, pod_health_data, model: str = OPENAI_MODEL, max_tokens: int = 4000):
+    """The report prompt, with the logs packed into the tokens left by the rest and the `max_tokens` response."""
+    pod_health = str(pod_health_data)
+    prompt = """
     Analyze these logs and pod health data to create a comprehensive SRE report:\n\n
-    Logs: <LOGS>\n{str(logs)}\n</LOGS>\n\n
-    Pod Health Data: <POD_HEALTH_DATA>\n{str(pod_health_data)}\n</POD_HEALTH_DATA>
+    Logs: <LOGS>\n{logs}\n</LOGS>\n\n
+    Pod Health Data: <POD_HEALTH_DATA>\n{pod_health}\n</POD_HEALTH_DATA>
     """
+    budget = prompt_budget(model, max_tokens, SRE_REPORT_PROMPT, prompt, pod_health)
+    return prompt.format(logs=pack_logs(logs, budget, model), pod_health=pod_health)
 
 
 SRE_REPORT_PROMPT = """
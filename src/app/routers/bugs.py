@@ -1,4 +1,3 @@
-import asyncio
 import json
 import logging
 import os
@@ -38,7 +37,7 @@ def list_bugs():
 
 
 @router.post("/scan")
-def scan(payload: dict):
+async def scan(payload: dict):
     """Trigger a Scan for bugs (manual log scan)."""
     try:
         loki_base_url = payload.get("loki_base_url")
@@ -48,9 +47,10 @@ def scan(payload: dict):
         log_limit = payload.get("log_limit", 100)
 
         scanner = LogScanner(loki_base_url, job_name, open_ai_api_key, kube_config_path, log_limit)
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        loop.run_until_complete(scanner.run_once())
+        try:
+            await scanner.run_once()
+        finally:
+            await scanner.aclose()
         return {"status": "success"}
     except Exception as e:
         return JSONResponse(status_code=500, content={"status": "fail", "reason": str(e)})
@@ -7,9 +7,11 @@ from datetime import datetime, timedelta
 from fastapi import APIRouter, Request
 from fastapi.responses import JSONResponse
 
+from app.cache import cache_stats
 from app.connectors import fetch_loki_logs
 from app.tools.k8_client import KubernetesClient
 from app.tools.llm_client import OpenAIChatClient
+from app.tools.loki_tail import LokiTailIngestor
 
 logger = logging.getLogger(__name__)
 
@@ -35,6 +37,13 @@ async def update_config(payload: dict, request: Request):
             open_ai_api_key=payload["open_ai_api_key"],
             kube_config_path=payload["kube_config_path"],
         )
+        if getattr(app.state, "tail_ingestor", None) is not None:
+            await app.state.tail_ingestor.stop()
+            app.state.tail_ingestor = LokiTailIngestor(
+                loki_base_url=payload["loki_base_url"], job_name=payload["job_name"]
+            )
+            app.state.scheduler.tail_ingestor = app.state.tail_ingestor
+            await app.state.tail_ingestor.start()
         return {"status": "success"}
     else:
         return JSONResponse(status_code=500, content={"status": "fail", "reason": "Scheduler not initialized"})
@@ -116,3 +125,9 @@ def check_openai(payload: dict):
             return JSONResponse(status_code=400, content={"status": "fail", "reason": "Invalid API key"})
     except Exception as e:
         return JSONResponse(status_code=400, content={"status": "fail", "reason": str(e)})
+
+
+@router.get("/cache_stats")
+def get_cache_stats():
+    """Return hit/miss counters of the in-process caches."""
+    return {"status": "success", "caches": cache_stats()}
@@ -3,15 +3,17 @@
 Router for handling investigation endpoints.
 """
 
+import asyncio
 import json
 import logging
 import os
 from typing import Any
 
 from fastapi import APIRouter, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 
 from app.tools.investigation_agent import InvestigationAgent
+from app.utils import sse_event
 
 router = APIRouter(tags=["Investigation"])
 logger = logging.getLogger(__name__)
@@ -19,6 +21,49 @@ logger = logging.getLogger(__name__)
 INVESTIGATIONS_DIR = "/data/investigations/"
 
 
+def _create_agent(request: Request) -> InvestigationAgent:
+    # Optionally set runtime API key/model for the agent from app.state.config
+    agent = InvestigationAgent()
+    try:
+        cfg = getattr(request.app.state, "config", {})
+        if cfg and cfg.get("open_ai_api_key"):
+            agent.llm_client.client.api_key = cfg.get("open_ai_api_key")  # type: ignore[attr-defined]
+            agent.llm_client.async_client.api_key = cfg.get("open_ai_api_key")  # type: ignore[attr-defined]
+    except Exception:
+        pass
+    return agent
+
+
+def _save_investigation(investigation_result: dict[str, Any], bug_filename: str | None) -> str:
+    """Save an investigation result and link it from its bug file; return the investigation ID."""
+    # Save investigation result
+    investigation_id = investigation_result["investigation_id"]
+    filename = f"{investigation_id}.json"
+    filepath = os.path.join(INVESTIGATIONS_DIR, filename)
+
+    with open(filepath, "w") as f:
+        json.dump(investigation_result, f, indent=2)
+
+    # Try to update the bug file with the investigation ID
+    try:
+        if bug_filename:
+            bug_filepath = os.path.join("/data/bugs/", bug_filename)
+            if os.path.exists(bug_filepath):
+                with open(bug_filepath, "r") as f:
+                    bug_data = json.load(f)
+
+                # Add investigation ID to bug data
+                bug_data["investigation_id"] = investigation_id
+
+                with open(bug_filepath, "w") as f:
+                    json.dump(bug_data, f, indent=2)
+    except Exception as e:
+        logger.warning(f"Could not update bug file with investigation ID: {e}")
+
+    logger.info(f"Investigation {investigation_id} completed and saved")
+    return investigation_id
+
+
 @router.post("/investigation/start")
 def start_investigation(payload: dict[str, Any], request: Request):
     """Start a new investigation for a bug."""
@@ -31,42 +76,9 @@ def start_investigation(payload: dict[str, Any], request: Request):
         os.makedirs(INVESTIGATIONS_DIR, exist_ok=True)
 
         # Start investigation
-        # Optionally set runtime API key/model for the agent from app.state.config
-        agent = InvestigationAgent()
-        try:
-            cfg = getattr(request.app.state, "config", {})
-            if cfg and cfg.get("open_ai_api_key"):
-                agent.llm_client.client.api_key = cfg.get("open_ai_api_key")  # type: ignore[attr-defined]
-        except Exception:
-            pass
+        agent = _create_agent(request)
         investigation_result = agent.start_investigation(bug_info)
-
-        # Save investigation result
-        investigation_id = investigation_result["investigation_id"]
-        filename = f"{investigation_id}.json"
-        filepath = os.path.join(INVESTIGATIONS_DIR, filename)
-
-        with open(filepath, "w") as f:
-            json.dump(investigation_result, f, indent=2)
-
-        # Try to update the bug file with the investigation ID
-        try:
-            bug_filename = payload.get("bug_filename")
-            if bug_filename:
-                bug_filepath = os.path.join("/data/bugs/", bug_filename)
-                if os.path.exists(bug_filepath):
-                    with open(bug_filepath, "r") as f:
-                        bug_data = json.load(f)
-
-                    # Add investigation ID to bug data
-                    bug_data["investigation_id"] = investigation_id
-
-                    with open(bug_filepath, "w") as f:
-                        json.dump(bug_data, f, indent=2)
-        except Exception as e:
-            logger.warning(f"Could not update bug file with investigation ID: {e}")
-
-        logger.info(f"Investigation {investigation_id} completed and saved")
+        investigation_id = _save_investigation(investigation_result, payload.get("bug_filename"))
 
         return {"status": "success", "investigation_id": investigation_id, "result": investigation_result}
 
@@ -75,6 +87,35 @@ def start_investigation(payload: dict[str, Any], request: Request):
         return JSONResponse(status_code=500, content={"status": "error", "reason": str(e)})
 
 
+@router.post("/investigation/stream")
+async def stream_investigation(payload: dict[str, Any], request: Request):
+    """
+    Start a new investigation for a bug, streaming its progress and analysis as server-sent events.
+
+    Events carry {"stage": ...}, {"delta": ...} pieces of the analysis, then {"result": ...} with the saved
+    investigation, or {"error": ...}.
+    """
+    bug_info = payload.get("bug_info", {})
+    if not bug_info:
+        return JSONResponse(status_code=400, content={"status": "error", "reason": "bug_info is required"})
+    os.makedirs(INVESTIGATIONS_DIR, exist_ok=True)
+    agent = _create_agent(request)
+
+    async def events():
+        try:
+            async for event in agent.astream_investigation(bug_info):
+                if "result" in event:
+                    await asyncio.to_thread(_save_investigation, event["result"], payload.get("bug_filename"))
+                yield sse_event(event)
+        except Exception as e:
+            logger.error(f"Error streaming investigation: {e}")
+            yield sse_event({"error": str(e)})
+        finally:
+            await agent.llm_client.aclose()
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
 @router.get("/investigation/{investigation_id}")
 def get_investigation(investigation_id: str):
     """Get investigation results by ID."""
@@ -0,0 +1,40 @@
+"""reports.py
+
+Router for generating SRE reports.
+"""
+
+import logging
+
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from app.utils import sse_event
+
+router = APIRouter(tags=["Reports"])
+logger = logging.getLogger(__name__)
+
+
+@router.post("/generate_report/stream")
+async def stream_report(request: Request, payload: dict | None = None):
+    """
+    Generate a report with the scheduler's configuration, streaming its log analysis as server-sent events.
+
+    Events carry {"delta": ...} pieces of the analysis, then {"result": ...} with the saved report, or {"error": ...}.
+    """
+    scheduler = getattr(request.app.state, "scheduler", None)
+    if scheduler is None:
+        return JSONResponse(status_code=500, content={"status": "fail", "reason": "Scheduler not initialized"})
+    payload = payload or {}
+    report_generator = scheduler.report_generator
+
+    async def events():
+        try:
+            async for event in report_generator.astream_report(
+                hours=payload.get("hours", 1), namespace=payload.get("namespace", "default")
+            ):
+                yield sse_event(event)
+        except Exception as e:
+            logger.error(f"Error streaming report: {e}")
+            yield sse_event({"error": str(e)})
+
+    return StreamingResponse(events(), media_type="text/event-stream")
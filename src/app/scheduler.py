@@ -7,10 +7,12 @@ import asyncio
 import logging
 from datetime import datetime
 
+from app.database.vector_db import QdrantDatabaseClient
 from app.tools.k8_client import KubernetesClient
 from app.tools.llm_client import OpenAIChatClient
 from app.tools.log_scanner import LogScanner
 from app.tools.loki_client import LokiClient
+from app.tools.loki_tail import LokiTailIngestor
 from app.tools.report_generator import LogReportGenerator
 
 logger = logging.getLogger(__name__)
@@ -46,6 +48,8 @@ class Scheduler:
         self.log_scanner = log_scanner
         self.loki_client = loki_client
         self.frequency = frequency_in_hours * 60 * 60
+        # Set when a tail ingestor upserts the job's lines as they arrive, so the hourly upsert is skipped.
+        self.tail_ingestor: LokiTailIngestor | None = None
         self._task = None
         self._running = False
 
@@ -70,6 +74,8 @@ class Scheduler:
                 await self._task
             except asyncio.CancelledError:
                 pass
+        await self.log_scanner.aclose()
+        await self.loki_client.aclose()
         logger.info("Scheduler stopped")
 
     async def update_config(
@@ -97,6 +103,8 @@ class Scheduler:
         log_scanner.openai_client = openai_client
 
         frequency_in_hours = frequency_in_hours or 1
+        await self.log_scanner.aclose()
+        await self.loki_client.aclose()
         self.report_generator = report_generator
         self.log_scanner = log_scanner
         self.loki_client = loki_client
@@ -109,8 +117,16 @@ class Scheduler:
         while self._running:
             try:
                 await asyncio.sleep(self.frequency)
+                if self.tail_ingestor is not None and self.tail_ingestor.running:
+                    logger.info("Loki tail is upserting the logs, skipping the scheduled upsert")
+                else:
+                    try:
+                        await self.loki_client.aupsert_logs()
+                    except Exception as e:
+                        logger.error(f"Failed to upsert Loki logs, reporting on the logs already stored: {e}")
                 await self.log_scanner.run_once()
-                self.report_generator.generate_report()
+                await self.report_generator.agenerate_report()
+                await asyncio.to_thread(QdrantDatabaseClient().drop_expired_partitions)
                 logger.info(f"Scheduler run completed at {datetime.now()}")
                 runs += 1
             except Exception as e:
@@ -12,23 +12,102 @@ MODEL_PRICING = {
     "gpt-4-turbo": {"input": 0.01, "output": 0.03},
     "gpt-3.5-turbo": {"input": 0.001, "output": 0.002},
 }
+MODEL_CONTEXT_TOKENS = {
+    "gpt-4o": 128000,
+    "gpt-4o-mini": 128000,
+    "gpt-4-turbo": 128000,
+    "gpt-3.5-turbo": 16385,
+    "o1-mini": 128000,
+}
 
 TRUNCATE_LOGS = int(100)
 
 LOGGING_FILE = "/logs/dingus.log"
 LOG_DATA_FILE_PATH = "/data/loki_stream.json"
+LOKI_WATERMARK_FILE_PATH = os.getenv("LOKI_WATERMARK_FILE_PATH", "/data/loki_watermarks.json")
+LOG_TEMPLATES_FILE_PATH = os.getenv("LOG_TEMPLATES_FILE_PATH", "/data/log_templates.json")
+LOG_TEMPLATES_ENABLED = os.getenv("LOG_TEMPLATES_ENABLED", "true").lower() == "true"
+LOG_TEMPLATES_DEPTH = int(os.getenv("LOG_TEMPLATES_DEPTH", 4))
+LOG_TEMPLATES_SIMILARITY = float(os.getenv("LOG_TEMPLATES_SIMILARITY", 0.4))
+LOG_TEMPLATES_MAX_CHILDREN = int(os.getenv("LOG_TEMPLATES_MAX_CHILDREN", 100))
+LOG_TEMPLATES_MAX_COUNT = int(os.getenv("LOG_TEMPLATES_MAX_COUNT", 50000))
+LOG_TEMPLATES_MAX_AGE_DAYS = int(os.getenv("LOG_TEMPLATES_MAX_AGE_DAYS", 30))  # 0 keeps templates however old
+LOG_TEMPLATES_SAVE_SECONDS = float(os.getenv("LOG_TEMPLATES_SAVE_SECONDS", 60))
+LOKI_QUERY_ENDPOINT = "/loki/api/v1/query"
 LOKI_QUERY_RANGE_ENDPOINT = "/loki/api/v1/query_range"
+LOKI_TAIL_ENDPOINT = "/loki/api/v1/tail"
 LOKI_URL = os.getenv("LOKI_URL", "")
 LOKI_JOB_NAME = os.getenv("LOKI_JOB_NAME", "")
 LOKI_END_HOURS_AGO = 1
+LOKI_PAGE_SIZE = int(os.getenv("LOKI_PAGE_SIZE", 5000))
+LOKI_TIMEOUT_SECONDS = float(os.getenv("LOKI_TIMEOUT_SECONDS", 30))
+LOKI_MAX_CONNECTIONS = int(os.getenv("LOKI_MAX_CONNECTIONS", 10))
+LOKI_SHARD_SECONDS = float(os.getenv("LOKI_SHARD_SECONDS", 60 * 60))
+LOKI_SHARD_MIN_SECONDS = float(os.getenv("LOKI_SHARD_MIN_SECONDS", 60))
+LOKI_SHARD_MAX_SECONDS = float(os.getenv("LOKI_SHARD_MAX_SECONDS", 24 * 60 * 60))
+LOKI_SHARD_PARALLELISM = int(os.getenv("LOKI_SHARD_PARALLELISM", 4))
+LOKI_SHARD_TARGET_LATENCY_SECONDS = float(os.getenv("LOKI_SHARD_TARGET_LATENCY_SECONDS", 2))
+LOKI_UPSERT_BATCH_SIZE = int(os.getenv("LOKI_UPSERT_BATCH_SIZE", 500))
+LOKI_WATERMARK_OVERLAP_SECONDS = int(os.getenv("LOKI_WATERMARK_OVERLAP_SECONDS", 60))
+LOKI_TAIL_ENABLED = os.getenv("LOKI_TAIL_ENABLED", "false").lower() == "true"
+LOKI_TAIL_BATCH_SIZE = int(os.getenv("LOKI_TAIL_BATCH_SIZE", 200))
+LOKI_TAIL_FLUSH_SECONDS = float(os.getenv("LOKI_TAIL_FLUSH_SECONDS", 2))
+LOKI_TAIL_MAX_BACKOFF_SECONDS = float(os.getenv("LOKI_TAIL_MAX_BACKOFF_SECONDS", 60))
+LOKI_CACHE_ENABLED = os.getenv("LOKI_CACHE_ENABLED", "true").lower() == "true"
+LOKI_CACHE_DIR = os.getenv("LOKI_CACHE_DIR", "/data/cache/loki")
+LOKI_CACHE_MAX_ITEMS = int(os.getenv("LOKI_CACHE_MAX_ITEMS", 256))
+LOKI_CACHE_MAX_BYTES = int(os.getenv("LOKI_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+LOKI_CACHE_MAX_DISK_BYTES = int(os.getenv("LOKI_CACHE_MAX_DISK_BYTES", 512 * 1024 * 1024))
+LOKI_CACHE_OPEN_TTL_SECONDS = float(os.getenv("LOKI_CACHE_OPEN_TTL_SECONDS", 30))
+LOKI_INGESTION_DELAY_SECONDS = float(os.getenv("LOKI_INGESTION_DELAY_SECONDS", 5 * 60))
+LOKI_QUERY_ALIGN_SECONDS = float(os.getenv("LOKI_QUERY_ALIGN_SECONDS", 10))
 
 QDRANT_PORT = os.getenv("QDRANT_PORT", 6333)
 QDRANT_HOST = f"{os.getenv('QDRANT_HOST', 'http://host.docker.internal')}:{QDRANT_PORT}"
 QDRANT_COLLECTION_NAME = os.getenv("QDRANT_COLLECTION_NAME", "simulation_logs")
+QDRANT_COLLECTION_PROFILE = os.getenv("QDRANT_COLLECTION_PROFILE", "default")
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "qdrant")  # "qdrant" or "local"
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", "/data/local_index")
+LOCAL_INDEX_ANN_MIN_POINTS = int(os.getenv("LOCAL_INDEX_ANN_MIN_POINTS", 50_000))
+LOCAL_INDEX_NPROBE = int(os.getenv("LOCAL_INDEX_NPROBE", 16))
+# Opt-in: one collection per UTC day, and with a retention the days past it are deleted.
+QDRANT_PARTITIONING_ENABLED = os.getenv("QDRANT_PARTITIONING_ENABLED", "false").lower() == "true"
+QDRANT_RETENTION_DAYS = int(os.getenv("QDRANT_RETENTION_DAYS", 0))  # 0 keeps every partition
 SENTENCE_TRANSFORMER_MODEL = "all-MiniLM-L6-v2"
+SPACY_MODEL = os.getenv("SPACY_MODEL", "en_core_web_sm")
+SPACY_EXCLUDED_COMPONENTS = ["parser", "ner", "lemmatizer"]
+EMBEDDING_PROCESSES = int(os.getenv("EMBEDDING_PROCESSES", 1))
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 256))
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_MAX_ITEMS = int(os.getenv("EMBEDDING_CACHE_MAX_ITEMS", 50_000))
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", "/data/cache/embeddings")
+EMBEDDING_CACHE_DISK_MAX_ROWS = int(os.getenv("EMBEDDING_CACHE_DISK_MAX_ROWS", 1_000_000))
+EMBEDDER_EAGER_LOAD = os.getenv("EMBEDDER_EAGER_LOAD", "true").lower() == "true"
+SCAN_QUERY_TEXT = os.getenv("SCAN_QUERY_TEXT", "ERROR OR WARN OR bug OR exception")
+REPORT_QUERY_TEXT = os.getenv("REPORT_QUERY_TEXT", "CPU")
+STANDING_QUERIES = [SCAN_QUERY_TEXT, REPORT_QUERY_TEXT]  # Embedded once at startup
+QUERY_VECTORS_MAX_ITEMS = int(os.getenv("QUERY_VECTORS_MAX_ITEMS", 1024))
+QDRANT_KNOWN_IDS_DIR = os.getenv("QDRANT_KNOWN_IDS_DIR", "/data/qdrant_known_ids")
+QDRANT_EXISTS_CHECK_BATCH_SIZE = int(os.getenv("QDRANT_EXISTS_CHECK_BATCH_SIZE", 1000))
+QDRANT_UPLOAD_CHUNK_SIZE = int(os.getenv("QDRANT_UPLOAD_CHUNK_SIZE", 256))
+QDRANT_UPLOAD_PARALLELISM = int(os.getenv("QDRANT_UPLOAD_PARALLELISM", 4))
+QDRANT_UPLOAD_WAIT = os.getenv("QDRANT_UPLOAD_WAIT", "false").lower() == "true"
+QDRANT_UPLOAD_MAX_RETRIES = int(os.getenv("QDRANT_UPLOAD_MAX_RETRIES", 3))
 QDRANT_VECTOR_SIZE = 96  # 384D for MiniLM or 96 for Spacy
 
 KUBE_CONFIG_PATH = os.getenv("KUBE_CONFIG_PATH", None)
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "key-goes-here")
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", 4))
+OPENAI_RPM_LIMIT = int(os.getenv("OPENAI_RPM_LIMIT", 500))
+OPENAI_TPM_LIMIT = int(os.getenv("OPENAI_TPM_LIMIT", 200000))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", 5))
+OPENAI_BACKOFF_BASE_SECONDS = float(os.getenv("OPENAI_BACKOFF_BASE_SECONDS", 1))
+OPENAI_BACKOFF_MAX_SECONDS = float(os.getenv("OPENAI_BACKOFF_MAX_SECONDS", 60))
+PROMPT_MAX_TOKENS = int(os.getenv("PROMPT_MAX_TOKENS", 16000))
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR", "/data/cache/llm")
+LLM_CACHE_MAX_ITEMS = int(os.getenv("LLM_CACHE_MAX_ITEMS", 512))
+LLM_CACHE_MAX_DISK_BYTES = int(os.getenv("LLM_CACHE_MAX_DISK_BYTES", 64 * 1024 * 1024))
+LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", 24 * 60 * 60))
@@ -9,6 +9,7 @@ from fastapi import FastAPI
 from app import settings as app_settings
 from app.database.vector_db import QdrantDatabaseClient
 from app.scheduler import Scheduler
+from app.tools.loki_tail import LokiTailIngestor
 
 logger = logging.getLogger(__name__)
 
@@ -37,3 +38,12 @@ def preprocess(app: FastAPI):
         kube_config_path=app.state.config["kube_config_path"],
     )
     logger.info("FastAPI startup: Report scheduler initialized")
+
+    app.state.tail_ingestor = None
+    if app_settings.LOKI_TAIL_ENABLED:
+        logger.info("FastAPI startup: Initializing Loki tail ingestor")
+        app.state.tail_ingestor = LokiTailIngestor(
+            loki_base_url=app.state.config["loki_base_url"],
+            job_name=app.state.config["job_name"],
+        )
+        app.state.scheduler.tail_ingestor = app.state.tail_ingestor
@@ -6,6 +6,7 @@ LLM-enabled consolidation methods for summarizing and analyzing log data.
 import logging
 
 from app.database.vector_db import QdrantDatabaseClient
+from app.prompt_packer import pack_logs, prompt_budget
 from app.prompts import (
     FORMAT_RESPONSE,
     HEADER_PROMPT,
@@ -22,6 +23,20 @@ from app.utils import get_logs_data
 logger = logging.getLogger(__name__)
 
 
+def _pack(logs, openai_client: OpenAIChatClient, *fixed: str, max_tokens: int = 1000) -> str:
+    """Pack logs into the prompt budget left by the system prompt, the fixed parts and the response."""
+    model = openai_client.model
+    return pack_logs(logs, prompt_budget(model, max_tokens, SYSTEM_PROMPT["content"], *fixed), model)
+
+
+def _pack_csv(log_rows: list[list[str]], openai_client: OpenAIChatClient, *fixed: str) -> str:
+    """The CSV header line, then the rows that fit in the prompt budget."""
+    if not log_rows:
+        return ""
+    header = ",".join(log_rows[0])
+    return f"{header}\n{_pack(log_rows[1:], openai_client, *fixed, header)}"
+
+
 def create_response(user_input: str, summary: str, openai_client: OpenAIChatClient) -> str:
     """Generates a response from the LLM based on user input and log summaries.
 
@@ -62,7 +77,7 @@ def get_vector_db_summary(query_text: str, openai_client: OpenAIChatClient) -> s
 
     messages = [
         SYSTEM_PROMPT,
-        {"role": "user", "content": VECTOR_DB_PROMPT + str(vector_search)},
+        {"role": "user", "content": VECTOR_DB_PROMPT + _pack(vector_search, openai_client, VECTOR_DB_PROMPT)},
     ]
 
     summary = openai_client.chat(messages, max_tokens=1000)
@@ -81,7 +96,8 @@ def get_csv_summary(log_file_path: str, openai_client: OpenAIChatClient) -> str:
     Returns:
         str: A summarized version of the log data.
     """
-    log_sample = str(get_logs_data(log_file_path)[:TRUNCATE_LOGS]).replace("'", "").replace(" ", "").replace("\\", "")
+    log_rows = get_logs_data(log_file_path, limit=TRUNCATE_LOGS)
+    log_sample = _pack_csv(log_rows, openai_client, HEADER_PROMPT)
 
     messages = [
         SYSTEM_PROMPT,
@@ -92,11 +108,11 @@ def get_csv_summary(log_file_path: str, openai_client: OpenAIChatClient) -> str:
     headers = headers.replace("```", "").replace("[", "").replace("]", "")
     headers_list = [item.strip() for item in headers.split(",")]
 
-    log_data = get_logs_data(log_file_path, headers_list)[:TRUNCATE_LOGS]
+    log_data = get_logs_data(log_file_path, headers_list, limit=TRUNCATE_LOGS)
 
     messages = [
         SYSTEM_PROMPT,
-        {"role": "user", "content": SUMMARY_PROMPT + str(log_data)},
+        {"role": "user", "content": SUMMARY_PROMPT + _pack_csv(log_data, openai_client, SUMMARY_PROMPT)},
     ]
 
     summary = openai_client.chat(messages, max_tokens=1000)
@@ -3,10 +3,11 @@
 This module contains the investigation agent that performs systematic debugging.
 """
 
+import asyncio
 import json
 import logging
 from datetime import datetime
-from typing import Any, Optional
+from typing import Any, AsyncIterator, Optional
 
 from app.settings import OPENAI_API_KEY, OPENAI_MODEL
 from app.tools.investigation_tools import InvestigationTools
@@ -60,19 +61,36 @@ class InvestigationAgent:
         self.llm_client = OpenAIChatClient(api_key=OPENAI_API_KEY, model=OPENAI_MODEL)
         self.investigation_id = None
 
-    def start_investigation(self, bug_info: dict[str, Any]) -> dict[str, Any]:
-        """Start a new investigation for a bug."""
+    def _new_investigation(self, bug_info: dict[str, Any]) -> dict[str, Any]:
         self.investigation_id = f"investigation_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
 
-        # Create investigation context
-        investigation_context = {
+        logger.info(f"Starting investigation {self.investigation_id} for bug: {bug_info.get('summary', 'Unknown')}")
+
+        return {
             "investigation_id": self.investigation_id,
             "bug_info": bug_info,
             "start_time": datetime.now().isoformat(),
             "status": "in_progress",
         }
 
-        logger.info(f"Starting investigation {self.investigation_id} for bug: {bug_info.get('summary', 'Unknown')}")
+    def _complete_investigation(
+        self, investigation_context: dict[str, Any], investigation_results: dict[str, Any], analysis: dict[str, Any]
+    ) -> dict[str, Any]:
+        logger.info(f"Analysis completed. Severity: {analysis.get('severity', {}).get('level', 'Unknown')}")
+
+        investigation_context.update(
+            {
+                "end_time": datetime.now().isoformat(),
+                "status": "completed",
+                "investigation_results": investigation_results,
+                "analysis": analysis,
+            }
+        )
+        return investigation_context
+
+    def start_investigation(self, bug_info: dict[str, Any]) -> dict[str, Any]:
+        """Start a new investigation for a bug."""
+        investigation_context = self._new_investigation(bug_info)
 
         # Perform systematic investigation
         investigation_results = self._perform_investigation(bug_info)
@@ -83,19 +101,32 @@ class InvestigationAgent:
         # Generate comprehensive analysis
         analysis = self._generate_analysis(bug_info, investigation_results)
 
-        logger.info(f"Analysis completed. Severity: {analysis.get('severity', {}).get('level', 'Unknown')}")
+        return self._complete_investigation(investigation_context, investigation_results, analysis)
 
-        # Complete investigation
-        investigation_context.update(
-            {
-                "end_time": datetime.now().isoformat(),
-                "status": "completed",
-                "investigation_results": investigation_results,
-                "analysis": analysis,
-            }
-        )
+    async def astream_investigation(self, bug_info: dict[str, Any]) -> AsyncIterator[dict[str, Any]]:
+        """
+        Run an investigation like `start_investigation`, streaming its progress.
 
-        return investigation_context
+        Yields {"stage": ...} as the investigation moves on, {"delta": ...} for each piece of the analysis as
+        the LLM writes it, and finally {"result": ...} with the completed investigation.
+        """
+        investigation_context = self._new_investigation(bug_info)
+        yield {"stage": "investigating"}
+        investigation_results = await asyncio.to_thread(self._perform_investigation, bug_info)
+
+        yield {"stage": "analysing"}
+        parts = []
+        try:
+            async for delta in self.llm_client.achat_stream(
+                self._analysis_messages(bug_info, investigation_results), temperature=0.1, max_tokens=2000
+            ):
+                parts.append(delta)
+                yield {"delta": delta}
+            analysis = self._parse_analysis("".join(parts))
+        except Exception as e:
+            analysis = self._failed_analysis(e)
+
+        yield {"result": self._complete_investigation(investigation_context, investigation_results, analysis)}
 
     def _determine_investigation_steps(
         self, summary: str, message: str, evidence: list[str], bug_info: dict[str, Any]
@@ -428,12 +459,7 @@ Focus on tools that are most relevant to this specific bug type. Explain the rea
             ),
         }
 
-    def _generate_analysis(self, bug_info: dict[str, Any], investigation_results: dict[str, Any]) -> dict[str, Any]:
-        """Generate comprehensive analysis using LLM."""
-
-        logger.info(f"Generating analysis for bug: {bug_info.get('summary', 'Unknown')}")
-        logger.info(f"Investigation results keys: {list(investigation_results.keys())}")
-
+    def _analysis_messages(self, bug_info: dict[str, Any], investigation_results: dict[str, Any]) -> list[dict]:
         # Create prompt for analysis
         analysis_prompt = f"""
 Based on the following bug report and investigation results, provide a comprehensive analysis:
@@ -467,72 +493,84 @@ Format your response as JSON with the following structure:
     "summary": "brief summary of findings"
 }}
 """
+        return [
+            {"role": "system", "content": INVESTIGATION_SYSTEM_PROMPT},
+            {"role": "user", "content": analysis_prompt},
+        ]
+
+    def _parse_analysis(self, response: str) -> dict[str, Any]:
+        """Parse the JSON analysis of the LLM, falling back to a default assessment."""
+        try:
+            analysis = json.loads(response)
+            logger.info("Successfully parsed LLM analysis as JSON")
+        except json.JSONDecodeError as e:
+            logger.warning(f"Failed to parse LLM response as JSON: {e}")
+            logger.warning(f"Raw response: {response}")
+
+            # Try to extract JSON from the response if it's wrapped in markdown
+            import re
+
+            json_match = re.search(r"\{.*\}", response, re.DOTALL)
+            if json_match:
+                try:
+                    analysis = json.loads(json_match.group())
+                    logger.info("Successfully extracted JSON from response")
+                except json.JSONDecodeError:
+                    analysis = None
+            else:
+                analysis = None
+
+            if not analysis:
+                # Create a structured response based on the raw text
+                analysis = {
+                    "severity": {
+                        "level": "Medium",
+                        "confidence": "low",
+                        "reasoning": "Unable to parse LLM response, using default assessment",
+                    },
+                    "root_cause": f"Analysis failed to parse properly. Raw response: {response[:200]}...",
+                    "correlations": [],
+                    "recommended_fixes": [],
+                    "prevention_measures": [],
+                    "confidence_level": "low",
+                    "summary": "LLM analysis failed to generate proper JSON response",
+                }
+
+        logger.info(f"Final analysis structure: {list(analysis.keys())}")
+        return analysis
+
+    def _failed_analysis(self, e: Exception) -> dict[str, Any]:
+        logger.error(f"Error generating analysis: {e}")
+        return {
+            "severity": {
+                "level": "Medium",
+                "confidence": "low",
+                "reasoning": f"Error generating severity analysis: {str(e)}",
+            },
+            "root_cause": f"Error generating analysis: {str(e)}",
+            "correlations": [],
+            "recommended_fixes": [],
+            "prevention_measures": [],
+            "confidence_level": "low",
+            "summary": f"Analysis failed due to error: {str(e)}",
+        }
+
+    def _generate_analysis(self, bug_info: dict[str, Any], investigation_results: dict[str, Any]) -> dict[str, Any]:
+        """Generate comprehensive analysis using LLM."""
+
+        logger.info(f"Generating analysis for bug: {bug_info.get('summary', 'Unknown')}")
+        logger.info(f"Investigation results keys: {list(investigation_results.keys())}")
 
         try:
             logger.info("Calling LLM for analysis...")
             response = self.llm_client.chat(
-                messages=[
-                    {"role": "system", "content": INVESTIGATION_SYSTEM_PROMPT},
-                    {"role": "user", "content": analysis_prompt},
-                ],
+                messages=self._analysis_messages(bug_info, investigation_results),
                 temperature=0.1,
                 max_tokens=2000,
             )
 
             logger.info(f"LLM Analysis Response: {response[:200]}...")
-
-            # Try to parse JSON response
-            try:
-                analysis = json.loads(response)
-                logger.info("Successfully parsed LLM analysis as JSON")
-            except json.JSONDecodeError as e:
-                logger.warning(f"Failed to parse LLM response as JSON: {e}")
-                logger.warning(f"Raw response: {response}")
-
-                # Try to extract JSON from the response if it's wrapped in markdown
-                import re
-
-                json_match = re.search(r"\{.*\}", response, re.DOTALL)
-                if json_match:
-                    try:
-                        analysis = json.loads(json_match.group())
-                        logger.info("Successfully extracted JSON from response")
-                    except json.JSONDecodeError:
-                        analysis = None
-                else:
-                    analysis = None
-
-                if not analysis:
-                    # Create a structured response based on the raw text
-                    analysis = {
-                        "severity": {
-                            "level": "Medium",
-                            "confidence": "low",
-                            "reasoning": "Unable to parse LLM response, using default assessment",
-                        },
-                        "root_cause": f"Analysis failed to parse properly. Raw response: {response[:200]}...",
-                        "correlations": [],
-                        "recommended_fixes": [],
-                        "prevention_measures": [],
-                        "confidence_level": "low",
-                        "summary": "LLM analysis failed to generate proper JSON response",
-                    }
-
-            logger.info(f"Final analysis structure: {list(analysis.keys())}")
-            return analysis
+            return self._parse_analysis(response)
 
         except Exception as e:
-            logger.error(f"Error generating analysis: {e}")
-            return {
-                "severity": {
-                    "level": "Medium",
-                    "confidence": "low",
-                    "reasoning": f"Error generating severity analysis: {str(e)}",
-                },
-                "root_cause": f"Error generating analysis: {str(e)}",
-                "correlations": [],
-                "recommended_fixes": [],
-                "prevention_measures": [],
-                "confidence_level": "low",
-                "summary": f"Analysis failed due to error: {str(e)}",
-            }
+            return self._failed_analysis(e)
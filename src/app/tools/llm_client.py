@@ -4,15 +4,121 @@ llm_client.py
 This file contains the OpenAIChatClient class.
 """
 
+import asyncio
+import hashlib
+import json
 import logging
+import threading
+import time
+import weakref
+from typing import AsyncGenerator
 
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 
-from app.settings import MODEL_PRICING, OPENAI_MODEL
+from app.cache import DiskCache, LRUCache, TieredCache, register_cache
+from app.prompt_packer import get_token_counter
+from app.settings import (
+    LLM_CACHE_DIR,
+    LLM_CACHE_ENABLED,
+    LLM_CACHE_MAX_DISK_BYTES,
+    LLM_CACHE_MAX_ITEMS,
+    LLM_CACHE_TTL_SECONDS,
+    MODEL_PRICING,
+    OPENAI_MAX_CONCURRENCY,
+    OPENAI_MAX_RETRIES,
+    OPENAI_MODEL,
+)
+from app.tools.llm_scheduler import (
+    PRIORITY_INTERACTIVE,
+    get_llm_scheduler,
+    is_retryable,
+    retry_delay,
+)
 
 logger = logging.getLogger(__name__)
 
 
+class LLMRequestError(Exception):
+    """An OpenAI request failed and retrying did not help."""
+
+
+class LLMResponseCache:
+    """
+    Cache of chat completions shared by every `OpenAIChatClient` in the process.
+
+    Responses are keyed by a hash of (model, messages, temperature, max_tokens) and kept for `ttl_seconds`, in
+    memory and, if `directory` is set, on disk so they survive restarts. Each entry remembers the tokens and cost
+    of the call that produced it, so hits add up to the usage they saved.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = LLM_CACHE_ENABLED,
+        directory: str | None = LLM_CACHE_DIR,
+        max_items: int = LLM_CACHE_MAX_ITEMS,
+        max_disk_bytes: int = LLM_CACHE_MAX_DISK_BYTES,
+        ttl_seconds: float = LLM_CACHE_TTL_SECONDS,
+    ):
+        self.enabled = enabled
+        self.ttl_seconds = ttl_seconds
+        disk = DiskCache(directory, max_disk_bytes) if directory else None
+        self.cache = TieredCache(LRUCache(max_items), disk)
+        self.saved_prompt_tokens = 0
+        self.saved_completion_tokens = 0
+        self.saved_cost = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(model: str, messages: list, temperature: float, max_tokens: int) -> str:
+        request = json.dumps([model, messages, temperature, max_tokens], sort_keys=True, default=str)
+        return hashlib.sha256(request.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> str | None:
+        if not self.enabled:
+            return None
+        entry = self.cache.get(key)
+        if entry is None:
+            return None
+        with self._lock:
+            self.saved_prompt_tokens += entry["prompt_tokens"]
+            self.saved_completion_tokens += entry["completion_tokens"]
+            self.saved_cost += entry["cost"]
+        return entry["content"]
+
+    def set(self, key: str, content: str, usage: dict, ttl: float | None = None) -> None:
+        if not self.enabled:
+            return
+        ttl = self.ttl_seconds if ttl is None else ttl
+        if ttl <= 0:
+            return
+        self.cache.set(key, {"content": content, **usage}, ttl=ttl, persist=True)
+
+    def stats(self) -> dict:
+        stats = self.cache.stats()
+        stats["saved_prompt_tokens"] = self.saved_prompt_tokens
+        stats["saved_completion_tokens"] = self.saved_completion_tokens
+        stats["saved_cost_usd"] = round(self.saved_cost, 4)
+        return stats
+
+
+llm_cache = LLMResponseCache()
+register_cache("llm", llm_cache)
+
+# One semaphore per event loop, as asyncio primitives cannot be shared between loops.
+_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+_semaphores_lock = threading.Lock()
+
+
+def llm_semaphore() -> asyncio.Semaphore:
+    """Return the semaphore capping in-flight async OpenAI requests at `OPENAI_MAX_CONCURRENCY` in this loop."""
+    loop = asyncio.get_running_loop()
+    with _semaphores_lock:
+        semaphore = _semaphores.get(loop)
+        if semaphore is None:
+            semaphore = _semaphores[loop] = asyncio.Semaphore(OPENAI_MAX_CONCURRENCY)
+        return semaphore
+
+
 class OpenAIChatClient:
     def __init__(self, api_key: str, model: str = OPENAI_MODEL):
         """
@@ -22,14 +128,19 @@ class OpenAIChatClient:
         :param model: The model to use for the chat (default is "gpt-4").
         """
         self.model = model
-        self.client = OpenAI(api_key=api_key)
+        # Retries go through the rate limit scheduler instead of the SDK's own.
+        self.client = OpenAI(api_key=api_key, max_retries=0)
+        self.async_client = AsyncOpenAI(api_key=api_key, max_retries=0)
+        self.scheduler = get_llm_scheduler(model)
+        self.token_counter = get_token_counter(model)
         self.MODEL_PRICING = {
             "gpt-4o": {"input": 0.0025, "output": 0.01},
             "gpt-4o-mini": {"input": 0.00015, "output": 0.0006},
             "o1-mini": {"input": 0.003, "output": 0.012},
         }
 
-    def _get_price(self, response):
+    def _get_price(self, response) -> dict:
+        """Log the tokens and cost of a response, and return them."""
         usage = response.usage
         input_tokens = usage.prompt_tokens
         output_tokens = usage.completion_tokens
@@ -41,29 +152,215 @@ class OpenAIChatClient:
             f"OpenAI API Cost: ${cost:.4f} | Model: {self.model} | "
             f"Input Tokens: {input_tokens} | Output Tokens: {output_tokens} | Total Tokens: {total_tokens}"
         )
+        return {"prompt_tokens": input_tokens, "completion_tokens": output_tokens, "cost": cost}
+
+    def _cache_key(self, messages: list, temperature: float, max_tokens: int, cache: bool | None) -> str | None:
+        """Validate the messages and return their LLM response cache key, or None if the call is not cached."""
+        for message in messages:
+            if not isinstance(message, dict) or "role" not in message or "content" not in message:
+                raise ValueError(f"Invalid message structure: {message}")
+
+        use_cache = temperature == 0 if cache is None else cache
+        return LLMResponseCache.key(self.model, messages, temperature, max_tokens) if use_cache else None
+
+    def _content(self, response, key: str | None, cache_ttl: float | None) -> str:
+        """Log the cost of a response, cache it under `key` and return its stripped content."""
+        usage = self._get_price(response=response)
+        content = response.choices[0].message.content if response.choices[0].message.content is not None else ""
+        content = content.strip()
+        if key is not None:
+            llm_cache.set(key, content, usage, ttl=cache_ttl)
+        return content
 
-    def chat(self, messages: list, temperature: float = 0.0, max_tokens: int = 4000) -> str:
+    def _retry_delay(self, error: Exception, attempt: int, reserved: int) -> float:
+        """Return the seconds to wait before retrying a failed request, or raise `LLMRequestError`."""
+        self.scheduler.settle(reserved, 0)
+        if not is_retryable(error) or attempt >= OPENAI_MAX_RETRIES:
+            logger.error(f"Error during API call: {error}")
+            raise LLMRequestError(f"OpenAI request failed after {attempt + 1} attempts: {error}") from error
+        delay = retry_delay(error, attempt)
+        if getattr(error, "status_code", None) == 429:
+            # The limit is shared, so hold every request rather than only this one.
+            self.scheduler.pause(delay)
+        logger.warning(f"OpenAI request failed ({error}), retrying in {delay:.1f}s")
+        return delay
+
+    def _settle(self, response, reserved: int, estimated: int) -> None:
+        """Return the unused tokens of a request to the scheduler and calibrate the prompt token estimate."""
+        usage = getattr(response, "usage", None)
+        if usage is None:
+            return
+        self.scheduler.settle(reserved, usage.total_tokens)
+        self.token_counter.observe(estimated, usage.prompt_tokens)
+
+    def chat(
+        self,
+        messages: list,
+        temperature: float = 0.0,
+        max_tokens: int = 4000,
+        cache: bool | None = None,
+        cache_ttl: float | None = None,
+        priority: int = PRIORITY_INTERACTIVE,
+    ) -> str:
         """
         Send a chat message to the OpenAI API and log cost.
 
         :param messages: A list of messages in OpenAI format.
-        :param temperature: Sampling temperature (default 0.7).
-        :param max_tokens: Max tokens to generate (default 500).
+        :param temperature: Sampling temperature (default 0.0).
+        :param max_tokens: Max tokens to generate (default 4000).
+        :param cache: Serve and store the response in the LLM response cache. By default only calls at
+            temperature 0 are cached, as their response is (near) deterministic. False always calls the API.
+        :param cache_ttl: Seconds to keep the response; defaults to `LLM_CACHE_TTL_SECONDS`.
+        :param priority: Rate limit priority class, see `app.tools.llm_scheduler`; interactive by default.
         :return: The assistant's response as a string.
+        :raises LLMRequestError: If the request failed and retries with backoff did not help.
         """
-        for message in messages:
-            if not isinstance(message, dict) or "role" not in message or "content" not in message:
-                raise ValueError(f"Invalid message structure: {message}")
+        key = self._cache_key(messages, temperature, max_tokens, cache)
+        if key is not None:
+            cached = llm_cache.get(key)
+            if cached is not None:
+                logger.info(f"OpenAI response served from cache for {len(str(messages))} characters.")
+                return cached
+
+        estimated = self.token_counter.count_messages(messages)
+        reserved = estimated + max_tokens
+        attempt = 0
+        while True:
+            self.scheduler.acquire(reserved, priority)
+            try:
+                logger.info(f"OpenAI call with {len(str(messages))} characters.")
+                response = self.client.chat.completions.create(
+                    model=self.model, messages=messages, temperature=temperature, max_tokens=max_tokens
+                )
+            except Exception as e:
+                time.sleep(self._retry_delay(e, attempt, reserved))
+                attempt += 1
+                continue
+            self._settle(response, reserved, estimated)
+            return self._content(response, key, cache_ttl)
+
+    async def achat(
+        self,
+        messages: list,
+        temperature: float = 0.0,
+        max_tokens: int = 4000,
+        cache: bool | None = None,
+        cache_ttl: float | None = None,
+        priority: int = PRIORITY_INTERACTIVE,
+    ) -> str:
+        """
+        Async variant of `chat`, on the event loop instead of a thread.
+
+        At most `OPENAI_MAX_CONCURRENCY` requests of the process are in flight at once; the others wait
+        for a slot. Cache hits do not take one.
+        """
+        key = self._cache_key(messages, temperature, max_tokens, cache)
+        if key is not None:
+            cached = llm_cache.get(key)
+            if cached is not None:
+                logger.info(f"OpenAI response served from cache for {len(str(messages))} characters.")
+                return cached
+
+        estimated = self.token_counter.count_messages(messages)
+        reserved = estimated + max_tokens
+        attempt = 0
+        while True:
+            await self.scheduler.aacquire(reserved, priority)
+            try:
+                async with llm_semaphore():
+                    logger.info(f"OpenAI async call with {len(str(messages))} characters.")
+                    response = await self.async_client.chat.completions.create(
+                        model=self.model, messages=messages, temperature=temperature, max_tokens=max_tokens
+                    )
+            except Exception as e:
+                await asyncio.sleep(self._retry_delay(e, attempt, reserved))
+                attempt += 1
+                continue
+            self._settle(response, reserved, estimated)
+            return self._content(response, key, cache_ttl)
+
+    async def achat_stream(
+        self,
+        messages: list,
+        temperature: float = 0.0,
+        max_tokens: int = 4000,
+        cache: bool | None = None,
+        cache_ttl: float | None = None,
+        priority: int = PRIORITY_INTERACTIVE,
+    ) -> AsyncGenerator[str, None]:
+        """
+        Streaming variant of `achat`: yield the response in pieces as the model writes them.
+
+        A cached response is yielded whole. A failure before the first piece is retried like `achat`; once
+        pieces have been yielded it raises `LLMRequestError`, as the response cannot be resumed.
+        """
+        key = self._cache_key(messages, temperature, max_tokens, cache)
+        if key is not None:
+            cached = llm_cache.get(key)
+            if cached is not None:
+                logger.info(f"OpenAI response served from cache for {len(str(messages))} characters.")
+                yield cached
+                return
+
+        estimated = self.token_counter.count_messages(messages)
+        reserved = estimated + max_tokens
+        attempt = 0
+        while True:
+            await self.scheduler.aacquire(reserved, priority)
+            async with llm_semaphore():
+                try:
+                    logger.info(f"OpenAI streaming call with {len(str(messages))} characters.")
+                    stream = await self.async_client.chat.completions.create(
+                        model=self.model,
+                        messages=messages,
+                        temperature=temperature,
+                        max_tokens=max_tokens,
+                        stream=True,
+                        stream_options={"include_usage": True},
+                    )
+                except Exception as e:
+                    delay = self._retry_delay(e, attempt, reserved)
+                else:
+                    parts = []
+                    last_chunk = None
+                    try:
+                        async for chunk in stream:
+                            last_chunk = chunk
+                            delta = chunk.choices[0].delta.content if chunk.choices else None
+                            if delta:
+                                parts.append(delta)
+                                yield delta
+                    except Exception as e:
+                        logger.error(f"Error during API call: {e}")
+                        raise LLMRequestError(f"OpenAI stream failed after {len(parts)} pieces: {e}") from e
+                    finally:
+                        # Also when the stream failed or the caller stopped reading it early.
+                        self._settle_stream(last_chunk, reserved, estimated, "".join(parts))
+                        await stream.close()
+                    self._finish_stream("".join(parts), last_chunk, key, cache_ttl)
+                    return
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def _settle_stream(self, last_chunk, reserved: int, estimated: int, content: str) -> None:
+        """
+        Settle a stream with the usage reported by its last chunk. Without it, as when the stream broke off,
+        settle with the estimated prompt tokens and the tokens of the content received.
+        """
+        if last_chunk is not None and last_chunk.usage is not None:
+            self._settle(last_chunk, reserved, estimated)
+        else:
+            self.scheduler.settle(reserved, estimated + self.token_counter.count(content))
+
+    def _finish_stream(self, content: str, last_chunk, key: str | None, cache_ttl: float | None):
+        """Log the usage of a finished stream, reported by its last chunk, and cache its content."""
+        if last_chunk is None or last_chunk.usage is None:
+            return
+        usage = self._get_price(response=last_chunk)
+        if key is not None:
+            llm_cache.set(key, content.strip(), usage, ttl=cache_ttl)
 
-        try:
-            logger.info(f"OpenAI call with {len(str(messages))} characters.")
-
-            response = self.client.chat.completions.create(
-                model=self.model, messages=messages, temperature=temperature, max_tokens=max_tokens
-            )
-            self._get_price(response=response)
-            content = response.choices[0].message.content if response.choices[0].message.content is not None else ""
-            return content.strip()
-        except Exception as e:
-            logger.error(f"Error during API call: {e}")
-            return f"Error during API call: {e}"
+    async def aclose(self) -> None:
+        """Close the HTTP connections of both clients."""
+        self.client.close()
+        await self.async_client.close()
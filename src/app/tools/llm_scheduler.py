@@ -0,0 +1,219 @@
+"""llm_scheduler.py
+
+Client-side rate limiting of OpenAI requests: request and token per minute budgets shared by every client of
+a model, handed out in priority order, and the backoff between retries of failed requests.
+"""
+
+import asyncio
+import email.utils
+import itertools
+import random
+import threading
+import time
+
+from openai import (
+    APIConnectionError,
+    APIStatusError,
+    InternalServerError,
+    RateLimitError,
+)
+
+from app.settings import (
+    OPENAI_BACKOFF_BASE_SECONDS,
+    OPENAI_BACKOFF_MAX_SECONDS,
+    OPENAI_RPM_LIMIT,
+    OPENAI_TPM_LIMIT,
+)
+
+# Lower values are served first.
+PRIORITY_INTERACTIVE = 0
+PRIORITY_SCAN = 1
+PRIORITY_REPORT = 2
+
+
+class TokenBucket:
+    """A budget of `per_minute` units that refills continuously, holding at most one minute's worth."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` units are available."""
+        self._refill(now)
+        return max(0.0, (min(amount, self.capacity) - self.level) / self.rate)
+
+    def take(self, amount: float) -> None:
+        self.level -= min(amount, self.capacity)
+
+    def give(self, amount: float) -> None:
+        self.level = min(self.capacity, self.level + amount)
+
+
+class LLMScheduler:
+    """
+    Admission of requests to one model under its requests per minute and tokens per minute limits.
+
+    A request reserves its estimated tokens (prompt plus `max_tokens`, which OpenAI counts against the limit)
+    before it is sent, and `settle` returns what the response did not use. Waiting requests are served by
+    priority, then in arrival order, so a queue of reports never delays an investigation. After a 429 every
+    request waits out the Retry-After, instead of each one probing the limit again.
+
+    Both threads (`acquire`) and coroutines (`aacquire`) wait on the same queue.
+    """
+
+    def __init__(
+        self,
+        rpm: float = OPENAI_RPM_LIMIT,
+        tpm: float = OPENAI_TPM_LIMIT,
+        poll_seconds: float = 0.05,
+    ):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.poll_seconds = poll_seconds
+        self._paused_until = 0.0
+        self._waiting: dict[int, tuple[int, int]] = {}
+        self._tickets = itertools.count()
+        self._lock = threading.Lock()
+        self.granted = 0
+        self.throttled = 0
+        self.paused = 0
+
+    def _enter(self, priority: int) -> int:
+        ticket = next(self._tickets)
+        with self._lock:
+            self._waiting[ticket] = (priority, ticket)
+        return ticket
+
+    def _leave(self, ticket: int) -> None:
+        with self._lock:
+            self._waiting.pop(ticket, None)
+
+    def _reserve(self, ticket: int, cost: int) -> float:
+        """Take the budget of a request if it is next in line; otherwise return the seconds to wait."""
+        with self._lock:
+            if min(self._waiting.values()) != self._waiting[ticket]:
+                return self.poll_seconds
+            now = time.monotonic()
+            wait = max(
+                self._paused_until - now,
+                self.requests.wait_time(1, now),
+                self.tokens.wait_time(cost, now),
+            )
+            if wait > 0:
+                return wait
+            self.requests.take(1)
+            self.tokens.take(cost)
+            del self._waiting[ticket]
+            self.granted += 1
+            return 0.0
+
+    def acquire(self, cost: int, priority: int = PRIORITY_INTERACTIVE) -> None:
+        """Block until a request of `cost` tokens may be sent."""
+        ticket = self._enter(priority)
+        try:
+            wait = self._reserve(ticket, cost)
+            if wait > 0:
+                self.throttled += 1
+            while wait > 0:
+                time.sleep(min(wait, 1.0))
+                wait = self._reserve(ticket, cost)
+        finally:
+            self._leave(ticket)
+
+    async def aacquire(self, cost: int, priority: int = PRIORITY_INTERACTIVE) -> None:
+        """Async variant of `acquire`."""
+        ticket = self._enter(priority)
+        try:
+            wait = self._reserve(ticket, cost)
+            if wait > 0:
+                self.throttled += 1
+            while wait > 0:
+                await asyncio.sleep(min(wait, 1.0))
+                wait = self._reserve(ticket, cost)
+        finally:
+            self._leave(ticket)
+
+    def settle(self, reserved: int, used: int) -> None:
+        """Return the tokens reserved by a request but not used by it, e.g. all of them if it failed."""
+        if reserved > used:
+            with self._lock:
+                self.tokens.give(reserved - used)
+
+    def pause(self, seconds: float) -> None:
+        """Hold every request for `seconds`, e.g. after the API answered 429."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self.paused += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "granted": self.granted,
+                "throttled": self.throttled,
+                "paused": self.paused,
+                "waiting": len(self._waiting),
+                "requests_available": round(self.requests.level, 1),
+                "tokens_available": round(self.tokens.level),
+            }
+
+
+_schedulers: dict[str, LLMScheduler] = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_llm_scheduler(model: str) -> LLMScheduler:
+    """Return the process-wide scheduler of a model; OpenAI rate limits apply per model."""
+    with _schedulers_lock:
+        if model not in _schedulers:
+            _schedulers[model] = LLMScheduler()
+        return _schedulers[model]
+
+
+def is_retryable(error: Exception) -> bool:
+    """Whether a failed request may succeed if sent again: rate limits, server errors and lost connections."""
+    if isinstance(error, RateLimitError):
+        # An exhausted quota is a 429 too, but waiting does not help.
+        return getattr(error, "code", None) != "insufficient_quota"
+    return isinstance(error, (InternalServerError, APIConnectionError))
+
+
+def retry_after(error: Exception) -> float | None:
+    """Seconds the API asked to wait before retrying, from the Retry-After headers of the error."""
+    if not isinstance(error, APIStatusError):
+        return None
+    headers = error.response.headers
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            value = headers["retry-after"]
+            try:
+                return float(value)
+            except ValueError:
+                return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+def retry_delay(
+    error: Exception,
+    attempt: int,
+    base: float = OPENAI_BACKOFF_BASE_SECONDS,
+    cap: float = OPENAI_BACKOFF_MAX_SECONDS,
+) -> float:
+    """
+    Seconds to wait before retry number `attempt` (from 0): exponential backoff with full jitter, or the
+    Retry-After of the error plus up to `base` of jitter, so waiting clients do not all return at once.
+    """
+    requested = retry_after(error)
+    if requested is not None:
+        return min(requested, cap) + random.uniform(0, base)
+    return random.uniform(0, min(cap, base * 2**attempt))
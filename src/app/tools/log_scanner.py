@@ -2,17 +2,29 @@
 This file is used to parse logs for bugs.
 """
 
+import asyncio
 import json
 import logging
 import os
 import re
-from datetime import datetime, timedelta
+import time
+from datetime import datetime
 
-from app.connectors import fetch_loki_logs
+from app.connectors import NANOSECONDS, LokiEntry, LokiQueryError, aligned_now_ns
 from app.database.vector_db import QdrantDatabaseClient
-from app.settings import OPENAI_MODEL
+from app.log_batch import LogBatch
+from app.log_templates import format_points, summarise_batch
+from app.prompt_packer import PromptLine, pack, prompt_budget, to_prompt_lines
+from app.settings import (
+    LOG_TEMPLATES_ENABLED,
+    LOKI_END_HOURS_AGO,
+    LOKI_WATERMARK_OVERLAP_SECONDS,
+    OPENAI_MODEL,
+    SCAN_QUERY_TEXT,
+)
 from app.tools.k8_client import KubernetesClient
-from app.tools.llm_client import OpenAIChatClient
+from app.tools.llm_client import LLMRequestError, OpenAIChatClient
+from app.tools.llm_scheduler import PRIORITY_SCAN
 from app.tools.loki_client import LokiClient
 
 logger = logging.getLogger(__name__)
@@ -67,48 +79,103 @@ class LogScanner(LokiClient, KubernetesClient):
         self.openai_client = OpenAIChatClient(api_key=open_ai_api_key, model=OPENAI_MODEL)
         self.vector_db = QdrantDatabaseClient()
         self.last_bug_signature = None
+        # End of the last scan whose lines were all read, where the next pre-filter count starts.
+        self.last_scan_ns = None
         self._running = False
 
     async def run_once(self):
         logger.info("Running LogScanner once")
         try:
-            now = datetime.now()
-            end_time = now.strftime("%Y-%m-%d %H:%M:%S")
-            start_time = (now - timedelta(hours=1)).strftime("%Y-%m-%d %H:%M:%S")
-            logs = []
-            for level in ["ERROR", "WARN"]:
-                streams = fetch_loki_logs(
-                    loki_base_url=self.loki_base_url,
-                    job_name=self.job_name,
-                    start_time=start_time,
-                    end_time=end_time,
-                    limit=self.log_limit,
-                    level=level,
-                )
-                if streams:
-                    logs.extend(streams)
-            vector_logs = self._get_recent_logs_from_vector_db()
-            bug_info = self._analyze_logs_with_llm(logs + vector_logs)
+            levels = ["ERROR", "WARN"]
+            scan_ns = aligned_now_ns()
+            queries = await self._get_streams_to_scan(levels, scan_ns)
+            if not queries:
+                logger.info("No ERROR or WARN logs in the scan window")
+                self.last_scan_ns = scan_ns
+                return
+            # Keep the overall budget of `log_limit` lines per level, shared by the streams that have errors.
+            max_entries = max(self.log_limit * len(levels) // len(queries), 1)
+            results = await self.gather_loki_logs(queries, max_entries=max_entries, since_watermark=True)
+            logs = LogBatch.from_entries(entry for entries in results for entry in entries).sort()
+            if not len(logs):
+                logger.info("No new ERROR or WARN logs since the last scan")
+                self.last_scan_ns = scan_ns
+                return
+            vector_logs = await asyncio.to_thread(self._get_recent_logs_from_vector_db)
+            bug_info = await self._analyze_logs_with_llm(logs, vector_logs)
             if bug_info:
                 self._save_if_new_bug(bug_info)
+            self.commit_watermarks()
+            # A stream capped at `max_entries` has unread lines before `scan_ns`, so count from the old start again.
+            if all(len(entries) < max_entries for entries in results):
+                self.last_scan_ns = scan_ns
+        except LLMRequestError as e:
+            # The watermarks stay where they were, so the next run scans the same logs again.
+            logger.error(f"LLM analysis failed, the logs will be scanned again on the next run: {e}")
+        except LokiQueryError as e:
+            logger.error(f"Loki query failed, the logs will be scanned again on the next run: {e}")
         except Exception as e:
             logger.error(f"Error in LogScanner run_once: {e}")
 
     def stop(self):
         self._running = False
 
+    async def aclose(self) -> None:
+        """Close the pooled Loki and OpenAI connections."""
+        await LokiClient.aclose(self)
+        await self.openai_client.aclose()
+
+    async def _get_streams_to_scan(self, levels: list[str], now_ns: int) -> list[dict]:
+        """
+        Ask Loki which services logged at the given levels since the last completed scan, at most
+        `LOKI_END_HOURS_AGO` before `now_ns`, with one aggregate query.
+
+        Returns one `gather_loki_logs` query per (service, level) that has lines; lines without a service label
+        get a query of their own. If the aggregate query fails, falls back to one query per level.
+        """
+        since_ns = now_ns - LOKI_END_HOURS_AGO * 60 * 60 * NANOSECONDS
+        if self.last_scan_ns is not None:
+            # Late lines are read back to the watermark overlap, so count them too.
+            since_ns = max(since_ns, self.last_scan_ns - LOKI_WATERMARK_OVERLAP_SECONDS * NANOSECONDS)
+        counts = await self.count_loki_logs(by=["service", "level"], level=levels, since_ns=since_ns)
+        if counts is None:
+            logger.warning("Loki metric query failed, scanning every level without a pre-filter")
+            return [{"level": level} for level in levels]
+
+        logger.info(f"Loki log counts by (service, level): {counts}")
+        return [
+            {"level": level or None, "service": service}
+            for (service, level), count in sorted(counts.items())
+            if count > 0
+        ]
+
     def _get_recent_logs_from_vector_db(self):
-        # TODO: Make query_text configurable or smarter
-        query_text = "ERROR OR WARN OR bug OR exception"
-        logs = self.vector_db.search(query_text=query_text, limit=self.log_limit)
+        since_ns = time.time_ns() - LOKI_END_HOURS_AGO * 60 * 60 * NANOSECONDS
+        logs = self.vector_db.search(
+            query_text=SCAN_QUERY_TEXT,
+            limit=self.log_limit,
+            levels=["ERROR", "WARN"],
+            job=self.job_name,
+            since_ns=since_ns,
+        )
         # TODO: Format logs as needed for LLM prompt
         return logs
 
     def _extract_log_messages(self, logs):
         """Extract actual log messages from Loki log structure, returning both full and message-only."""
+        if isinstance(logs, LogBatch):
+            if LOG_TEMPLATES_ENABLED:
+                # One line per template with its count, instead of every repetition.
+                return summarise_batch(logs)
+            return [{"full": full, "message": message} for full, message in zip(logs.formatted(), logs.messages())]
         log_messages = []
         for log_entry in logs:
-            if isinstance(log_entry, dict):
+            if isinstance(log_entry, LokiEntry):
+                level = log_entry.stream.get("level", "INFO")
+                service = log_entry.stream.get("service", "unknown")
+                full = f"[{level}] {service}: {log_entry.line}"
+                log_messages.append({"full": full, "message": log_entry.line})
+            elif isinstance(log_entry, dict):
                 # Handle Loki log structure
                 if "values" in log_entry and "stream" in log_entry:
                     for timestamp, message in log_entry["values"]:
@@ -130,35 +197,38 @@ class LogScanner(LokiClient, KubernetesClient):
                     log_messages.append({"full": msg, "message": msg})
             elif isinstance(log_entry, str):
                 log_messages.append({"full": log_entry, "message": log_entry})
+            elif getattr(log_entry, "payload", None):
+                # Vector DB search result
+                full = format_points([log_entry])[0]
+                log_messages.append({"full": full, "message": log_entry.payload.get("example", full)})
             else:
                 msg = str(log_entry)
                 log_messages.append({"full": msg, "message": msg})
         return log_messages
 
-    def _format_logs_for_llm(self, log_messages):
-        """Format log messages for LLM analysis."""
-        formatted_logs = []
-        for i, msg in enumerate(log_messages, 1):
-            # Use the full log line for LLM context
-            formatted_logs.append(f"Log {i}: {msg['full']}")
-        return "\n".join(formatted_logs)
+    def _format_logs_for_llm(self, lines: list[PromptLine], max_tokens: int, *fixed: str) -> str:
+        """Pack log lines into the prompt tokens left after the fixed parts of the prompt and the response."""
+        model = self.openai_client.model
+        return "\n".join(pack(lines, prompt_budget(model, max_tokens, *fixed), model))
 
-    def _analyze_logs_with_llm(self, logs):
+    async def _analyze_logs_with_llm(self, logs, vector_logs=None):
         # Extract actual log messages for evidence
-        log_messages = self._extract_log_messages(logs)
+        log_messages = self._extract_log_messages(logs) + self._extract_log_messages(vector_logs or [])
         evidence = log_messages[-10:] if len(log_messages) > 10 else log_messages  # last 10 logs as evidence
 
-        # Format logs for LLM analysis
-        formatted_logs = self._format_logs_for_llm(log_messages)
+        # Format logs for LLM analysis, deduplicated and within the token budget
+        lines = to_prompt_lines(logs) + to_prompt_lines(vector_logs or [])
+        request = "Please analyze the following logs:\n\n"
+        formatted_logs = self._format_logs_for_llm(lines, 1500, LOG_SCANNER_SYSTEM_PROMPT, request)
 
         messages = [
             {
                 "role": "system",
                 "content": LOG_SCANNER_SYSTEM_PROMPT,
             },
-            {"role": "user", "content": f"Please analyze the following logs:\n\n{formatted_logs}"},
+            {"role": "user", "content": f"{request}{formatted_logs}"},
         ]
-        response = self.openai_client.chat(messages, max_tokens=1500)
+        response = await self.openai_client.achat(messages, max_tokens=1500, priority=PRIORITY_SCAN)
         try:
             # Extract the JSON block from the LLM response
             import re as _re
@@ -192,14 +262,15 @@ Given the following bug and logs, provide the following in markdown format:
 - Any related files or log lines to check (list)
 - Avoid starting with '- **Root Cause Analysis**'.
 
-Bug: {json.dumps(bug_info)}\n\nLogs:\n{formatted_logs}
-                """
-            ai_insights_response = self.openai_client.chat(
+Bug: {json.dumps(bug_info)}\n\nLogs:\n"""
+            ai_insights_prompt += self._format_logs_for_llm(lines, 200, LOG_EXPERT_SYSTEM_PROMPT, ai_insights_prompt)
+            ai_insights_response = await self.openai_client.achat(
                 [
                     {"role": "system", "content": LOG_EXPERT_SYSTEM_PROMPT},
                     {"role": "user", "content": ai_insights_prompt},
                 ],
                 max_tokens=200,
+                priority=PRIORITY_SCAN,
             )
             bug_info["ai_insights"] = ai_insights_response
         except Exception as e:
@@ -2,12 +2,31 @@
 
 Get log data from a database source."""
 
+import asyncio
 import logging
-from datetime import datetime, timedelta
+from contextlib import aclosing
+from typing import Iterator
 
-from app.connectors import fetch_loki_logs
+import httpx
+
+from app.connectors import (
+    NANOSECONDS,
+    LokiEntry,
+    ShardPlanner,
+    afetch_loki_metric,
+    aiter_loki_logs,
+    aiter_loki_logs_sharded,
+    aligned_now_ns,
+    build_loki_metric_query,
+    build_loki_query,
+    create_async_loki_session,
+    iter_loki_logs,
+)
 from app.database.vector_db import QdrantDatabaseClient
-from app.settings import LOKI_END_HOURS_AGO
+from app.log_batch import LogBatch
+from app.settings import LOKI_END_HOURS_AGO, LOKI_PAGE_SIZE, LOKI_UPSERT_BATCH_SIZE
+from app.tools.watermarks import LokiWatermark
+from app.utils import chunked
 
 logger = logging.getLogger(__name__)
 
@@ -17,45 +36,257 @@ class LokiClient:
         self.loki_base_url = loki_base_url
         self.job_name = job_name
         self.database_client = QdrantDatabaseClient()
+        self._async_session: httpx.AsyncClient | None = None
+        self._pending_watermarks: list[LokiWatermark] = []
+        self.shard_planner = ShardPlanner()
+
+    def _get_async_session(self) -> httpx.AsyncClient:
+        """Return the pooled async HTTP client, creating it on first use."""
+        if self._async_session is None or self._async_session.is_closed:
+            self._async_session = create_async_loki_session()
+        return self._async_session
+
+    async def aclose(self) -> None:
+        """Close the pooled async HTTP client."""
+        if self._async_session is not None:
+            await self._async_session.aclose()
+            self._async_session = None
+
+    def watermark(
+        self, level: str | None = None, search_word: str | None = None, service: str | None = None
+    ) -> LokiWatermark:
+        """Load the persisted watermark of this client's job for the given filters."""
+        query = build_loki_query(job_name=self.job_name, level=level, search_word=search_word, service=service)
+        return LokiWatermark(self.loki_base_url, self.job_name, query)
+
+    def commit_watermarks(self) -> None:
+        """Persist the watermarks advanced by `gather_loki_logs` once their lines have been processed."""
+        for watermark in self._pending_watermarks:
+            watermark.save()
+        self._pending_watermarks = []
 
-    def upsert_logs(self) -> None:
+    def upsert_logs(self, batch_size: int = LOKI_UPSERT_BATCH_SIZE) -> None:
         """
         Fetch logs from a specified source and upsert them into a vector database.
+
+        Logs are streamed from Loki and upserted in batches, so memory use does not grow with the window size.
         """
         logger.info("Getting Logs for Upserting")
-        data, payloads = self.get_loki_streams()
+        total = 0
+        for batch in self.get_loki_streams(batch_size=batch_size):
+            self.database_client.upsert_log_batch(batch)
+            total += len(batch)
 
-        if data is None:
+        if not total:
             logger.error("No data to upsert")
             return
+        logger.info(f"Upserted {total} Loki log lines")
+
+    async def backfill_logs(
+        self,
+        start_ns: int,
+        end_ns: int,
+        batch_size: int = LOKI_UPSERT_BATCH_SIZE,
+        watermark: LokiWatermark | None = None,
+        **filters,
+    ) -> int:
+        """
+        Upsert every log line in [start_ns, end_ns) into the vector database, fetching the range as parallel shards.
+
+        Args:
+            start_ns (int): Start of the range as a nanosecond timestamp.
+            end_ns (int): End of the range as a nanosecond timestamp.
+            batch_size (int): Number of lines per upsert.
+            watermark (LokiWatermark | None): Skip the lines it has seen, and advance and save it after each
+                upserted batch, so an interrupted backfill resumes from the last completed batch.
+            **filters: `level`, `search_word` or `service` filters for the query.
+
+        Returns:
+            int: The number of lines upserted.
 
-        self.database_client.upsert(data_to_embed=data, payloads=payloads)
+        Raises:
+            LokiShardError: If a shard failed. The batches upserted before it only hold lines from before the
+                failure, so the watermark is not moved past the missing lines and the next run fetches them.
+        """
+        total = 0
+        entries: list[LokiEntry] = []
+
+        async def upsert(entries: list[LokiEntry]) -> None:
+            await asyncio.to_thread(self.database_client.upsert_log_batch, LogBatch.from_entries(entries))
+            if watermark is not None:
+                watermark.advance(entries)
+                watermark.save()
+
+        async for entry in aiter_loki_logs_sharded(
+            self._get_async_session(),
+            loki_base_url=self.loki_base_url,
+            job_name=self.job_name,
+            start_time=start_ns,
+            end_time=end_ns,
+            planner=self.shard_planner,
+            **filters,
+        ):
+            if watermark is not None and not watermark.is_new(entry):
+                continue
+            entries.append(entry)
+            if len(entries) >= batch_size:
+                await upsert(entries)
+                total += len(entries)
+                entries = []
+        if entries:
+            await upsert(entries)
+            total += len(entries)
 
-    def get_loki_streams(self) -> tuple[list, list]:
+        logger.info(f"Backfilled {total} Loki log lines")
+        return total
+
+    async def aupsert_logs(self, hours: int = LOKI_END_HOURS_AGO, batch_size: int = LOKI_UPSERT_BATCH_SIZE) -> int:
         """
-        Get Loki Log Streams.
+        Async variant of `upsert_logs`: upsert the job's lines since its watermark, or of the last `hours` on the
+        first run. The range is fetched as parallel shards, so catching up on a long gap is not one serial read.
+
+        Returns:
+            int: The number of lines upserted.
         """
-        now = datetime.now()
-        end_time = now.strftime("%Y-%m-%d %H:%M:%S")
-        start_time = (now - timedelta(hours=LOKI_END_HOURS_AGO)).strftime("%Y-%m-%d %H:%M:%S")
-        streams = fetch_loki_logs(
+        end_ns = aligned_now_ns()
+        watermark = self.watermark()
+        start_ns = watermark.start_ns(end_ns - hours * 60 * 60 * NANOSECONDS)
+        return await self.backfill_logs(start_ns, end_ns, batch_size=batch_size, watermark=watermark)
+
+    def iter_loki_entries(
+        self, hours: int = LOKI_END_HOURS_AGO, watermark: LokiWatermark | None = None
+    ) -> Iterator[LokiEntry]:
+        """
+        Lazily iterate over every Loki log line of the job in the last `hours`.
+
+        If a watermark is given, iterate oldest first from the watermark instead, skipping lines it has seen.
+        """
+        end_ns = aligned_now_ns()
+        start_ns = end_ns - hours * 60 * 60 * NANOSECONDS
+        if watermark is None:
+            return iter_loki_logs(
+                loki_base_url=self.loki_base_url, job_name=self.job_name, start_time=start_ns, end_time=end_ns
+            )
+
+        entries = iter_loki_logs(
             loki_base_url=self.loki_base_url,
             job_name=self.job_name,
-            start_time=start_time,
-            end_time=end_time,
-            limit=50,
-            level=None,
-            search_word=None,
+            start_time=watermark.start_ns(start_ns),
+            end_time=end_ns,
+            direction="forward",
         )
+        return (entry for entry in entries if watermark.is_new(entry))
+
+    async def gather_loki_logs(
+        self,
+        queries: list[dict],
+        hours: int = LOKI_END_HOURS_AGO,
+        max_entries: int | None = None,
+        since_watermark: bool = False,
+    ) -> list[list[LokiEntry]]:
+        """
+        Run several Loki queries over the same window concurrently on the pooled client.
+
+        Args:
+            queries (list[dict]): One dict of `iter_loki_logs` filters per query, e.g. [{"level": "ERROR"}].
+            hours (int): Size of the window ending now, in hours.
+            max_entries (int | None): Maximum number of lines to keep per query.
+            since_watermark (bool): Only return lines newer than each query's watermark, oldest first, so
+                lines past `max_entries` are left for the next run. The advanced watermarks are saved by
+                `commit_watermarks`.
+
+        Returns:
+            list[list[LokiEntry]]: The entries of each query, in the order of `queries`.
+        """
+        end_ns = aligned_now_ns()
+        default_start_ns = end_ns - hours * 60 * 60 * NANOSECONDS
+        page_size = min(max_entries, LOKI_PAGE_SIZE) if max_entries else LOKI_PAGE_SIZE
+        session = self._get_async_session()
+
+        async def collect(query: dict) -> list[LokiEntry]:
+            if not since_watermark:
+                return [
+                    entry
+                    async for entry in aiter_loki_logs(
+                        session,
+                        loki_base_url=self.loki_base_url,
+                        job_name=self.job_name,
+                        start_time=default_start_ns,
+                        end_time=end_ns,
+                        page_size=page_size,
+                        max_entries=max_entries,
+                        **query,
+                    )
+                ]
+
+            # Oldest first, so a capped read stops at a point the watermark can resume from.
+            watermark = self.watermark(**query)
+            entries: list[LokiEntry] = []
+            async with aclosing(
+                aiter_loki_logs(
+                    session,
+                    loki_base_url=self.loki_base_url,
+                    job_name=self.job_name,
+                    start_time=watermark.start_ns(default_start_ns),
+                    end_time=end_ns,
+                    page_size=page_size,
+                    direction="forward",
+                    **query,
+                )
+            ) as stream:
+                async for entry in stream:
+                    if not watermark.is_new(entry):
+                        continue
+                    entries.append(entry)
+                    if max_entries and len(entries) >= max_entries:
+                        break
+            watermark.advance(entries)
+            self._pending_watermarks.append(watermark)
+            return entries
+
+        return list(await asyncio.gather(*(collect(query) for query in queries)))
 
-        if not streams:
-            logger.error("No streams fetched from Loki.")
-            return [], []
-        try:
-            data: list[None | str] = [log.get("stream", {}).get("message") for log in streams]
-            payloads: list[None | dict] = [log.get("stream") for log in streams]
-        except TypeError as e:
-            logger.error(f"Failed to extract streams from Loki: {e}")
-            raise TypeError(f"Failed to extract streams from Loki: {e}") from e
-
-        return data, payloads
+    async def count_loki_logs(
+        self,
+        by: list[str],
+        level: str | list[str] | None = None,
+        hours: int = LOKI_END_HOURS_AGO,
+        function: str = "count_over_time",
+        since_ns: int | None = None,
+    ) -> dict[tuple, float] | None:
+        """
+        Aggregate the job's log lines on the Loki server instead of pulling them.
+
+        Args:
+            by (list[str]): Labels to group by, e.g. ["service", "level"].
+            level (str | list[str] | None): The log level, or levels, to count.
+            hours (int): Size of the window ending now, in hours.
+            function (str): "count_over_time" for line counts, "rate" for lines per second.
+            since_ns (int | None): Start of the window as a nanosecond timestamp, instead of `hours` ago.
+
+        Returns:
+            dict[tuple, float] | None: The value per group, keyed by the `by` label values in order.
+                None if Loki could not be queried.
+        """
+        end_ns = aligned_now_ns()
+        range_seconds = hours * 60 * 60 if since_ns is None else max(-(-(end_ns - since_ns) // NANOSECONDS), 1)
+        query = build_loki_metric_query(
+            job_name=self.job_name, function=function, range_seconds=range_seconds, by=by, level=level
+        )
+        samples = await afetch_loki_metric(self._get_async_session(), self.loki_base_url, query, end_ns)
+        if samples is None:
+            return None
+        return {tuple(labels.get(label, "") for label in by): value for labels, value in samples}
+
+    def get_loki_streams(self, batch_size: int = LOKI_UPSERT_BATCH_SIZE) -> Iterator[LogBatch]:
+        """
+        Get new Loki Log Streams as batches of at most `batch_size` lines.
+
+        The job's watermark is saved after the consumer has processed each batch, so an interrupted upsert
+        resumes from the last completed batch.
+        """
+        watermark = self.watermark()
+        for entries in chunked(self.iter_loki_entries(watermark=watermark), batch_size):
+            yield LogBatch.from_entries(entries)
+            watermark.advance(entries)
+            watermark.save()
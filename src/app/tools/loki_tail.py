@@ -0,0 +1,208 @@
+"""loki_tail.py
+
+Real-time ingestion of Loki logs over the websocket tail API.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from urllib.parse import urlencode, urljoin
+
+from websockets.asyncio.client import ClientConnection, connect
+from websockets.exceptions import WebSocketException
+
+from app.connectors import LokiEntry, build_loki_query, entry_key, flatten_streams
+from app.log_batch import LogBatch
+from app.settings import (
+    LOKI_TAIL_BATCH_SIZE,
+    LOKI_TAIL_ENDPOINT,
+    LOKI_TAIL_FLUSH_SECONDS,
+    LOKI_TAIL_MAX_BACKOFF_SECONDS,
+)
+from app.tools.loki_client import LokiClient
+from app.tools.watermarks import LokiWatermark
+
+logger = logging.getLogger(__name__)
+
+
+class LokiTailIngestor:
+    """
+    Subscribe to Loki's tail stream for a job and upsert new lines into the vector database in micro-batches.
+
+    A batch is flushed when it holds `batch_size` lines or `flush_seconds` after its first line arrived,
+    whichever comes first. Progress is recorded in the job's watermark, so after a disconnect or restart the
+    stream resumes from the last flushed timestamp without re-ingesting lines. Loki only replays `batch_size`
+    lines when a tail opens, so before each connection the lines since the watermark are fetched with range
+    queries first. Lines whose upsert failed stay buffered, and the connection is dropped until an upsert
+    succeeds, so nothing is lost while the database is down. The tail has its own watermark, apart from the one
+    of batch fetches of the same query; the scheduler skips its hourly upsert while the tail runs.
+    """
+
+    def __init__(
+        self,
+        loki_base_url: str,
+        job_name: str,
+        batch_size: int = LOKI_TAIL_BATCH_SIZE,
+        flush_seconds: float = LOKI_TAIL_FLUSH_SECONDS,
+        max_backoff_seconds: float = LOKI_TAIL_MAX_BACKOFF_SECONDS,
+    ):
+        self.loki_base_url = loki_base_url
+        self.job_name = job_name
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.query = build_loki_query(job_name=job_name)
+        self.watermark = LokiWatermark(loki_base_url, job_name, self.query, consumer="tail")
+        self.loki_client = LokiClient(loki_base_url, job_name)
+        self.database_client = self.loki_client.database_client
+        self._buffer: list[LokiEntry] = []
+        self._buffered: set[tuple] = set()
+        self._task: asyncio.Task | None = None
+        self._running = False
+
+    def tail_url(self) -> str:
+        """Websocket URL of the tail stream, starting from the current watermark."""
+        params = {
+            "query": self.query,
+            "start": self.watermark.start_ns(time.time_ns()),
+            "limit": self.batch_size,
+            "delay_for": 0,
+        }
+        url = urljoin(self.loki_base_url, LOKI_TAIL_ENDPOINT)
+        if url.startswith("https://"):
+            url = "wss://" + url.removeprefix("https://")
+        elif url.startswith("http://"):
+            url = "ws://" + url.removeprefix("http://")
+        return f"{url}?{urlencode(params)}"
+
+    @property
+    def running(self) -> bool:
+        """True between `start` and `stop`."""
+        return self._running
+
+    async def start(self):
+        """Start tailing in a background task."""
+        if self._running:
+            logger.warning("Loki tail ingestor is already running")
+            return
+        self._running = True
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Loki tail ingestor started for job '{self.job_name}'")
+
+    async def stop(self):
+        """Stop tailing and flush any buffered lines."""
+        if not self._running:
+            logger.warning("Loki tail ingestor is not running")
+            return
+        self._running = False
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        await self._flush()
+        await self.loki_client.aclose()
+        logger.info("Loki tail ingestor stopped")
+
+    async def _run(self):
+        """Keep a tail connection open, reconnecting with exponential backoff."""
+        initial_backoff = min(1.0, self.max_backoff_seconds)
+        backoff = initial_backoff
+        while self._running:
+            try:
+                # If the catch-up failed, back off and retry it instead of tailing past the missing lines.
+                if await self._catch_up():
+                    async with connect(self.tail_url()) as websocket:
+                        logger.info(f"Connected to Loki tail for job '{self.job_name}'")
+                        # Keep backing off while lines of a failed upsert are still waiting.
+                        if not self._buffer:
+                            backoff = initial_backoff
+                        await self._consume(websocket)
+            except (WebSocketException, OSError, TimeoutError) as e:
+                logger.warning(f"Loki tail connection lost: {e}. Reconnecting in {backoff:.0f}s")
+            await self._flush()
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, self.max_backoff_seconds)
+
+    async def _catch_up(self) -> bool:
+        """
+        Upsert the lines since the watermark with range queries, so a tail opened after a disconnect or restart
+        has only the last few lines to replay. Nothing is fetched on the first run, which tails from now.
+        Returns False if the lines could not be fetched or upserted.
+        """
+        if self.watermark.last_seen_ns is None or self._buffer:
+            return True
+        end_ns = time.time_ns()
+        try:
+            total = await self.loki_client.backfill_logs(
+                self.watermark.start_ns(end_ns), end_ns, batch_size=self.batch_size, watermark=self.watermark
+            )
+        except Exception as e:
+            logger.error(f"Failed to catch up on Loki lines since the tail watermark: {e}")
+            return False
+        if total:
+            logger.info(f"Caught up on {total} Loki lines before reopening the tail")
+        return True
+
+    async def _consume(self, websocket: ClientConnection):
+        """Read tail messages into the buffer, flushing on size or age. Returns when an upsert fails."""
+        loop = asyncio.get_running_loop()
+        deadline: float | None = loop.time() + self.flush_seconds if self._buffer else None
+        while self._running:
+            timeout = None if deadline is None else max(deadline - loop.time(), 0)
+            try:
+                message = await asyncio.wait_for(websocket.recv(), timeout)
+            except asyncio.TimeoutError:
+                if not await self._flush():
+                    return
+                deadline = None
+                continue
+
+            entries = self._parse(message)
+            if entries and deadline is None:
+                deadline = loop.time() + self.flush_seconds
+            self._buffer.extend(entries)
+            self._buffered.update(entry_key(entry) for entry in entries)
+
+            if len(self._buffer) >= self.batch_size or (deadline is not None and loop.time() >= deadline):
+                if not await self._flush():
+                    return
+                deadline = None
+
+    def _parse(self, message: str | bytes) -> list[LokiEntry]:
+        """Decode a tail message into entries neither the watermark nor the buffer has seen."""
+        try:
+            data = json.loads(message)
+        except ValueError as e:
+            logger.error(f"Error in JSON from Loki tail: {e}")
+            return []
+
+        dropped = data.get("dropped_entries") or []
+        if dropped:
+            logger.warning(f"Loki tail dropped {len(dropped)} entries")
+        return [
+            entry
+            for entry in flatten_streams(data.get("streams") or [])
+            if self.watermark.is_new(entry) and entry_key(entry) not in self._buffered
+        ]
+
+    async def _flush(self) -> bool:
+        """
+        Normalise, embed and upsert the buffered lines, then move the watermark past them. If the upsert fails
+        the lines are put back in the buffer and False is returned.
+        """
+        if not self._buffer:
+            return True
+        entries, self._buffer = self._buffer, []
+        try:
+            await asyncio.to_thread(self.database_client.upsert_log_batch, LogBatch.from_entries(entries))
+        except Exception as e:
+            logger.error(f"Failed to upsert {len(entries)} tailed Loki lines, keeping them buffered: {e}")
+            self._buffer[:0] = entries
+            return False
+        self._buffered.difference_update(entry_key(entry) for entry in entries)
+        self.watermark.advance(entries)
+        self.watermark.save()
+        return True
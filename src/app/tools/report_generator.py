@@ -3,14 +3,20 @@
 This module handles the generation of SRE reports from log analysis.
 """
 
+import asyncio
 import logging
 import os
+import time
 from datetime import datetime
+from typing import AsyncIterator
 
+from app.connectors import NANOSECONDS
 from app.database.vector_db import QdrantDatabaseClient
 from app.prompts import SRE_REPORT_PROMPT, get_sre_analysis_prompt
+from app.settings import REPORT_QUERY_TEXT
 from app.tools.k8_client import KubernetesClient
-from app.tools.llm_client import OpenAIChatClient
+from app.tools.llm_client import LLMRequestError, OpenAIChatClient
+from app.tools.llm_scheduler import PRIORITY_REPORT
 from app.tools.loki_client import LokiClient
 
 logger = logging.getLogger(__name__)
@@ -88,23 +94,41 @@ Time Period: {report['time_period']}
         logger.info(f"Report saved to {filepath}")
         return filepath
 
-    def _analyze_logs(self, logs: list[dict]) -> str:
-        """Analyze logs using LLM to identify issues and generate insights."""
+    def _analysis_messages(self, logs: list, pod_health_data: dict) -> list[dict]:
         if len(logs) > self.max_logs:
             logs = logs[: self.max_logs]
             logger.info(f"Limiting logs to {self.max_logs} entries to reduce token usage")
 
-        pod_health_data = self._get_pod_status()
-
-        messages = [
+        return [
             {"role": "system", "content": SRE_REPORT_PROMPT},
             {
                 "role": "user",
-                "content": get_sre_analysis_prompt(logs, pod_health_data),
+                "content": get_sre_analysis_prompt(logs, pod_health_data, model=self.openai_client.model),
             },
         ]
 
-        return self.openai_client.chat(messages)
+    @staticmethod
+    def _failed_analysis(error: LLMRequestError) -> str:
+        """The analysis of a report whose LLM request failed, so the report is still saved."""
+        logger.error(f"Log analysis failed, saving the report without it: {error}")
+        return f"Log analysis failed: {error}"
+
+    def _analyze_logs(self, logs: list[dict], pod_health_data: dict | None = None) -> str:
+        """Analyze logs using LLM to identify issues and generate insights."""
+        if pod_health_data is None:
+            pod_health_data = self._get_pod_status()
+        try:
+            return self.openai_client.chat(self._analysis_messages(logs, pod_health_data), priority=PRIORITY_REPORT)
+        except LLMRequestError as e:
+            return self._failed_analysis(e)
+
+    async def _aanalyze_logs(self, logs: list, pod_health_data: dict) -> str:
+        try:
+            return await self.openai_client.achat(
+                self._analysis_messages(logs, pod_health_data), priority=PRIORITY_REPORT
+            )
+        except LLMRequestError as e:
+            return self._failed_analysis(e)
 
     def _get_pod_status(self, namespace: str = "default") -> dict:
         """Get current status of all pods in the namespace."""
@@ -121,17 +145,16 @@ Time Period: {report['time_period']}
 
         return pod_statuses
 
-    def generate_report(self, hours: int = 1, namespace: str = "default") -> dict:
-        """Generate a comprehensive SRE report."""
-        logger.info(f"Generating report for the last {hours} hours")
-
+    def _search_recent_logs(self, hours: int) -> list:
         # TODO: More detailed vector db search
-        recent_logs = self.database_client.search(query_text="CPU", limit=100)
-
-        pod_statuses = self._get_pod_status(namespace)
-
-        analysis = self._analyze_logs(recent_logs)
-
+        return self.database_client.search(
+            query_text=REPORT_QUERY_TEXT,
+            limit=100,
+            job=self.loki_client.job_name,
+            since_ns=time.time_ns() - hours * 60 * 60 * NANOSECONDS,
+        )
+
+    def _finish_report(self, hours: int, recent_logs: list, pod_statuses: dict, analysis: str) -> dict:
         timestamp = datetime.now()
         report = {
             "timestamp": timestamp.isoformat(),
@@ -146,3 +169,47 @@ Time Period: {report['time_period']}
 
         logger.info("Report generation completed")
         return report
+
+    def generate_report(self, hours: int = 1, namespace: str = "default") -> dict:
+        """Generate a comprehensive SRE report."""
+        logger.info(f"Generating report for the last {hours} hours")
+        recent_logs = self._search_recent_logs(hours)
+        pod_statuses = self._get_pod_status(namespace)
+        analysis = self._analyze_logs(recent_logs, pod_statuses)
+        return self._finish_report(hours, recent_logs, pod_statuses, analysis)
+
+    async def _agather(self, hours: int, namespace: str) -> tuple[list, dict]:
+        """Search the logs and fetch the pod statuses of a report in threads, side by side."""
+        recent_logs, pod_statuses = await asyncio.gather(
+            asyncio.to_thread(self._search_recent_logs, hours),
+            asyncio.to_thread(self._get_pod_status, namespace),
+        )
+        return recent_logs, pod_statuses
+
+    async def agenerate_report(self, hours: int = 1, namespace: str = "default") -> dict:
+        """Async variant of `generate_report`."""
+        logger.info(f"Generating report for the last {hours} hours")
+        recent_logs, pod_statuses = await self._agather(hours, namespace)
+        analysis = await self._aanalyze_logs(recent_logs, pod_statuses)
+        return await asyncio.to_thread(self._finish_report, hours, recent_logs, pod_statuses, analysis)
+
+    async def astream_report(self, hours: int = 1, namespace: str = "default") -> AsyncIterator[dict]:
+        """
+        Generate a report like `generate_report`, streaming its log analysis.
+
+        Yields {"delta": ...} for each piece of the analysis as the LLM writes it, then {"result": ...} with
+        the saved report. If the LLM request fails, the report is saved with the failure as its analysis.
+        """
+        logger.info(f"Streaming report for the last {hours} hours")
+        recent_logs, pod_statuses = await self._agather(hours, namespace)
+        parts = []
+        try:
+            async for delta in self.openai_client.achat_stream(
+                self._analysis_messages(recent_logs, pod_statuses), priority=PRIORITY_REPORT
+            ):
+                parts.append(delta)
+                yield {"delta": delta}
+            analysis = "".join(parts).strip()
+        except LLMRequestError as e:
+            analysis = self._failed_analysis(e)
+        yield {"result": await asyncio.to_thread(self._finish_report, hours, recent_logs, pod_statuses, analysis)}
@@ -0,0 +1,103 @@
+"""watermarks.py
+
+Persistent high-watermark cursors so Loki scans only read new log lines."""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Iterable
+
+from app.connectors import NANOSECONDS, LokiEntry
+from app.settings import LOKI_WATERMARK_FILE_PATH, LOKI_WATERMARK_OVERLAP_SECONDS
+
+logger = logging.getLogger(__name__)
+
+_file_lock = threading.Lock()
+
+
+def _entry_hash(entry: LokiEntry) -> str:
+    """Short content hash of an entry, used to drop lines re-read in the overlap window."""
+    labels = json.dumps(entry.stream, sort_keys=True)
+    return hashlib.blake2b(f"{entry.timestamp}|{labels}|{entry.line}".encode("utf-8"), digest_size=8).hexdigest()
+
+
+def _read_file(path: str) -> dict:
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not read Loki watermarks from {path}, starting fresh: {e}")
+        return {}
+
+
+class LokiWatermark:
+    """
+    The last Loki timestamp already processed for one (loki_base_url, job_name, query).
+
+    Each run reads from `last_seen_ns - overlap` so late-arriving lines are not missed. Hashes of the lines
+    inside the overlap are kept alongside the timestamp, so lines read twice are dropped by `is_new`.
+    """
+
+    def __init__(
+        self,
+        loki_base_url: str,
+        job_name: str,
+        query: str,
+        path: str = LOKI_WATERMARK_FILE_PATH,
+        overlap_seconds: float = LOKI_WATERMARK_OVERLAP_SECONDS,
+        consumer: str | None = None,
+    ):
+        """`consumer` names a reader with its own cursor over a query that other readers also follow."""
+        self.key = f"{loki_base_url}|{job_name}|{query}"
+        if consumer:
+            self.key = f"{consumer}|{self.key}"
+        self.path = path
+        self.overlap_ns = int(overlap_seconds * NANOSECONDS)
+
+        with _file_lock:
+            state = _read_file(path).get(self.key, {})
+        self.last_seen_ns: int | None = state.get("last_seen_ns")
+        self.recent: dict[str, int] = dict(state.get("recent", {}))
+
+    def start_ns(self, default_start_ns: int) -> int:
+        """Start of the next read window: the watermark minus the overlap, or `default_start_ns` on the first run."""
+        if self.last_seen_ns is None:
+            return default_start_ns
+        return self.last_seen_ns - self.overlap_ns
+
+    def is_new(self, entry: LokiEntry) -> bool:
+        """True if the entry has not been processed by an earlier run."""
+        if self.last_seen_ns is None or entry.timestamp < self.last_seen_ns - self.overlap_ns:
+            return True
+        return _entry_hash(entry) not in self.recent
+
+    def advance(self, entries: Iterable[LokiEntry]) -> None:
+        """Move the watermark past `entries` and remember the ones that fall inside the overlap."""
+        for entry in entries:
+            self.recent[_entry_hash(entry)] = entry.timestamp
+            if self.last_seen_ns is None or entry.timestamp > self.last_seen_ns:
+                self.last_seen_ns = entry.timestamp
+
+        if self.last_seen_ns is not None:
+            cutoff = self.last_seen_ns - self.overlap_ns
+            self.recent = {h: ts for h, ts in self.recent.items() if ts >= cutoff}
+
+    def save(self) -> None:
+        """Persist the watermark, leaving the cursors of other queries in the file untouched."""
+        if self.last_seen_ns is None:
+            return
+        with _file_lock:
+            state = _read_file(self.path)
+            state[self.key] = {"last_seen_ns": self.last_seen_ns, "recent": self.recent}
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                tmp_path = f"{self.path}.tmp"
+                with open(tmp_path, "w") as f:
+                    json.dump(state, f)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                logger.error(f"Failed to save Loki watermark to {self.path}: {e}")
@@ -3,12 +3,14 @@
 This module contains common utility funtions."""
 
 import csv
+import json
 import logging
 import sys
 import time
 from datetime import datetime
 from functools import wraps
-from typing import Any
+from itertools import islice
+from typing import Any, Iterable, Iterator
 
 logger = logging.getLogger(__name__)
 
@@ -37,12 +39,31 @@ def display_response(response: str, type_speed: float = 0.01):
     sys.stdout.write("\n")
 
 
-def get_logs_data(log_file_path: str, keep_headers: list[str] | None = None):
+def sse_event(data: dict) -> str:
+    """Format `data` as one server-sent event."""
+    return f"data: {json.dumps(data, default=str)}\n\n"
+
+
+def chunked(iterable: Iterable, size: int) -> Iterator[list]:
+    """
+    Split an iterable into lists of at most `size` items without materialising it.
+
+    :param iterable: Any iterable, including generators.
+    :param size: Maximum number of items per chunk.
+    :return: An iterator of lists.
+    """
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def get_logs_data(log_file_path: str, keep_headers: list[str] | None = None, limit: int | None = None):
     """
     Reads a CSV file and keeps only specified headers if provided.
 
     :param log_file_path: Path to the log CSV file.
     :param keep_headers: List of headers to keep. If None, keep all.
+    :param limit: Maximum number of rows to return, including the header. If None, read the whole file.
     :return: Filtered log data as a list of lists.
     """
     with open(log_file_path, mode="r", encoding="utf-8") as file:
@@ -56,7 +77,8 @@ def get_logs_data(log_file_path: str, keep_headers: list[str] | None = None):
             keep_indexes = list(range(len(header)))
             log_data = [header]
 
-        for row in csv_reader:
+        rows = csv_reader if limit is None else islice(csv_reader, max(limit - 1, 0))
+        for row in rows:
             log_data.append([row[i] for i in keep_indexes])
 
     return log_data
@@ -6,6 +6,7 @@ This module contains the bugs tab for the frontend.
 import requests  # type: ignore
 import streamlit as st
 from bug_card import render_bug_card
+from investigation_card import render_investigation_card, stream_investigation
 from settings import API_URL
 
 
@@ -46,20 +47,12 @@ def fetch_investigations():
 
 
 def start_investigation(bug_info, bug_filename=None):
-    """Start an investigation for a bug."""
+    """Start an investigation for a bug, rendering its analysis as it streams in."""
     try:
-        payload = {"bug_info": bug_info}
-        if bug_filename:
-            payload["bug_filename"] = bug_filename
-
-        resp = requests.post(f"{API_URL}/investigation/start", json=payload)
-        if resp.ok:
-            result = resp.json()
-            st.success(f"Investigation started! ID: {result.get('investigation_id')}")
-            return result.get("result")
-        else:
-            st.error(f"Failed to start investigation: {resp.json().get('reason', 'Unknown error')}")
-            return None
+        result = stream_investigation(bug_info, bug_filename)
+        if result:
+            st.success(f"Investigation completed! ID: {result.get('investigation_id')}")
+        return result
     except Exception as e:
         st.error(f"Failed to start investigation: {e}")
         return None
@@ -127,7 +120,7 @@ def render_bugs_tab():
             bug = bug_entry.get("bug", {})
 
             # Find matching investigation for this bug
-            # investigation_results = None
+            investigation_results = None
             for inv_entry in investigations:
                 inv = inv_entry.get("investigation", {})
                 inv_bug_info = inv.get("bug_info", {})
@@ -138,12 +131,12 @@ def render_bugs_tab():
                     and inv_bug_info.get("line") == bug.get("line")
                     and inv_bug_info.get("summary") == bug.get("summary")
                 ):
-                    # investigation_results = inv
+                    investigation_results = inv
                     break
 
                 # Fallback: match by investigation ID if it's stored in the bug
                 elif bug.get("investigation_id") and inv.get("investigation_id") == bug.get("investigation_id"):
-                    # investigation_results = inv
+                    investigation_results = inv
                     break
 
             def remove_callback(fname=fname):
@@ -173,47 +166,22 @@ def render_bugs_tab():
                 remove_callback=remove_callback,
             )
 
-            # TODO: Re-enable investigation card
-
-            # # Render investigation card if investigation results exist
-            # if investigation_results:
-            #     render_investigation_card(investigation_results)
-            # else:
-            #     # Show a small indicator that no investigation has been run yet
-            #     st.markdown(
-            #         '<div style="margin: 0.5em 0 1.5em 2em; color: #888; font-size: 0.9em; font-style: italic;">'
-            #         '💡 No investigation results yet. Click "Start Investigation" below to run a deep analysis.'
-            #         "</div>",
-            #         unsafe_allow_html=True,
-            #     )
-
-            # # Add investigation button below the card
-            # col1, col2 = st.columns([1, 3])
-            # with col1:
-            #     # Disable button if investigation is already running
-            #     button_disabled = st.session_state.get(f"investigation_loading_{fname}", False)
-
-            #     if st.button("🔍 Start Investigation", key=f"investigation_btn_{fname}", disabled=button_disabled):
-            #         # Set loading state
-            #         st.session_state[f"investigation_loading_{fname}"] = True
-            #         st.rerun()
-
-            # Show loading spinner if investigation is in progress
-            # if st.session_state.get(f"investigation_loading_{fname}", False):
-            #     with st.spinner("🔍 Running investigation..."):
-            #         try:
-            #             investigation_result = start_investigation(bug, fname)
-            #             if investigation_result:
-            #                 st.session_state["investigations_cache"] = None  # Refresh cache
-            #                 st.session_state[f"investigation_loading_{fname}"] = False
-            #                 st.success("✅ Investigation completed!")
-            #                 st.rerun()
-            #             else:
-            #                 st.session_state[f"investigation_loading_{fname}"] = False
-            #                 st.error("❌ Investigation failed!")
-            #                 st.rerun()
-            #         except Exception as e:
-            #             st.session_state[f"investigation_loading_{fname}"] = False
-            #             st.error(f"❌ Investigation error: {e}")
-            #             st.rerun()
-            # st.divider()
+            # Render investigation card if investigation results exist
+            if investigation_results:
+                render_investigation_card(investigation_results)
+            else:
+                # Show a small indicator that no investigation has been run yet
+                st.markdown(
+                    '<div style="margin: 0.5em 0 1.5em 2em; color: #888; font-size: 0.9em; font-style: italic;">'
+                    '💡 No investigation results yet. Click "Start Investigation" below to run a deep analysis.'
+                    "</div>",
+                    unsafe_allow_html=True,
+                )
+
+            # The analysis streams in below the button while the investigation runs.
+            if st.button("🔍 Start Investigation", key=f"investigation_btn_{fname}"):
+                investigation_result = start_investigation(bug, fname)
+                if investigation_result:
+                    st.session_state["investigations_cache"] = None  # Refresh cache
+                    render_investigation_card(investigation_result)
+            st.divider()
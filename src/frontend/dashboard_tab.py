@@ -6,6 +6,7 @@ This module contains the dashboard tab for the frontend.
 import requests  # type: ignore
 import streamlit as st
 from settings import API_URL
+from streaming import stream_events, stream_text
 
 
 def fetch_reports():
@@ -27,20 +28,18 @@ def fetch_reports():
         return []
 
 
-def generate_report():
-    resp = requests.post(
-        f"{API_URL}/generate_report",
-        json={
-            "loki_base_url": st.session_state.get("loki_url_input", st.session_state.get("loki_url")),
-            "job_name": st.session_state.get("loki_job_input"),
-            "kube_config_path": st.session_state.get("kube_config_input", st.session_state.get("kube_config_path")),
-            "open_ai_api_key": st.session_state.get("openai_api_key_input"),
-        },
-    )
-    if resp.ok:
-        st.sidebar.success("Report generated!")
+def generate_report() -> None:
+    """Generate a report, rendering its log analysis as it streams in."""
+    outcome: dict = {}
+    try:
+        st.write_stream(stream_text(stream_events("/generate_report/stream", {"hours": 1}), outcome))
+    except Exception as e:
+        outcome["error"] = str(e)
+    if "error" in outcome:
+        st.sidebar.error(f"Failed to generate report: {outcome['error']}")
     else:
-        st.sidebar.error(f"Failed to generate report: {resp.json().get('reason')}")
+        st.sidebar.success("Report generated!")
+        st.session_state["reports_loading"] = True
 
 
 def render_generate_refresh_row():
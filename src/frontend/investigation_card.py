@@ -6,6 +6,7 @@ This module contains the investigation card for the frontend.
 from typing import Any
 
 import streamlit as st
+from streaming import stream_events, stream_text
 
 
 def render_investigation_card(investigation_results: dict[str, Any]):
@@ -162,3 +163,20 @@ def render_investigation_card(investigation_results: dict[str, Any]):
             st.markdown("**🛡️ Prevention Measures**")
             for measure in prevention_measures:
                 st.markdown(f"- {measure}")
+
+
+def stream_investigation(bug_info: dict[str, Any], bug_filename: str | None = None) -> dict[str, Any] | None:
+    """Run an investigation, rendering the analysis as it is written; return the completed investigation."""
+    payload: dict[str, Any] = {"bug_info": bug_info}
+    if bug_filename:
+        payload["bug_filename"] = bug_filename
+
+    outcome: dict[str, Any] = {}
+    status = st.empty()
+    with st.expander("🧠 Live Analysis", expanded=True):
+        st.write_stream(stream_text(stream_events("/investigation/stream", payload), outcome, status))
+    status.empty()
+
+    if "error" in outcome:
+        st.error(f"Investigation failed: {outcome['error']}")
+    return outcome.get("result")
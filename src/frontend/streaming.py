@@ -0,0 +1,37 @@
+"""streaming.py
+
+This module reads the server-sent events of the streaming API endpoints.
+"""
+
+import json
+from typing import Any, Iterator
+
+import requests  # type: ignore
+from settings import API_URL
+
+
+def stream_events(path: str, payload: dict) -> Iterator[dict[str, Any]]:
+    """Post `payload` to a streaming endpoint and yield its events as they arrive."""
+    with requests.post(f"{API_URL}{path}", json=payload, stream=True, timeout=(5, None)) as resp:
+        if not resp.ok:
+            yield {"error": resp.json().get("reason", "Unknown error")}
+            return
+        for line in resp.iter_lines(decode_unicode=True):
+            if line and line.startswith("data: "):
+                yield json.loads(line.removeprefix("data: "))
+
+
+def stream_text(events: Iterator[dict[str, Any]], outcome: dict[str, Any], status=None) -> Iterator[str]:
+    """
+    Yield the text deltas of `events` for `st.write_stream`, storing the final result or error in `outcome`
+    and showing stage changes in the `status` placeholder, if given.
+    """
+    for event in events:
+        if "delta" in event:
+            yield event["delta"]
+        elif "stage" in event and status is not None:
+            status.caption(f"{event['stage'].capitalize()}...")
+        elif "result" in event:
+            outcome["result"] = event["result"]
+        elif "error" in event:
+            outcome["error"] = event["error"]
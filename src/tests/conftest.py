@@ -0,0 +1,24 @@
+"""conftest.py
+
+Point every on-disk store of the app at a temporary directory before `app.settings` is imported."""
+
+import os
+import tempfile
+
+DATA_DIR = tempfile.mkdtemp(prefix="dingus-tests-")
+
+for name in (
+    "LOKI_CACHE_DIR",
+    "LOCAL_INDEX_DIR",
+    "EMBEDDING_CACHE_DIR",
+    "QDRANT_KNOWN_IDS_DIR",
+    "LLM_CACHE_DIR",
+    "LOKI_WATERMARK_FILE_PATH",
+    "LOG_TEMPLATES_FILE_PATH",
+):
+    os.environ.setdefault(name, os.path.join(DATA_DIR, name.lower()))
+
+# Tests count the requests reaching their fake Loki.
+os.environ.setdefault("LOKI_CACHE_ENABLED", "false")
+# Retries of failed LLM requests back off for milliseconds rather than seconds.
+os.environ.setdefault("OPENAI_BACKOFF_BASE_SECONDS", "0.01")
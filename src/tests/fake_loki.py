@@ -0,0 +1,182 @@
+"""fake_loki.py
+
+An in-memory Loki answering `query_range` and metric `query` requests, for `httpx.MockTransport` and as a
+`requests` adapter, and a local websocket server standing in for its tail API."""
+
+import asyncio
+import io
+import json
+import re
+from typing import Callable
+from urllib.parse import parse_qs, urlparse
+
+import httpx
+import requests  # type: ignore
+from requests.adapters import BaseAdapter  # type: ignore
+from websockets.asyncio.server import Server, ServerConnection, serve
+
+from app.connectors import NANOSECONDS, LokiEntry
+
+BASE_URL = "http://loki.test"
+
+_LABEL_FILTER = re.compile(r'\|\s*(\w+)\s*(=~|=)\s*"([^"]*)"')
+_RANGE = re.compile(r"\[(\d+)s\]")
+_BY = re.compile(r"sum by \(([^)]*)\)")
+
+
+def _to_ns(value: str) -> int:
+    timestamp = int(value)
+    return timestamp * NANOSECONDS if timestamp < 10**12 else timestamp
+
+
+class FakeLoki:
+    """
+    Serves `entries` the way Loki does: `start` inclusive, `end` exclusive, `limit` lines per direction.
+    Requests for which `fails` returns True are answered with a 500.
+    """
+
+    def __init__(self, entries: list[LokiEntry], fails: Callable[[dict], bool] | None = None):
+        self.entries = sorted(entries, key=lambda entry: entry.timestamp)
+        self.fails = fails
+        self.requests: list[dict] = []
+
+    def matching(self, query: str) -> list[LokiEntry]:
+        entries = self.entries
+        for label, operator, value in _LABEL_FILTER.findall(query):
+            if operator == "=~":
+                allowed = set(value.split("|"))
+                entries = [entry for entry in entries if entry.stream.get(label, "") in allowed]
+            else:
+                entries = [entry for entry in entries if entry.stream.get(label, "") == value]
+        return entries
+
+    def query_range(self, params: dict) -> dict:
+        start, end = _to_ns(params["start"]), _to_ns(params["end"])
+        entries = [entry for entry in self.matching(params["query"]) if start <= entry.timestamp < end]
+        if params.get("direction", "backward") == "backward":
+            entries = entries[::-1]
+        entries = entries[: int(params.get("limit", 100))]
+        streams: dict[str, dict] = {}
+        for entry in entries:
+            key = json.dumps(entry.stream, sort_keys=True)
+            stream = streams.setdefault(key, {"stream": entry.stream, "values": []})
+            stream["values"].append([str(entry.timestamp), entry.line])
+        return {"status": "success", "data": {"resultType": "streams", "result": list(streams.values())}}
+
+    def query(self, params: dict) -> dict:
+        query = params["query"]
+        time_ns = _to_ns(params["time"])
+        range_match = _RANGE.search(query)
+        start = time_ns - int(range_match.group(1)) * NANOSECONDS if range_match else 0
+        by_match = _BY.search(query)
+        by = [label.strip() for label in by_match.group(1).split(",")] if by_match else []
+        counts: dict[tuple, int] = {}
+        for entry in self.matching(query):
+            if start < entry.timestamp <= time_ns:
+                group = tuple(entry.stream.get(label, "") for label in by)
+                counts[group] = counts.get(group, 0) + 1
+        result = [
+            {"metric": {label: value for label, value in zip(by, group) if value}, "value": [time_ns, str(count)]}
+            for group, count in counts.items()
+        ]
+        return {"status": "success", "data": {"resultType": "vector", "result": result}}
+
+    def respond(self, path: str, params: dict) -> tuple[int, dict]:
+        self.requests.append({"path": path, **params})
+        if self.fails is not None and self.fails(params):
+            return 500, {"status": "error"}
+        if path.endswith("/query_range"):
+            return 200, self.query_range(params)
+        if path.endswith("/query"):
+            return 200, self.query(params)
+        return 404, {"status": "error"}
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        status, body = self.respond(request.url.path, dict(request.url.params))
+        return httpx.Response(status, json=body)
+
+    def async_session(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(transport=httpx.MockTransport(self.handle))
+
+    def range_requests(self) -> list[dict]:
+        return [request for request in self.requests if request["path"].endswith("/query_range")]
+
+
+class FakeLokiAdapter(BaseAdapter):
+    """A `requests` transport adapter answering from a `FakeLoki`."""
+
+    def __init__(self, loki: FakeLoki):
+        super().__init__()
+        self.loki = loki
+
+    def send(self, request, **kwargs):
+        url = urlparse(request.url)
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        status, body = self.loki.respond(url.path, params)
+        response = requests.Response()
+        response.status_code = status
+        response.raw = io.BytesIO(json.dumps(body).encode("utf-8"))
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+class FakeTailServer:
+    """
+    A local Loki tail endpoint. Each connection is sent the entries from its `start` onwards, then every entry
+    passed to `publish`, each as one tail message.
+    """
+
+    def __init__(self, entries: list[LokiEntry] | None = None):
+        self.entries = sorted(entries or [], key=lambda entry: entry.timestamp)
+        self.starts: list[int] = []
+        self.connections: set[ServerConnection] = set()
+        self.server: Server | None = None
+
+    @property
+    def base_url(self) -> str:
+        assert self.server is not None
+        host, port = list(self.server.sockets)[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    @staticmethod
+    def message(entries: list[LokiEntry]) -> str:
+        streams = [{"stream": entry.stream, "values": [[str(entry.timestamp), entry.line]]} for entry in entries]
+        return json.dumps({"streams": streams})
+
+    async def handler(self, websocket: ServerConnection) -> None:
+        assert websocket.request is not None
+        params = parse_qs(urlparse(websocket.request.path).query)
+        start = int(params["start"][0])
+        self.starts.append(start)
+        self.connections.add(websocket)
+        try:
+            replay = [entry for entry in self.entries if entry.timestamp >= start]
+            if replay:
+                await websocket.send(self.message(replay))
+            await websocket.wait_closed()
+        finally:
+            self.connections.discard(websocket)
+
+    async def publish(self, entries: list[LokiEntry]) -> None:
+        self.entries.extend(entries)
+        for websocket in list(self.connections):
+            await websocket.send(self.message(entries))
+
+    async def __aenter__(self) -> "FakeTailServer":
+        self.server = await serve(self.handler, "127.0.0.1", 0)
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        assert self.server is not None
+        self.server.close()
+        await asyncio.wait_for(self.server.wait_closed(), 5)
+
+
+def make_entries(count: int, start_ns: int, step_ns: int = NANOSECONDS, **labels) -> list[LokiEntry]:
+    """`count` entries `step_ns` apart from `start_ns`, labelled with `labels`."""
+    stream = {"job": "test", "level": "ERROR", "service": "api", **labels}
+    return [LokiEntry(start_ns + i * step_ns, f"line {i}", stream) for i in range(count)]
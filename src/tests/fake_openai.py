@@ -0,0 +1,107 @@
+"""fake_openai.py
+
+Stand-ins for the chat completion endpoints of the OpenAI SDK clients, answering with scripted replies."""
+
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+from openai import InternalServerError, RateLimitError
+
+from app.tools.llm_client import LLMResponseCache, OpenAIChatClient
+from app.tools.llm_scheduler import LLMScheduler
+
+_REQUEST = httpx.Request("POST", "https://api.openai.test/v1/chat/completions")
+
+
+def rate_limit_error(headers: dict | None = None, code: str | None = None) -> RateLimitError:
+    body = {"code": code} if code else None
+    return RateLimitError("rate limited", response=httpx.Response(429, headers=headers, request=_REQUEST), body=body)
+
+
+def server_error() -> InternalServerError:
+    return InternalServerError("server error", response=httpx.Response(500, request=_REQUEST), body=None)
+
+
+def usage(prompt_tokens: int = 10, completion_tokens: int = 5) -> SimpleNamespace:
+    return SimpleNamespace(
+        prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, total_tokens=prompt_tokens + completion_tokens
+    )
+
+
+def completion(content: str) -> SimpleNamespace:
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=usage())
+
+
+class FakeStream:
+    """The chunks of a streamed completion: one per piece, then a usage chunk without choices."""
+
+    def __init__(self, pieces: list[str], fail_after: int | None = None):
+        self.pieces = pieces
+        self.fail_after = fail_after
+        self.closed = False
+
+    async def __aiter__(self):
+        for i, piece in enumerate(self.pieces):
+            if i == self.fail_after:
+                raise server_error()
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=piece))], usage=None)
+        yield SimpleNamespace(choices=[], usage=usage())
+
+    async def close(self) -> None:
+        self.closed = True
+
+
+class FakeCompletions:
+    """
+    Answers `create` calls with `replies` in turn: a string is the completion, a list of strings the pieces of
+    a stream, a `FakeStream` itself, and an exception is raised. Requests in flight are counted.
+    """
+
+    def __init__(self, replies: list, delay: float = 0.0):
+        self.replies = list(replies)
+        self.delay = delay
+        self.calls: list[dict] = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def _next(self, kwargs: dict):
+        self.calls.append(kwargs)
+        reply = self.replies.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        if kwargs.get("stream"):
+            return reply if isinstance(reply, FakeStream) else FakeStream(list(reply))
+        return completion(reply)
+
+    def create(self, **kwargs):
+        return self._next(kwargs)
+
+    async def acreate(self, **kwargs):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+            return self._next(kwargs)
+        finally:
+            self.in_flight -= 1
+
+
+def fake_chat_client(replies: list, model: str = "gpt-4o-mini", delay: float = 0.0) -> OpenAIChatClient:
+    """An `OpenAIChatClient` whose sync and async clients answer from the same `FakeCompletions`."""
+    client = OpenAIChatClient(api_key="test-key", model=model)
+    completions = FakeCompletions(replies, delay)
+    client.client = SimpleNamespace(chat=SimpleNamespace(completions=completions))  # type: ignore[assignment]
+    client.async_client = SimpleNamespace(  # type: ignore[assignment]
+        chat=SimpleNamespace(completions=SimpleNamespace(create=completions.acreate))
+    )
+    client.scheduler = LLMScheduler()
+    return client
+
+
+def completions_of(client: OpenAIChatClient) -> FakeCompletions:
+    return client.client.chat.completions  # type: ignore[return-value]
+
+
+def empty_llm_cache(directory: str) -> LLMResponseCache:
+    return LLMResponseCache(enabled=True, directory=directory)
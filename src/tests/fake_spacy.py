@@ -0,0 +1,35 @@
+"""fake_spacy.py
+
+A stand-in for a spaCy pipeline with word vectors, so embedding code can be tested without a model package."""
+
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+
+def vector(text: str) -> np.ndarray:
+    """The fake embedding of `text`: its length and the code of its first character."""
+    return np.array([len(text), ord(text[0]) if text else 0], dtype=np.float32)
+
+
+class FakeNLP:
+    def pipe(self, texts, batch_size: int | None = None):
+        for text in texts:
+            yield SimpleNamespace(vector=vector(text))
+
+
+class FakeLoader:
+    """Replaces `spacy.load`, counting the loads and taking `delay` seconds for each."""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.loads: list[tuple[str, list]] = []
+        self._lock = threading.Lock()
+
+    def __call__(self, model_name: str, exclude: list | None = None) -> FakeNLP:
+        time.sleep(self.delay)
+        with self._lock:
+            self.loads.append((model_name, list(exclude or [])))
+        return FakeNLP()
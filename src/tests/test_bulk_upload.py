@@ -0,0 +1,76 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from app.database.bulk_upload import BulkUploader
+
+
+class FakeBackend:
+    """Records upserted chunks, failing the first `failures` calls, and the most chunks seen in flight."""
+
+    def __init__(self, failures: int = 0, delay: float = 0.0):
+        self.failures = failures
+        self.delay = delay
+        self.chunks: list[tuple[list, list, list]] = []
+        self.waits: set[bool] = set()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def upsert(self, collection_name, points, wait=True):
+        with self._lock:
+            self.waits.add(wait)
+            if self.failures:
+                self.failures -= 1
+                raise ConnectionError("qdrant unavailable")
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.delay)
+        with self._lock:
+            self.in_flight -= 1
+            self.chunks.append((points.ids, points.vectors, points.payloads))
+
+
+def uploader(backend: FakeBackend, **kwargs) -> BulkUploader:
+    return BulkUploader(backend, "logs", backoff_seconds=0.001, **kwargs)  # type: ignore[arg-type]
+
+
+def test_points_are_sent_in_chunks() -> None:
+    backend = FakeBackend()
+    uploaded: list = []
+    ids = list(range(10))
+    with uploader(backend, chunk_size=4, parallelism=2, wait=False, on_uploaded=uploaded.extend) as upload:
+        upload.submit(ids, np.arange(20, dtype=np.float32).reshape(10, 2), [{"i": i} for i in ids])
+
+    assert upload.uploaded == 10
+    assert sorted(len(chunk_ids) for chunk_ids, _, _ in backend.chunks) == [2, 4, 4]
+    assert sorted(uploaded) == ids
+    assert backend.waits == {False}
+    points = {i: (vector, payload) for chunk in backend.chunks for i, vector, payload in zip(*chunk)}
+    assert points[7] == ([14.0, 15.0], {"i": 7})
+
+
+def test_in_flight_chunks_are_bounded():
+    backend = FakeBackend(delay=0.02)
+    with uploader(backend, chunk_size=1, parallelism=3) as upload:
+        upload.submit(list(range(12)), np.zeros((12, 2)), [{}] * 12)
+    assert upload.uploaded == 12
+    assert 1 < backend.max_in_flight <= 3
+
+
+def test_failed_chunks_are_retried():
+    backend = FakeBackend(failures=2)
+    with uploader(backend, chunk_size=10, parallelism=1, max_retries=2) as upload:
+        upload.submit([1, 2], np.zeros((2, 2)), [{}, {}])
+    assert upload.uploaded == 2
+
+
+def test_close_raises_when_a_chunk_keeps_failing():
+    backend = FakeBackend(failures=5)
+    upload = uploader(backend, chunk_size=10, parallelism=1, max_retries=1)
+    upload.submit([1, 2], np.zeros((2, 2)), [{}, {}])
+    with pytest.raises(ConnectionError):
+        upload.close()
+    assert upload.uploaded == 0
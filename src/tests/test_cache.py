@@ -0,0 +1,108 @@
+import time
+
+import pytest
+
+from app.cache import DiskCache, LRUCache, TieredCache
+from app.connectors import NANOSECONDS, LokiEntry, LokiResultCache
+
+
+def test_lru_evicts_the_least_recently_used_item():
+    cache = LRUCache(max_items=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+
+
+def test_lru_expires_items_after_their_ttl():
+    cache = LRUCache(max_items=2)
+    cache.set("a", 1, ttl=0.01)
+    time.sleep(0.02)
+    assert cache.get("a") is None
+
+
+def test_lru_is_bounded_by_bytes():
+    cache = LRUCache(max_items=100, max_bytes=10, sizeof=len)
+    cache.set("a", "xxxx")
+    cache.set("b", "xxxx")
+    cache.set("c", "xxxx")
+    assert cache.get("a") is None
+    assert cache.nbytes == 8
+    # A value larger than the whole cache is not kept, and does not evict the others.
+    cache.set("d", "x" * 11)
+    assert cache.get("d") is None
+    assert cache.get("b") == "xxxx"
+    # Replacing a value accounts for the old one leaving.
+    cache.set("b", "xx")
+    assert cache.nbytes == 6
+
+
+def test_lru_needs_sizeof_with_max_bytes():
+    with pytest.raises(ValueError):
+        LRUCache(max_items=1, max_bytes=1)
+
+
+def test_disk_hits_keep_their_ttl(tmp_path):
+    disk = DiskCache(str(tmp_path), max_bytes=1024 * 1024)
+    TieredCache(LRUCache(4), disk).set("key", "value", ttl=0.2, persist=True)
+
+    # A new process reading the entry from disk must still expire it.
+    restarted = TieredCache(LRUCache(4), disk)
+    assert restarted.get("key") == "value"
+    time.sleep(0.25)
+    assert restarted.get("key") is None
+
+
+def test_disk_hits_without_ttl_never_expire(tmp_path):
+    disk = DiskCache(str(tmp_path), max_bytes=1024 * 1024)
+    TieredCache(LRUCache(4), disk).set("key", "value")
+
+    restarted = TieredCache(LRUCache(4), disk)
+    assert restarted.get("key") == "value"
+    assert restarted.memory.get("key") == "value"
+
+
+def test_disk_cache_evicts_above_max_bytes(tmp_path):
+    disk = DiskCache(str(tmp_path), max_bytes=2000)
+    for i in range(10):
+        disk.set(f"key {i}", "x" * 500)
+    assert sum(path.stat().st_size for path in tmp_path.iterdir()) <= 2000
+    assert disk.get("key 9") == "x" * 500
+
+
+def test_disk_cache_overwrites_count_once(tmp_path):
+    disk = DiskCache(str(tmp_path), max_bytes=10_000)
+    disk.set("other", "y" * 500)
+    for _ in range(5):
+        disk.set("key", "x" * 500)
+    # Only the size difference of an overwritten entry is counted, so the size does not creep up to an eviction.
+    assert disk._size == sum(path.stat().st_size for path in tmp_path.iterdir())
+
+
+def test_loki_result_cache_memory_is_bounded_by_the_lines_held():
+    cache = LokiResultCache(enabled=True, directory=None, max_items=1000, max_bytes=64 * 1024)
+    page = [LokiEntry(i, "x" * 100, {"job": "test"}) for i in range(100)]
+    closed_window = {"query": '{job="test"}', "start": 1, "end": 2, "limit": 100}
+    for i in range(50):
+        cache.set("http://loki.test", {**closed_window, "start": i}, page)
+    stats = cache.stats()
+    assert stats["bytes"] <= 64 * 1024
+    assert 0 < stats["items"] < 50
+
+
+def test_loki_results_of_closed_windows_are_kept_and_of_open_ones_expire():
+    cache = LokiResultCache(enabled=True, directory=None, open_ttl_seconds=0.01, ingestion_delay_seconds=60)
+    page = [LokiEntry(1, "line", {"job": "test"})]
+    closed_window = {"query": '{job="test"}', "start": 1_700_000_000, "end": 1_700_000_060, "limit": 100}
+    open_window = {**closed_window, "end": time.time_ns()}
+    cache.set("http://loki.test", closed_window, page)
+    cache.set("http://loki.test", open_window, page)
+
+    # The key is normalised, so the same window in nanoseconds or with other spacing shares the result.
+    same_window = {**closed_window, "query": '{job="test"} ', "end": 1_700_000_060 * NANOSECONDS}
+    assert cache.get("http://loki.test/", same_window) == page
+    time.sleep(0.02)
+    assert cache.get("http://loki.test", closed_window) == page
+    assert cache.get("http://loki.test", open_window) is None
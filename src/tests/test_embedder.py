@@ -0,0 +1,47 @@
+import threading
+
+import pytest
+
+from app.database import processors
+from app.database.processors import SpacyEmbedder, embedder_ready, get_embedder
+from tests.fake_spacy import FakeLoader, vector
+
+
+@pytest.fixture
+def loader(monkeypatch) -> FakeLoader:
+    loader = FakeLoader(delay=0.05)
+    monkeypatch.setattr(processors.spacy, "load", loader)
+    return loader
+
+
+def test_the_model_is_loaded_once_across_threads(loader):
+    embedder = SpacyEmbedder("fake-model", exclude=["parser", "ner"])
+    threads = [threading.Thread(target=embedder.load) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert loader.loads == [("fake-model", ["parser", "ner"])]
+    assert embedder.ready
+    embedder.embed(["a", "b"])
+    assert len(loader.loads) == 1
+
+
+def test_loading_is_lazy(loader):
+    embedder = SpacyEmbedder("fake-model")
+    assert not embedder.ready and not loader.loads
+    assert embedder.embed_array(["abc", "x"]).tolist() == [vector("abc").tolist(), vector("x").tolist()]
+    assert embedder.ready
+
+
+def test_empty_input_embeds_to_an_empty_array(loader):
+    assert SpacyEmbedder("fake-model").embed_array([]).shape == (0, 0)
+
+
+def test_one_embedder_per_model_name(loader):
+    assert get_embedder("fake-shared") is get_embedder("fake-shared")
+    assert get_embedder("fake-shared") is not get_embedder("fake-other")
+    assert not embedder_ready("fake-shared")
+    get_embedder("fake-shared").load()
+    assert embedder_ready("fake-shared")
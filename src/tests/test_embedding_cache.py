@@ -0,0 +1,77 @@
+import numpy as np
+
+from app.database import processors
+from app.database.embedding_cache import (
+    EmbeddingCache,
+    EmbeddingDiskStore,
+    normalise_text,
+    text_key,
+)
+from app.database.processors import EmbeddingPool, generate_embedding_batches
+from tests.fake_spacy import FakeLoader, vector
+
+
+def test_keys_ignore_whitespace():
+    assert normalise_text("  disk   full\n") == "disk full"
+    assert text_key("disk full") == text_key("disk  full ")
+    assert text_key("disk full") != text_key("disk empty")
+
+
+def test_disk_store_persists_vectors(tmp_path):
+    store = EmbeddingDiskStore(str(tmp_path), "model-a")
+    store.add(["a", "b"], np.array([[1.0, 2.0], [3.0, 4.0]]))
+
+    reloaded = EmbeddingDiskStore(str(tmp_path), "model-a")
+    assert reloaded.get("b").tolist() == [3.0, 4.0]
+    assert reloaded.get("c") is None
+
+
+def test_disk_store_of_another_model_is_discarded_without_touching_other_files(tmp_path):
+    unrelated = tmp_path / "unrelated.txt"
+    unrelated.write_text("keep me")
+    (tmp_path / "nested").mkdir()
+    EmbeddingDiskStore(str(tmp_path), "model-a").add(["a"], np.array([[1.0, 2.0]]))
+
+    store = EmbeddingDiskStore(str(tmp_path), "model-b")
+    assert store.get("a") is None
+    assert unrelated.read_text() == "keep me"
+    assert (tmp_path / "nested").is_dir()
+    assert not (tmp_path / "vectors.f32").exists()
+
+
+def test_disk_store_keeps_rows_present_in_both_files(tmp_path):
+    EmbeddingDiskStore(str(tmp_path), "model-a").add(["a", "b"], np.array([[1.0, 2.0], [3.0, 4.0]]))
+    # An append interrupted after the vectors were written but before their key.
+    with open(tmp_path / "vectors.f32", "ab") as f:
+        f.write(np.array([5.0, 6.0], dtype=np.float32).tobytes())
+
+    store = EmbeddingDiskStore(str(tmp_path), "model-a")
+    assert sorted(store.rows) == ["a", "b"]
+    assert (tmp_path / "vectors.f32").stat().st_size == 2 * 2 * 4
+
+
+def test_each_distinct_text_is_embedded_once(tmp_path, monkeypatch) -> None:
+    monkeypatch.setattr(processors.spacy, "load", FakeLoader())
+    cache = EmbeddingCache(model_name="fake-model", directory=str(tmp_path))
+    pool = EmbeddingPool(processes=1, model_name="fake-model")
+    embedded: list[str] = []
+    embed_batches = pool.embed_batches
+
+    def counting_embed_batches(texts, batch_size=None):
+        texts = list(texts)
+        embedded.extend(texts)
+        return embed_batches(texts, batch_size)
+
+    monkeypatch.setattr(pool, "embed_batches", counting_embed_batches)
+    monkeypatch.setattr(processors, "get_embedding_cache", lambda: cache)
+    monkeypatch.setattr(processors, "get_embedding_pool", lambda: pool)
+
+    texts = ["disk full", "oom", "disk  full", "oom", "timeout"]
+    batches = list(generate_embedding_batches(texts, batch_size=2))
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+    assert np.concatenate(batches).tolist() == [vector(normalise_text(text)).tolist() for text in texts]
+    assert embedded == ["disk full", "oom", "timeout"]
+
+    list(generate_embedding_batches(["timeout", "oom"]))
+    assert embedded == ["disk full", "oom", "timeout"]
+    assert cache.stats()["duplicates"] == 2
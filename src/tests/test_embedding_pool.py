@@ -0,0 +1,28 @@
+import numpy as np
+
+from app.database import processors
+from app.database.processors import EmbeddingPool
+from tests.fake_spacy import FakeLoader, vector
+
+
+def test_in_process_batches_keep_the_input_order(monkeypatch):
+    monkeypatch.setattr(processors.spacy, "load", FakeLoader())
+    texts = ["x" * i for i in range(1, 26)]
+    batches = list(EmbeddingPool(processes=1, model_name="fake-pool").embed_batches(texts, batch_size=10))
+
+    assert [len(batch) for batch in batches] == [10, 10, 5]
+    assert np.concatenate(batches).tolist() == [vector(text).tolist() for text in texts]
+
+
+def test_worker_processes_return_every_batch_in_order():
+    pool = EmbeddingPool(processes=2, model_name="blank:en")
+    try:
+        texts = [f"line {i}" for i in range(25)]
+        batches = list(pool.embed_batches(texts, batch_size=4))
+        assert [len(batch) for batch in batches] == [4, 4, 4, 4, 4, 4, 1]
+        assert all(batch.dtype == np.float32 for batch in batches)
+        # The workers stay up for the next call.
+        assert [len(batch) for batch in pool.embed_batches(texts[:3], batch_size=4)] == [3]
+    finally:
+        pool.shutdown()
+    assert pool._executor is None
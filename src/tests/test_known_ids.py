@@ -0,0 +1,112 @@
+import numpy as np
+from qdrant_client.models import Batch, Distance, VectorParams
+
+from app.database.known_ids import KnownIds
+from app.database.local_store import LocalVectorStore
+from app.database.vector_db import QdrantDatabaseClient
+
+Client = getattr(QdrantDatabaseClient, "__wrapped__")
+
+
+def test_contains_before_and_after_merging():
+    known = KnownIds(merge_threshold=3)
+    known.add([5, 1])
+    assert known.contains([1, 2, 5]).tolist() == [True, False, True]
+    known.add([2, 2**64 - 1])
+    # The fourth id merged the recent ids into the sorted array.
+    assert known.contains([1, 2, 3, 2**64 - 1]).tolist() == [True, True, False, True]
+    assert len(known) == 4
+
+
+def test_discard_and_clear():
+    known = KnownIds()
+    known.add([1, 2, 3])
+    known.discard([2])
+    assert known.contains([1, 2, 3]).tolist() == [True, False, True]
+    known.clear()
+    assert len(known) == 0
+    assert known.contains([]).tolist() == []
+
+
+def test_save_and_load(tmp_path):
+    path = str(tmp_path / "ids" / "logs.npz")
+    known = KnownIds(path)
+    known.add([3, 1, 2])
+    known.save({"logs": 3})
+
+    reloaded = KnownIds(path)
+    assert reloaded.load({"logs": 3})
+    assert reloaded.contains([1, 2, 3, 4]).tolist() == [True, True, True, False]
+    assert not KnownIds(path).load({"logs": 4})
+    assert not KnownIds(str(tmp_path / "missing.npz")).load()
+
+
+class CountingStore(LocalVectorStore):
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.retrieved: list[list] = []
+        self.scrolls = 0
+
+    def retrieve(self, collection_name, ids, **kwargs):
+        self.retrieved.append(list(ids))
+        return super().retrieve(collection_name, ids, **kwargs)
+
+    def scroll(self, collection_name, **kwargs):
+        self.scrolls += 1
+        return super().scroll(collection_name, **kwargs)
+
+
+def store_with(store: LocalVectorStore, ids: list) -> None:
+    store.create_collection("logs", vectors_config=VectorParams(size=2, distance=Distance.COSINE))
+    store.upsert("logs", points=Batch(ids=ids, vectors=np.ones((len(ids), 2)).tolist(), payloads=[{}] * len(ids)))
+
+
+def client_on(store: LocalVectorStore, path: str):
+    client = Client(collection_name="logs", partitioned=False, backend="local")
+    client.qdrant_client = store
+    client.known_ids = KnownIds(path)
+    return client
+
+
+def test_warm_reuses_the_file_of_an_unchanged_collection(tmp_path):
+    store = CountingStore(str(tmp_path / "store"))
+    store_with(store, [1, 2])
+    path = str(tmp_path / "ids" / "logs.npz")
+    client_on(store, path).warm_known_ids()
+    assert store.scrolls == 1
+
+    client = client_on(store, path)
+    client.warm_known_ids()
+    assert store.scrolls == 1
+    assert client.known_ids.contains([1, 2]).tolist() == [True, True]
+
+
+def test_warm_ignores_the_file_of_a_recreated_collection(tmp_path):
+    store = CountingStore(str(tmp_path / "store"))
+    store_with(store, [1, 2])
+    path = str(tmp_path / "ids" / "logs.npz")
+    client_on(store, path).close()
+
+    store.delete_collection("logs")
+    store_with(store, [3])
+    client = client_on(store, path)
+    client.warm_known_ids()
+    assert client.known_ids.contains([1, 2, 3]).tolist() == [False, False, True]
+
+
+def test_only_unknown_ids_are_checked_against_the_store(tmp_path):
+    store = CountingStore(str(tmp_path))
+    store.create_collection("logs", vectors_config=VectorParams(size=2, distance=Distance.COSINE))
+    store.upsert("logs", points=Batch(ids=[1, 2], vectors=np.ones((2, 2)).tolist(), payloads=[{}, {}]))
+    client = Client(collection_name="logs", partitioned=False, backend="local")
+    client.qdrant_client = store
+    client.known_ids = KnownIds()
+    client.known_ids.add([3])
+
+    texts, payloads, ids = client._drop_existing(
+        "logs", ["a", "b", "c", "d", "d"], [{}, {}, {}, {}, {}], [1, 3, 4, 5, 5]
+    )
+    assert ids == [4, 5] and texts == ["c", "d"]
+    assert store.retrieved == [[1, 4, 5]]
+    # Ids found in the store are remembered.
+    assert client.known_ids.contains([1]).tolist() == [True]
@@ -0,0 +1,57 @@
+import asyncio
+
+import pytest
+
+from app.tools import llm_client
+from app.tools.llm_client import LLMResponseCache
+from tests.fake_openai import completions_of, empty_llm_cache, fake_chat_client
+
+MESSAGES = [{"role": "user", "content": "Why is the api failing?"}]
+
+
+@pytest.fixture(autouse=True)
+def cache(tmp_path, monkeypatch) -> LLMResponseCache:
+    cache = empty_llm_cache(str(tmp_path))
+    monkeypatch.setattr(llm_client, "llm_cache", cache)
+    return cache
+
+
+def test_deterministic_calls_are_served_from_the_cache(cache):
+    client = fake_chat_client(["  the database is down "])
+    assert client.chat(MESSAGES) == "the database is down"
+    assert client.chat(MESSAGES) == "the database is down"
+    assert asyncio.run(client.achat(MESSAGES)) == "the database is down"
+    assert len(completions_of(client).calls) == 1
+    stats = cache.stats()
+    assert stats["saved_prompt_tokens"] == 20 and stats["saved_completion_tokens"] == 10
+
+
+def test_sampled_calls_and_opted_out_calls_are_not_cached():
+    client = fake_chat_client(["one", "two", "three", "four"])
+    assert [client.chat(MESSAGES, temperature=0.7) for _ in range(2)] == ["one", "two"]
+    assert [client.chat(MESSAGES, cache=False) for _ in range(2)] == ["three", "four"]
+
+
+def test_the_key_covers_every_request_parameter():
+    key = LLMResponseCache.key("gpt-4o-mini", MESSAGES, 0.0, 100)
+    assert key == LLMResponseCache.key("gpt-4o-mini", [dict(MESSAGES[0])], 0.0, 100)
+    assert key != LLMResponseCache.key("gpt-4o", MESSAGES, 0.0, 100)
+    assert key != LLMResponseCache.key("gpt-4o-mini", MESSAGES, 0.0, 200)
+
+
+def test_responses_survive_a_restart(tmp_path, monkeypatch):
+    fake_chat_client(["cached"]).chat(MESSAGES)
+    monkeypatch.setattr(llm_client, "llm_cache", empty_llm_cache(str(tmp_path)))
+    client = fake_chat_client([])
+    assert client.chat(MESSAGES) == "cached"
+
+
+def test_a_zero_ttl_is_not_cached():
+    client = fake_chat_client(["one", "two"])
+    assert client.chat(MESSAGES, cache_ttl=0) == "one"
+    assert client.chat(MESSAGES) == "two"
+
+
+def test_invalid_messages_are_rejected():
+    with pytest.raises(ValueError):
+        fake_chat_client([]).chat([{"content": "no role"}])
@@ -0,0 +1,35 @@
+import asyncio
+
+from app.settings import OPENAI_MAX_CONCURRENCY
+from app.tools.llm_client import llm_semaphore
+from tests.fake_openai import completions_of, fake_chat_client
+
+
+def ask(i: int) -> list[dict]:
+    return [{"role": "user", "content": f"question {i}"}]
+
+
+def test_in_flight_requests_are_capped():
+    count = 3 * OPENAI_MAX_CONCURRENCY
+    client = fake_chat_client([f"answer {i}" for i in range(count)], delay=0.02)
+
+    async def run() -> list[str]:
+        return await asyncio.gather(*(client.achat(ask(i), cache=False) for i in range(count)))
+
+    assert sorted(asyncio.run(run())) == sorted(f"answer {i}" for i in range(count))
+    assert completions_of(client).max_in_flight == OPENAI_MAX_CONCURRENCY
+
+
+def test_each_event_loop_has_its_own_semaphore():
+    async def semaphore() -> asyncio.Semaphore:
+        return llm_semaphore()
+
+    async def same_loop() -> bool:
+        return llm_semaphore() is llm_semaphore()
+
+    assert asyncio.run(same_loop())
+    assert asyncio.run(semaphore()) is not asyncio.run(semaphore())
+    # A client keeps working when called from a new loop, as each `asyncio.run` does.
+    client = fake_chat_client(["one", "two"])
+    assert asyncio.run(client.achat(ask(0), cache=False)) == "one"
+    assert asyncio.run(client.achat(ask(1), cache=False)) == "two"
@@ -0,0 +1,110 @@
+import asyncio
+import time
+
+import pytest
+
+from app.tools.llm_client import LLMRequestError
+from app.tools.llm_scheduler import (
+    PRIORITY_INTERACTIVE,
+    PRIORITY_REPORT,
+    LLMScheduler,
+    TokenBucket,
+    is_retryable,
+    retry_after,
+    retry_delay,
+)
+from tests.fake_openai import (
+    completions_of,
+    fake_chat_client,
+    rate_limit_error,
+    server_error,
+)
+
+MESSAGES = [{"role": "user", "content": "Summarise the errors."}]
+
+
+def test_bucket_refills_continuously_up_to_its_capacity():
+    bucket = TokenBucket(per_minute=60)
+    start = bucket.updated
+    bucket.take(60)
+    assert bucket.wait_time(1, start) == pytest.approx(1.0)
+    assert bucket.wait_time(1, start + 0.5) == pytest.approx(0.5)
+    assert bucket.wait_time(1, start + 1) == 0
+    assert bucket.wait_time(1, start + 3600) == 0 and bucket.level == 60
+    # A request larger than the bucket waits for a full bucket rather than forever.
+    bucket.take(60)
+    assert bucket.wait_time(1000, start + 3600) == pytest.approx(60)
+
+
+def test_settle_returns_the_unused_tokens():
+    scheduler = LLMScheduler(rpm=100, tpm=1000)
+    scheduler.acquire(800)
+    scheduler.settle(800, 300)
+    assert scheduler.stats()["tokens_available"] == pytest.approx(700, abs=5)
+
+
+def test_waiting_requests_are_served_by_priority() -> None:
+    scheduler = LLMScheduler(rpm=1000, tpm=600, poll_seconds=0.01)
+    scheduler.acquire(600)
+    order: list[str] = []
+
+    async def request(name: str, priority: int, delay: float) -> None:
+        await asyncio.sleep(delay)
+        await scheduler.aacquire(2, priority)
+        order.append(name)
+
+    async def run() -> None:
+        await asyncio.gather(
+            request("report", PRIORITY_REPORT, 0),
+            request("interactive", PRIORITY_INTERACTIVE, 0.05),
+        )
+
+    asyncio.run(run())
+    assert order == ["interactive", "report"]
+    assert scheduler.stats()["throttled"] == 2
+
+
+def test_pause_holds_every_request():
+    scheduler = LLMScheduler()
+    scheduler.pause(0.2)
+    started = time.monotonic()
+    scheduler.acquire(1)
+    assert time.monotonic() - started >= 0.2
+
+
+def test_retryable_errors():
+    assert is_retryable(rate_limit_error())
+    assert is_retryable(server_error())
+    assert not is_retryable(rate_limit_error(code="insufficient_quota"))
+    assert not is_retryable(ValueError("bad request"))
+
+
+def test_retry_delay_honours_retry_after():
+    assert retry_after(rate_limit_error({"retry-after-ms": "1500"})) == 1.5
+    assert retry_after(rate_limit_error({"retry-after": "3"})) == 3
+    assert retry_after(server_error()) is None
+    assert 3 <= retry_delay(rate_limit_error({"retry-after": "3"}), 0, base=1, cap=60) <= 4
+    assert retry_delay(rate_limit_error({"retry-after": "300"}), 0, base=1, cap=60) <= 61
+    assert all(0 <= retry_delay(server_error(), 3, base=1, cap=5) <= 5 for _ in range(20))
+
+
+def test_rate_limited_requests_are_retried_after_a_pause():
+    client = fake_chat_client([rate_limit_error({"retry-after-ms": "50"}), server_error(), "ok"])
+    assert client.chat(MESSAGES, cache=False) == "ok"
+    assert len(completions_of(client).calls) == 3
+    assert client.scheduler.stats()["paused"] == 1
+
+
+def test_failures_that_retrying_cannot_fix_raise_at_once():
+    client = fake_chat_client([rate_limit_error(code="insufficient_quota"), "unused"])
+    with pytest.raises(LLMRequestError):
+        client.chat(MESSAGES, cache=False)
+    assert len(completions_of(client).calls) == 1
+    # The tokens reserved by the failed request are given back.
+    assert client.scheduler.stats()["tokens_available"] == pytest.approx(client.scheduler.tokens.capacity, abs=5)
+
+
+def test_async_requests_give_up_after_the_retries():
+    client = fake_chat_client([server_error() for _ in range(10)])
+    with pytest.raises(LLMRequestError, match="attempts"):
+        asyncio.run(client.achat(MESSAGES, cache=False))
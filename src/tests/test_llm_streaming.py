@@ -0,0 +1,131 @@
+import asyncio
+import json
+from contextlib import aclosing
+from types import SimpleNamespace
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.routers import reports
+from app.tools import llm_client
+from app.tools.llm_client import LLMRequestError, OpenAIChatClient
+from app.tools.report_generator import LogReportGenerator
+from app.utils import sse_event
+from tests.fake_openai import (
+    FakeStream,
+    completions_of,
+    empty_llm_cache,
+    fake_chat_client,
+    server_error,
+)
+from tests.test_report_generator import FakeDatabase, FakeKubeClient, FakeLokiClient
+
+MESSAGES = [{"role": "user", "content": "Stream the analysis."}]
+
+
+@pytest.fixture(autouse=True)
+def cache(tmp_path, monkeypatch) -> None:
+    monkeypatch.setattr(llm_client, "llm_cache", empty_llm_cache(str(tmp_path)))
+
+
+async def collect(client: OpenAIChatClient, **kwargs) -> list[str]:
+    return [piece async for piece in client.achat_stream(MESSAGES, **kwargs)]
+
+
+def test_pieces_are_yielded_as_they_arrive_and_cached_whole():
+    client = fake_chat_client([["The ", "database ", "is down. "]])
+    assert asyncio.run(collect(client)) == ["The ", "database ", "is down. "]
+    assert completions_of(client).calls[0]["stream"] is True
+    # The cached response is yielded in one piece, and is what `achat` returns.
+    assert asyncio.run(collect(client)) == ["The database is down."]
+    assert asyncio.run(client.achat(MESSAGES)) == "The database is down."
+    assert len(completions_of(client).calls) == 1
+
+
+def test_a_failure_before_the_first_piece_is_retried():
+    client = fake_chat_client([server_error(), ["ok"]])
+    assert asyncio.run(collect(client)) == ["ok"]
+    assert len(completions_of(client).calls) == 2
+
+
+def record_settles(client: OpenAIChatClient, monkeypatch) -> list[tuple[int, int]]:
+    settled: list[tuple[int, int]] = []
+    monkeypatch.setattr(client.scheduler, "settle", lambda reserved, used: settled.append((reserved, used)))
+    return settled
+
+
+def test_a_failure_after_pieces_were_sent_raises(monkeypatch) -> None:
+    stream = FakeStream(["The ", "database"], fail_after=1)
+    client = fake_chat_client([stream, ["unused"]])
+    settled = record_settles(client, monkeypatch)
+    pieces: list[str] = []
+
+    async def run() -> None:
+        async for piece in client.achat_stream(MESSAGES):
+            pieces.append(piece)
+
+    with pytest.raises(LLMRequestError):
+        asyncio.run(run())
+    assert pieces == ["The "]
+    assert stream.closed
+    assert len(completions_of(client).calls) == 1
+    # The reservation is settled with the estimate, as the stream reported no usage.
+    [(reserved, used)] = settled
+    assert 0 < used < reserved
+
+
+def test_a_stream_stopped_early_is_settled(monkeypatch) -> None:
+    stream = FakeStream(["The ", "database ", "is down."])
+    client = fake_chat_client([stream])
+    settled = record_settles(client, monkeypatch)
+
+    async def run() -> None:
+        async with aclosing(client.achat_stream(MESSAGES)) as pieces:
+            async for _ in pieces:
+                break
+
+    asyncio.run(run())
+    assert stream.closed
+    assert len(settled) == 1
+
+
+def test_a_failed_stream_still_saves_the_report(tmp_path) -> None:
+    generator = LogReportGenerator(
+        openai_client=fake_chat_client([FakeStream(["All ", "good."], fail_after=1)]),
+        kube_client=FakeKubeClient(),  # type: ignore[arg-type]
+        loki_client=FakeLokiClient(),  # type: ignore[arg-type]
+    )
+    generator.database_client = FakeDatabase()  # type: ignore[assignment]
+    generator.reports_dir = str(tmp_path)
+
+    async def run() -> list[dict]:
+        return [event async for event in generator.astream_report()]
+
+    events = asyncio.run(run())
+    assert events[0] == {"delta": "All "}
+    assert events[1]["result"]["log_analysis"].startswith("Log analysis failed")
+
+
+def test_sse_event():
+    assert sse_event({"delta": "a\nb"}) == 'data: {"delta": "a\\nb"}\n\n'
+
+
+def test_the_report_endpoint_streams_the_analysis(tmp_path):
+    generator = LogReportGenerator(
+        openai_client=fake_chat_client([["All ", "good."]]),
+        kube_client=FakeKubeClient(),  # type: ignore[arg-type]
+        loki_client=FakeLokiClient(),  # type: ignore[arg-type]
+    )
+    generator.database_client = FakeDatabase()  # type: ignore[assignment]
+    generator.reports_dir = str(tmp_path)
+    app = FastAPI()
+    app.include_router(reports.router)
+    app.state.scheduler = SimpleNamespace(report_generator=generator)
+
+    with TestClient(app) as http:
+        response = http.post("/generate_report/stream", json={"hours": 1})
+    events = [json.loads(line.removeprefix("data: ")) for line in response.text.splitlines() if line]
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert events[:2] == [{"delta": "All "}, {"delta": "good."}]
+    assert events[2]["result"]["log_analysis"] == "All good."
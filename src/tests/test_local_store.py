@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+from qdrant_client.models import (
+    Batch,
+    Distance,
+    FieldCondition,
+    Filter,
+    MatchValue,
+    SearchParams,
+    VectorParams,
+)
+
+from app.benchmarks.collection_profiles import build_vectors
+from app.database.local_store import LocalVectorStore
+
+DIM = 32
+
+
+def open_store(path, **kwargs) -> LocalVectorStore:
+    return LocalVectorStore(str(path), **kwargs)
+
+
+def create(store: LocalVectorStore, vectors: np.ndarray, payloads: list[dict] | None = None) -> None:
+    store.create_collection("logs", vectors_config=VectorParams(size=vectors.shape[1], distance=Distance.COSINE))
+    point_ids: list[int | str] = list(range(len(vectors)))
+    rows: list[list[float]] = vectors.tolist()  # type: ignore[assignment]
+    store.upsert("logs", points=Batch(ids=point_ids, vectors=rows, payloads=payloads or [{}] * len(point_ids)))
+
+
+def ids(points) -> list[int]:
+    return [point.id for point in points]
+
+
+def test_ann_search_recalls_the_exact_neighbours(tmp_path):
+    vectors = build_vectors(6000, DIM, clusters=40, seed=0)
+    store = open_store(tmp_path, ann_min_points=1000, nprobe=8)
+    create(store, vectors)
+    assert store.collection("logs")._centroids is not None
+
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.integers(0, len(vectors), size=50)] + 0.1 * rng.normal(size=(50, DIM))
+    found = total = 0
+    for query in queries:
+        exact = ids(store.search("logs", query, limit=10, search_params=SearchParams(exact=True)))
+        approximate = ids(store.search("logs", query, limit=10))
+        found += len(set(exact) & set(approximate))
+        total += len(exact)
+    assert found / total >= 0.9
+
+
+def test_exact_search_orders_by_cosine_similarity(tmp_path):
+    store = open_store(tmp_path)
+    create(store, np.array([[1.0, 0.0], [0.6, 0.8], [0.0, 1.0]]))
+    results = store.search("logs", [1.0, 0.1], limit=2)
+    assert ids(results) == [0, 1]
+    assert results[0].score == pytest.approx(1 / np.sqrt(1.01), rel=1e-5)
+
+
+def test_filters_and_overwrites(tmp_path):
+    store = open_store(tmp_path)
+    create(store, np.eye(3), [{"level": "ERROR"}, {"level": "INFO"}, {"level": "ERROR"}])
+    store.upsert("logs", points=Batch(ids=[0], vectors=[[0.0, 1.0, 0.0]], payloads=[{"level": "INFO"}]))
+
+    errors = Filter(must=[FieldCondition(key="level", match=MatchValue(value="ERROR"))])
+    assert ids(store.search("logs", [1.0, 0.0, 0.0], limit=5, query_filter=errors)) == [2]
+    assert store.count("logs").count == 3
+    assert store.retrieve("logs", [0])[0].payload == {"level": "INFO"}
+
+
+def test_reopening_restores_points_and_index(tmp_path):
+    vectors = build_vectors(1500, DIM, clusters=10, seed=2)
+    store = open_store(tmp_path, ann_min_points=1000)
+    create(store, vectors, [{"i": i} for i in range(len(vectors))])
+    store.close()
+
+    reopened = open_store(tmp_path, ann_min_points=1000)
+    collection = reopened.collection("logs")
+    assert len(collection) == 1500 and collection._centroids is not None
+    assert ids(reopened.search("logs", vectors[7], limit=1)) == [7]
+    records, offset = reopened.scroll("logs", limit=1000)
+    assert len(records) == 1000 and offset == 1000
+
+
+def test_a_write_cut_short_is_dropped_on_open(tmp_path):
+    store = open_store(tmp_path)
+    create(store, np.eye(2))
+    with open(tmp_path / "logs" / "points.jsonl", "a") as f:
+        f.write('[5, {"partial": ')
+
+    reopened = open_store(tmp_path)
+    assert reopened.count("logs").count == 2
+    reopened.upsert("logs", points=Batch(ids=[5], vectors=[[1.0, 1.0]], payloads=[{}]))
+    assert open_store(tmp_path).retrieve("logs", [5])[0].id == 5
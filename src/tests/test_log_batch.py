@@ -0,0 +1,62 @@
+from app.connectors import LokiEntry
+from app.log_batch import LogBatch
+
+API = {"job": "test", "service": "api", "level": "ERROR"}
+WEB = {"job": "test", "service": "web", "level": "INFO"}
+
+
+def entries() -> list[LokiEntry]:
+    return [
+        LokiEntry(1, "first", API),
+        LokiEntry(2, "zweite – ünïcode", dict(WEB)),
+        LokiEntry(3, "third", dict(API)),
+    ]
+
+
+def test_round_trips_entries():
+    batch = LogBatch.from_entries(entries())
+    assert list(batch) == entries()
+    assert len(batch) == 3
+    assert batch[1] == entries()[1]
+    assert batch[-1] == entries()[-1]
+
+
+def test_interns_identical_stream_labels():
+    batch = LogBatch.from_entries(entries())
+    assert batch.streams == [API, WEB]
+    assert batch.stream_ids.tolist() == [0, 1, 0]
+
+
+def test_slices_share_the_buffer():
+    batch = LogBatch.from_entries(entries())
+    tail = batch[1:]
+    assert isinstance(tail, LogBatch)
+    assert tail.buffer is batch.buffer
+    assert list(tail) == entries()[1:]
+
+
+def test_filters_by_level_and_service():
+    batch = LogBatch.from_entries(entries())
+    assert [entry.line for entry in batch.filter(level="error")] == ["first", "third"]
+    assert [entry.line for entry in batch.filter(service="web")] == ["zweite – ünïcode"]
+
+
+def test_sorts_by_timestamp():
+    batch = LogBatch.from_entries(entries()[::-1])
+    assert [entry.timestamp for entry in batch.sort()] == [1, 2, 3]
+    assert [entry.timestamp for entry in batch.sort(reverse=True)] == [3, 2, 1]
+
+
+def test_texts_prefer_the_parsed_message_label():
+    batch = LogBatch.from_entries(
+        [LokiEntry(1, '{"message": "parsed"}', {"message": "parsed"}), LokiEntry(2, "raw", API)]
+    )
+    assert batch.texts() == ["parsed", "raw"]
+    assert batch.payloads()[1] == {**API, "ts": 2}
+    assert list(batch.formatted())[1] == "[ERROR] api: raw"
+
+
+def test_empty_batch():
+    batch = LogBatch.from_entries([])
+    assert len(batch) == 0
+    assert list(batch) == []
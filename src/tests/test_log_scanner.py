@@ -0,0 +1,54 @@
+import asyncio
+import re
+import time
+
+from app.connectors import NANOSECONDS, LokiEntry, aligned_now_ns
+from app.tools.log_scanner import LogScanner
+from tests.fake_loki import BASE_URL, FakeLoki, make_entries
+
+HOUR_NS = 60 * 60 * NANOSECONDS
+
+
+def log_scanner(loki: FakeLoki, job_name: str) -> LogScanner:
+    scanner = LogScanner(BASE_URL, job_name, open_ai_api_key="test-key")
+    scanner._async_session = loki.async_session()
+    return scanner
+
+
+def test_streams_to_scan_count_over_the_scan_window_only():
+    now_ns = time.time_ns()
+    loki = FakeLoki(make_entries(2, start_ns=now_ns - 3 * HOUR_NS, service="api"))
+    scanner = log_scanner(loki, "lagging")
+    watermark = scanner.watermark(level="ERROR", service="api")
+    watermark.last_seen_ns = now_ns - 4 * HOUR_NS
+    watermark.save()
+
+    # A lagging watermark does not widen the count past the scan window.
+    assert asyncio.run(scanner._get_streams_to_scan(["ERROR", "WARN"], aligned_now_ns())) == []
+    query = next(request["query"] for request in loki.requests if request["path"].endswith("/query"))
+    assert int(re.search(r"\[(\d+)s\]", query).group(1)) < 2 * 60 * 60
+
+
+def test_streams_to_scan_count_from_the_last_scan():
+    now_ns = time.time_ns()
+    loki = FakeLoki(make_entries(2, start_ns=now_ns - HOUR_NS // 2, service="api"))
+    scanner = log_scanner(loki, "last-scan")
+    assert asyncio.run(scanner._get_streams_to_scan(["ERROR"], aligned_now_ns())) == [
+        {"level": "ERROR", "service": "api"}
+    ]
+
+    scanner.last_scan_ns = now_ns - HOUR_NS // 4
+    assert asyncio.run(scanner._get_streams_to_scan(["ERROR"], aligned_now_ns())) == []
+
+
+def test_lines_without_a_service_are_scanned_on_their_own():
+    start_ns = time.time_ns() - HOUR_NS // 2
+    unlabelled = [LokiEntry(start_ns + 10, "no service", {"job": "test", "level": "ERROR"})]
+    loki = FakeLoki(make_entries(2, start_ns=start_ns, service="api") + unlabelled)
+    scanner = log_scanner(loki, "unlabelled")
+
+    queries = asyncio.run(scanner._get_streams_to_scan(["ERROR", "WARN"], aligned_now_ns()))
+    assert queries == [{"level": "ERROR", "service": ""}, {"level": "ERROR", "service": "api"}]
+
+    results = asyncio.run(scanner.gather_loki_logs(queries, since_watermark=True))
+    assert [[entry.line for entry in entries] for entries in results] == [["no service"], ["line 0", "line 1"]]
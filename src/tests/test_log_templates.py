@@ -0,0 +1,113 @@
+import json
+import logging
+import threading
+
+from app.connectors import NANOSECONDS, LokiEntry
+from app.log_batch import LogBatch
+from app.log_templates import PARAM, TemplateMiner, tokenize
+
+DAY_NS = 24 * 60 * 60 * NANOSECONDS
+
+
+def test_tokenize_masks_variables():
+    raw, masked = tokenize("user 42 from 10.0.0.1:8080 took 35ms (id=abc)")
+    assert raw[1] == "42"
+    assert masked == ["user", PARAM, "from", PARAM, "took", PARAM, "(id=abc)"]
+
+
+def test_differing_tokens_become_parameters():
+    miner = TemplateMiner()
+    first, _ = miner.add("connection to db-a refused", 1)
+    second, params = miner.add("connection to db-b refused", 2)
+    assert second is first
+    assert second.template == f"connection to {PARAM} refused"
+    assert params == ["db-b"]
+    assert (second.count, second.first_seen, second.last_seen) == (2, 1, 2)
+
+
+def test_add_batch_groups_by_service_and_level():
+    batch = LogBatch.from_entries(
+        [
+            LokiEntry(1, "request failed", {"service": "api", "level": "error"}),
+            LokiEntry(2, "request failed", {"service": "api", "level": "ERROR"}),
+            LokiEntry(3, "request failed", {"service": "web", "level": "ERROR"}),
+        ]
+    )
+    templates = TemplateMiner().add_batch(batch)
+    assert sorted(template.count for template in templates) == [1, 2]
+
+
+def test_save_and_load_round_trip(tmp_path):
+    path = str(tmp_path / "templates.json")
+    miner = TemplateMiner()
+    template, _ = miner.add("job 17 finished in 3s", 5, ("test", "api", "INFO"))
+    miner.save(path)
+
+    restored = TemplateMiner.load(path)
+    same, _ = restored.add("job 18 finished in 4s", 6, ("test", "api", "INFO"))
+    assert same.id == template.id and same.count == 2
+    assert [p.name for p in tmp_path.iterdir()] == ["templates.json"]
+
+
+def test_save_if_due_waits_for_the_interval(tmp_path):
+    path = tmp_path / "templates.json"
+    miner = TemplateMiner()
+    miner.add("job 17 finished in 3s", 5)
+    assert not miner.save_if_due(str(path), interval_seconds=60)
+    assert not path.exists()
+    assert miner.save_if_due(str(path), interval_seconds=0)
+    assert path.exists()
+
+
+def test_concurrent_saves_all_succeed(tmp_path, caplog):
+    path = str(tmp_path / "templates.json")
+    miner = TemplateMiner()
+    for i in range(50):
+        miner.add(f"{'x' * (i + 1)} happened " + "y" * 20000, i)
+
+    threads = [threading.Thread(target=miner.save, args=(path,)) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    with open(path) as f:
+        assert len(json.load(f)["templates"]) == 50
+    assert not [record for record in caplog.records if record.levelno >= logging.ERROR]
+    assert [p.name for p in tmp_path.iterdir()] == ["templates.json"]
+
+
+def test_prune_drops_templates_not_seen_for_too_long():
+    miner = TemplateMiner(max_age_days=1)
+    now_ns = 10 * DAY_NS
+    stale, _ = miner.add("old event", now_ns - 2 * DAY_NS)
+    fresh, _ = miner.add("new event", now_ns)
+
+    assert miner.prune(now_ns) == 1
+    assert list(miner.templates) == [fresh.id]
+    # A pruned template that comes back gets a new id, and joins the tree again.
+    back, _ = miner.add("old event", now_ns)
+    assert back.id not in (stale.id, fresh.id)
+    assert miner.add("old event", now_ns)[0] is back
+
+
+def test_prune_keeps_the_most_recently_seen_templates():
+    miner = TemplateMiner(max_templates=2, max_age_days=0)
+    for i, word in enumerate(["alpha", "beta", "gamma", "delta", "epsilon"]):
+        miner.add(f"{word} happened", i)
+
+    assert miner.prune() == 3
+    assert sorted(template.example for template in miner.templates.values()) == ["delta happened", "epsilon happened"]
+
+
+def test_ids_are_not_reused_after_a_restart(tmp_path):
+    path = str(tmp_path / "templates.json")
+    miner = TemplateMiner(max_templates=1, max_age_days=0)
+    miner.add("first event", 1)
+    second, _ = miner.add("second event", 2)
+    miner.prune()
+    miner.save(path)
+
+    restored = TemplateMiner.load(path)
+    third, _ = restored.add("third event", 3)
+    assert third.id > second.id
@@ -0,0 +1,72 @@
+import asyncio
+import time
+
+import httpx
+
+from app.connectors import NANOSECONDS, create_async_loki_session
+from app.tools.loki_client import LokiClient
+from tests.fake_loki import BASE_URL, FakeLoki, make_entries
+
+
+class SlowLoki(FakeLoki):
+    """Answers after a short delay and records how many requests were in flight at once."""
+
+    in_flight = 0
+    max_in_flight = 0
+
+    async def ahandle(self, request: httpx.Request) -> httpx.Response:
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(0.05)
+            return self.handle(request)
+        finally:
+            self.in_flight -= 1
+
+
+def loki_client(session: httpx.AsyncClient, job_name: str) -> LokiClient:
+    client = LokiClient(BASE_URL, job_name)
+    client._async_session = session
+    return client
+
+
+def test_gather_runs_the_queries_concurrently():
+    start_ns = time.time_ns() - 30 * 60 * NANOSECONDS
+    loki = SlowLoki(
+        make_entries(3, start_ns=start_ns, level="ERROR") + make_entries(2, start_ns=start_ns, level="WARN")
+    )
+    client = loki_client(httpx.AsyncClient(transport=httpx.MockTransport(loki.ahandle)), "gather")
+
+    results = asyncio.run(client.gather_loki_logs([{"level": "WARN"}, {"level": "ERROR"}, {"level": "DEBUG"}]))
+    assert [len(entries) for entries in results] == [2, 3, 0]
+    assert {entry.stream["level"] for entry in results[0]} == {"WARN"}
+    assert loki.max_in_flight == 3
+
+
+def test_gather_caps_each_query():
+    start_ns = time.time_ns() - 30 * 60 * NANOSECONDS
+    loki = FakeLoki(make_entries(10, start_ns=start_ns))
+    client = loki_client(loki.async_session(), "gather-capped")
+
+    [entries] = asyncio.run(client.gather_loki_logs([{"level": "ERROR"}], max_entries=4))
+    # Without a watermark the newest lines are kept.
+    assert [entry.line for entry in entries] == ["line 9", "line 8", "line 7", "line 6"]
+    assert all(int(request["limit"]) == 4 for request in loki.range_requests())
+
+
+def test_count_groups_by_the_requested_labels():
+    start_ns = time.time_ns() - 30 * 60 * NANOSECONDS
+    loki = FakeLoki(
+        make_entries(3, start_ns=start_ns, service="api") + make_entries(1, start_ns=start_ns, service="web")
+    )
+    client = loki_client(loki.async_session(), "count")
+
+    counts = asyncio.run(client.count_loki_logs(by=["service"], level="ERROR"))
+    assert counts == {("api",): 3, ("web",): 1}
+
+
+def test_async_session_asks_for_gzip():
+    session = create_async_loki_session(timeout=5, max_connections=7)
+    assert session.headers["Accept-Encoding"] == "gzip"
+    assert session.timeout.read == 5
+    asyncio.run(session.aclose())
@@ -0,0 +1,39 @@
+import asyncio
+import io
+import json
+
+import httpx
+
+from app.benchmarks.loki_decode import build_response
+from app.connectors import adecode_loki_streams, decode_loki_streams, flatten_streams
+
+
+def test_streaming_decode_matches_json_loads():
+    body = build_response(streams=3, lines=50)
+    expected = flatten_streams(json.loads(body)["data"]["result"])
+    assert list(decode_loki_streams(io.BytesIO(body))) == expected
+
+
+def test_entries_of_a_stream_share_their_labels():
+    entries = list(decode_loki_streams(io.BytesIO(build_response(streams=2, lines=3))))
+    assert len({id(entry.stream) for entry in entries}) == 2
+
+
+def test_async_decode_reads_small_and_empty_chunks():
+    body = build_response(streams=2, lines=20)
+
+    async def chunks():
+        for start in range(0, len(body), 7):
+            yield b""
+            yield body[start:][:7]
+
+    async def decode() -> list:
+        response = httpx.Response(200, content=chunks())
+        return [entry async for entry in adecode_loki_streams(response)]
+
+    assert asyncio.run(decode()) == flatten_streams(json.loads(body)["data"]["result"])
+
+
+def test_an_empty_result_decodes_to_nothing():
+    body = json.dumps({"status": "success", "data": {"resultType": "streams", "result": []}}).encode()
+    assert list(decode_loki_streams(io.BytesIO(body))) == []
@@ -0,0 +1,109 @@
+import asyncio
+import time
+
+from app.connectors import NANOSECONDS, build_loki_query
+from app.log_batch import LogBatch
+from app.tools.loki_tail import LokiTailIngestor
+from app.tools.watermarks import LokiWatermark
+from tests.fake_loki import FakeLoki, FakeTailServer, make_entries
+
+
+class FakeDatabase:
+    """Records upserted lines, failing the first `failures` upserts."""
+
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.lines: list[str] = []
+
+    def upsert_log_batch(self, batch: LogBatch) -> None:
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("database down")
+        self.lines.extend(entry.line for entry in batch)
+
+
+def tail_ingestor(
+    server: FakeTailServer, job_name: str, database: FakeDatabase, loki: FakeLoki | None = None
+) -> LokiTailIngestor:
+    """A tail on `server` whose catch-up range queries are answered by `loki`."""
+    ingestor = LokiTailIngestor(server.base_url, job_name, batch_size=2, flush_seconds=0.05, max_backoff_seconds=0.05)
+    ingestor.database_client = database  # type: ignore[assignment]
+    ingestor.loki_client.database_client = database  # type: ignore[assignment]
+    ingestor.loki_client._async_session = (loki or FakeLoki([])).async_session()
+    return ingestor
+
+
+async def wait_for(condition, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+def test_tailed_lines_are_upserted_in_batches_and_resume_from_the_watermark():
+    async def run():
+        entries = make_entries(5, start_ns=time.time_ns())
+        database = FakeDatabase()
+        async with FakeTailServer() as server:
+            ingestor = tail_ingestor(server, "tail-resume", database)
+            await ingestor.start()
+            await wait_for(lambda: server.connections)
+            await server.publish(entries[:3])
+            await wait_for(lambda: len(database.lines) == 3)
+            await ingestor.stop()
+
+            restarted = tail_ingestor(server, "tail-resume", database)
+            await restarted.start()
+            await wait_for(lambda: len(server.starts) == 2)
+            await server.publish(entries[3:])
+            await wait_for(lambda: len(database.lines) == 5)
+            await restarted.stop()
+        return server
+
+    server = asyncio.run(run())
+    # The restart asked for the lines from the watermark, and the replayed ones were not ingested twice.
+    assert server.starts[1] <= int(server.entries[2].timestamp)
+
+
+def test_lines_of_a_failed_upsert_are_kept_and_not_duplicated():
+    async def run():
+        database = FakeDatabase(failures=2)
+        async with FakeTailServer(make_entries(3, start_ns=time.time_ns() - NANOSECONDS)) as server:
+            ingestor = tail_ingestor(server, "tail-failure", database)
+            ingestor.watermark.last_seen_ns = server.entries[0].timestamp - 1
+            await ingestor.start()
+            await wait_for(lambda: len(database.lines) == 3)
+            await ingestor.stop()
+        return database, server
+
+    database, server = asyncio.run(run())
+    assert sorted(database.lines) == ["line 0", "line 1", "line 2"]
+    # The failed upsert dropped the connection, and the reconnect replayed from the unmoved watermark.
+    assert len(server.starts) >= 2
+
+
+def test_the_gap_since_the_watermark_is_fetched_before_the_tail_opens():
+    async def run():
+        entries = make_entries(10, start_ns=time.time_ns() - 20 * NANOSECONDS)
+        database = FakeDatabase()
+        loki = FakeLoki(entries)
+        # The tail replays only `batch_size` lines, the newest ones.
+        async with FakeTailServer(entries[-2:]) as server:
+            ingestor = tail_ingestor(server, "tail-gap", database, loki)
+            ingestor.watermark.advance(entries[:1])
+            await ingestor.start()
+            await wait_for(lambda: server.starts)
+            await ingestor.stop()
+        return database, loki, server
+
+    database, loki, server = asyncio.run(run())
+    assert database.lines == [f"line {i}" for i in range(1, 10)]
+    assert loki.range_requests()
+    assert server.starts[0] >= int(loki.entries[-1].timestamp) - 60 * NANOSECONDS
+
+
+def test_tail_watermark_is_apart_from_the_batch_watermark():
+    job_name = "tail-key"
+    ingestor = LokiTailIngestor("http://loki.test", job_name)
+    batch = LokiWatermark("http://loki.test", job_name, build_loki_query(job_name=job_name))
+    assert ingestor.watermark.key != batch.key
@@ -0,0 +1,100 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+import requests  # type: ignore
+
+from app import connectors
+from app.connectors import LokiEntry, LokiQueryError, aiter_loki_logs, iter_loki_logs
+from tests.fake_loki import BASE_URL, FakeLoki, FakeLokiAdapter, make_entries
+
+START_SECONDS = 1_700_000_000
+START_NS = START_SECONDS * connectors.NANOSECONDS
+START = datetime.fromtimestamp(START_SECONDS).strftime("%Y-%m-%d %H:%M:%S")
+END = datetime.fromtimestamp(START_SECONDS + 1).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def with_shared_timestamps() -> list[LokiEntry]:
+    """Ten lines where pairs share a timestamp, so page boundaries fall inside a timestamp."""
+    return [LokiEntry(START_NS + i // 2, f"line {i}", {"job": "test"}) for i in range(10)]
+
+
+def serve(monkeypatch, loki: FakeLoki) -> FakeLoki:
+    session = requests.Session()
+    session.mount(BASE_URL, FakeLokiAdapter(loki))
+    monkeypatch.setattr(connectors, "_session", session)
+    return loki
+
+
+@pytest.fixture
+def loki(monkeypatch) -> FakeLoki:
+    return serve(monkeypatch, FakeLoki(with_shared_timestamps()))
+
+
+def lines(entries) -> list[str]:
+    return [entry.line for entry in entries]
+
+
+@pytest.mark.parametrize("direction", ["forward", "backward"])
+def test_pages_return_every_line_once(loki, direction):
+    entries = list(iter_loki_logs(BASE_URL, "test", START, END, page_size=3, direction=direction))
+    assert sorted(lines(entries)) == sorted(lines(loki.entries))
+    timestamps = [entry.timestamp for entry in entries]
+    assert timestamps == sorted(timestamps, reverse=direction == "backward")
+    assert len(loki.range_requests()) > 3
+
+
+def test_pages_move_the_cursor(loki):
+    list(iter_loki_logs(BASE_URL, "test", START, END, page_size=3, direction="backward"))
+    ends = [int(request["end"]) for request in loki.range_requests()]
+    assert ends[0] == START_NS + connectors.NANOSECONDS
+    assert ends == sorted(ends, reverse=True) and len(set(ends)) == len(ends)
+    assert {int(request["start"]) for request in loki.range_requests()} == {START_NS}
+
+
+def test_max_entries_stops_paging(loki):
+    entries = list(iter_loki_logs(BASE_URL, "test", START, END, page_size=3, max_entries=4))
+    assert lines(entries) == ["line 9", "line 8", "line 7", "line 6"]
+    assert len(loki.range_requests()) == 2
+
+
+def test_a_page_of_only_duplicates_stops_paging(monkeypatch):
+    serve(monkeypatch, FakeLoki([LokiEntry(START_NS, f"line {i}", {"job": "test"}) for i in range(5)]))
+
+    entries = list(iter_loki_logs(BASE_URL, "test", START, END, page_size=2, direction="forward"))
+    assert len(entries) == 2
+
+
+def test_async_pages_walk_the_whole_range():
+    fake = FakeLoki(make_entries(25, start_ns=START_NS))
+    end = datetime.fromtimestamp(START_SECONDS + 25).strftime("%Y-%m-%d %H:%M:%S")
+
+    async def fetch() -> list[LokiEntry]:
+        async with fake.async_session() as session:
+            return [entry async for entry in aiter_loki_logs(session, BASE_URL, "test", START, end, page_size=10)]
+
+    entries = asyncio.run(fetch())
+    assert lines(entries) == [f"line {i}" for i in reversed(range(25))]
+    assert len(fake.range_requests()) == 3
+
+
+def test_a_failed_page_raises_after_the_pages_before_it(monkeypatch):
+    loki = FakeLoki(with_shared_timestamps(), fails=lambda params: int(params["end"]) < START_NS + 4)
+    serve(monkeypatch, loki)
+
+    entries = []
+    with pytest.raises(LokiQueryError):
+        for entry in iter_loki_logs(BASE_URL, "test", START, END, page_size=3, direction="backward"):
+            entries.append(entry)
+    assert lines(entries) == ["line 9", "line 8", "line 7", "line 6", "line 5"]
+
+
+def test_a_failed_async_page_raises():
+    fake = FakeLoki(make_entries(25, start_ns=START_NS), fails=lambda params: "end" in params)
+
+    async def fetch() -> list[LokiEntry]:
+        async with fake.async_session() as session:
+            return [entry async for entry in aiter_loki_logs(session, BASE_URL, "test", START, END)]
+
+    with pytest.raises(LokiQueryError):
+        asyncio.run(fetch())
@@ -0,0 +1,31 @@
+import pytest
+from qdrant_client.models import BinaryQuantization, ScalarQuantization
+
+from app.database.profiles import PROFILES, get_profile
+
+
+def test_default_profile_keeps_qdrant_defaults():
+    profile = get_profile("default")
+    assert profile.quantization_config() is None
+    assert profile.search_params() is None
+    assert not profile.vectors_config(300).on_disk
+
+
+def test_quantized_profiles_rescore_with_oversampling():
+    scalar = get_profile("scalar")
+    assert isinstance(scalar.quantization_config(), ScalarQuantization)
+    params = scalar.search_params()
+    assert params is not None and params.quantization is not None
+    assert params.quantization.rescore and params.quantization.oversampling == 2.0
+    assert isinstance(get_profile("binary_on_disk").quantization_config(), BinaryQuantization)
+
+
+def test_on_disk_profiles_need_less_ram():
+    ram = {name: profile.estimated_ram_bytes(1_000_000, 300) for name, profile in PROFILES.items()}
+    # In RAM, quantized vectors come on top of the originals.
+    assert ram["scalar"] > ram["default"] > ram["scalar_on_disk"] > ram["binary_on_disk"]
+
+
+def test_unknown_profile():
+    with pytest.raises(ValueError, match="Unknown collection profile"):
+        get_profile("huge")
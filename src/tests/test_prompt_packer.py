@@ -0,0 +1,79 @@
+import pytest
+
+from app.connectors import LokiEntry
+from app.prompt_packer import (
+    OMITTED_LINE_TOKENS,
+    PromptLine,
+    TokenCounter,
+    pack,
+    pack_logs,
+    prompt_budget,
+    severity,
+    to_prompt_lines,
+)
+from app.settings import MODEL_CONTEXT_TOKENS, PROMPT_MAX_TOKENS
+
+MODEL = "test-packer"
+
+
+def test_token_estimate_follows_the_tokenizer_pieces():
+    counter = TokenCounter()
+    assert counter.count("hello world") == 2
+    assert counter.count("abcdefghijklm") == 3
+    assert counter.count("123456") == 2
+    assert counter.count("a=b;") == 4
+    assert counter.count_messages([{"role": "user", "content": "hello world"}]) == 6
+
+
+def test_calibration_moves_towards_the_reported_tokens_within_bounds():
+    counter = TokenCounter(smoothing=0.5)
+    counter.observe(100, 200)
+    assert counter.ratio == pytest.approx(1.5)
+    for _ in range(20):
+        counter.observe(10, 1000)
+    assert counter.ratio == 4.0
+    counter.observe(0, 10)
+    assert counter.ratio == 4.0
+
+
+def test_severity_ranks():
+    assert severity("fatal") < severity("ERROR") < severity("warning") < severity(None) < severity("debug")
+    assert severity("unknown") == severity("INFO")
+
+
+def test_identical_lines_are_merged():
+    lines = [PromptLine("disk full", "WARN", 1), PromptLine("disk full", "ERROR", 3), PromptLine("ok", "INFO", 2)]
+    assert pack(lines, budget=1000, model=MODEL) == ["ok", "disk full (x2)"]
+
+
+def test_lines_past_the_budget_are_the_least_severe_and_oldest():
+    lines = [PromptLine(f"info {i}", "INFO", i) for i in range(50)] + [PromptLine("boom", "ERROR", 0)]
+    packed = pack(lines, budget=OMITTED_LINE_TOKENS + 9, model=MODEL)
+    # Each kept line costs its two tokens plus one for the newline.
+    assert packed == ["boom", "info 48", "info 49", "... 48 less severe or older lines left out"]
+
+
+def test_a_long_line_is_cut_short():
+    packed = pack([PromptLine("word " * 1000, "ERROR", 0)], budget=500, model=MODEL)
+    assert len(packed) == 1 and packed[0].endswith("...")
+    assert TokenCounter().count(packed[0]) <= 50 + 3
+
+
+def test_budget_leaves_room_for_the_response_and_fixed_parts(monkeypatch):
+    monkeypatch.setitem(MODEL_CONTEXT_TOKENS, MODEL, PROMPT_MAX_TOKENS + 500)
+    assert prompt_budget(MODEL, 1000) == PROMPT_MAX_TOKENS - 500
+    assert prompt_budget(MODEL, 100) == PROMPT_MAX_TOKENS
+    assert prompt_budget(MODEL, 1000, "system prompt") == PROMPT_MAX_TOKENS - 500 - 2 - 4
+    assert prompt_budget(MODEL, 10**9) == 0
+
+
+def test_prompt_lines_of_the_supported_log_shapes():
+    assert to_prompt_lines("ok\nERROR boom") == [PromptLine("ok", "INFO", 0), PromptLine("ERROR boom", "ERROR", 1)]
+    stream = {"stream": {"level": "WARN", "service": "api"}, "values": [["5", "slow"]]}
+    assert to_prompt_lines([stream]) == [PromptLine("[WARN] api: slow", "WARN", 5)]
+    entry = LokiEntry(7, "down", {"level": "ERROR", "service": "db"})
+    assert to_prompt_lines([entry]) == [PromptLine("[ERROR] db: down", "ERROR", 7)]
+    assert to_prompt_lines([{"message": "m", "full": "[ERROR] x: m", "count": 3}]) == [
+        PromptLine("[ERROR] x: m", "ERROR", 0, 3)
+    ]
+    assert pack_logs("a\nb\na", budget=100, model=MODEL) == "b\na (x2)"
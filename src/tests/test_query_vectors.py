@@ -0,0 +1,42 @@
+import pytest
+
+from app.database import query_vectors
+from app.database.query_vectors import QueryVectors
+
+
+@pytest.fixture
+def embedded(monkeypatch) -> list[list[str]]:
+    """The texts of each embedding call."""
+    calls: list[list[str]] = []
+
+    def generate_embeddings(texts: list) -> list:
+        calls.append(list(texts))
+        return [[float(len(text)), 1.0] for text in texts]
+
+    monkeypatch.setattr(query_vectors, "generate_embeddings", generate_embeddings)
+    return calls
+
+
+def test_standing_queries_are_embedded_together_once(embedded):
+    vectors = QueryVectors(standing=["error", "timeout"])
+    vectors.precompute()
+    vectors.precompute()
+    assert embedded == [["error", "timeout"]]
+    assert vectors.get("  timeout ") == [7.0, 1.0]
+    assert embedded == [["error", "timeout"]]
+    assert vectors.stats()["standing_hits"] == 1
+
+
+def test_misses_of_one_call_are_embedded_in_one_batch(embedded):
+    vectors = QueryVectors()
+    assert vectors.get_many(["a", "bb", "a"]) == [[1.0, 1.0], [2.0, 1.0], [1.0, 1.0]]
+    assert vectors.get_many(["bb", "ccc"]) == [[2.0, 1.0], [3.0, 1.0]]
+    assert embedded == [["a", "bb"], ["ccc"]]
+
+
+def test_other_queries_are_evicted_but_standing_ones_are_not(embedded):
+    vectors = QueryVectors(standing=["error"], max_items=1)
+    vectors.get_many(["error", "one", "two"])
+    vectors.get("error")
+    vectors.get("one")
+    assert embedded == [["error", "one", "two"], ["one"]]
@@ -0,0 +1,84 @@
+import asyncio
+
+from app.tools.llm_client import LLMRequestError
+from app.tools.llm_scheduler import PRIORITY_REPORT
+from app.tools.report_generator import LogReportGenerator
+
+
+class AnsweringChatClient:
+    model = "gpt-4o-mini"
+
+    def __init__(self) -> None:
+        self.priorities: list[int] = []
+
+    def chat(self, messages, priority=None, **kwargs):
+        self.priorities.append(priority)
+        return "no issues found"
+
+    async def achat(self, messages, priority=None, **kwargs):
+        return self.chat(messages, priority=priority)
+
+
+class FailingChatClient:
+    model = "gpt-4o-mini"
+
+    def chat(self, messages, **kwargs):
+        raise LLMRequestError("rate limited")
+
+    async def achat(self, messages, **kwargs):
+        raise LLMRequestError("rate limited")
+
+
+class FakeKubeClient:
+    def list_pods(self, namespace):
+        return ["api-0"]
+
+    def get_pod_health(self, pod, namespace):
+        return {"phase": "Running"}
+
+
+class FakeLokiClient:
+    job_name = "test"
+
+
+class FakeDatabase:
+    def search(self, **kwargs):
+        return []
+
+
+def report_generator(reports_dir, openai_client) -> LogReportGenerator:
+    generator = LogReportGenerator(
+        openai_client=openai_client,
+        kube_client=FakeKubeClient(),  # type: ignore[arg-type]
+        loki_client=FakeLokiClient(),  # type: ignore[arg-type]
+    )
+    generator.database_client = FakeDatabase()  # type: ignore[assignment]
+    generator.reports_dir = str(reports_dir)
+    return generator
+
+
+def test_reports_are_analysed_at_report_priority(tmp_path):
+    chat_client = AnsweringChatClient()
+    report = report_generator(tmp_path, chat_client).generate_report()
+    asyncio.run(report_generator(tmp_path, chat_client).agenerate_report())
+
+    assert report["log_analysis"] == "no issues found"
+    assert report["pod_statuses"] == {"api-0": {"phase": "Running"}}
+    assert chat_client.priorities == [PRIORITY_REPORT, PRIORITY_REPORT]
+    assert all("no issues found" in saved.read_text() for saved in tmp_path.iterdir())
+
+
+def test_report_is_saved_when_the_analysis_fails(tmp_path):
+    report = report_generator(tmp_path, FailingChatClient()).generate_report()
+
+    assert report["log_analysis"] == "Log analysis failed: rate limited"
+    assert report["pod_statuses"] == {"api-0": {"phase": "Running"}}
+    [saved] = tmp_path.iterdir()
+    assert "Log analysis failed: rate limited" in saved.read_text()
+
+
+def test_async_report_is_saved_when_the_analysis_fails(tmp_path):
+    report = asyncio.run(report_generator(tmp_path, FailingChatClient()).agenerate_report())
+
+    assert report["log_analysis"] == "Log analysis failed: rate limited"
+    assert len(list(tmp_path.iterdir())) == 1
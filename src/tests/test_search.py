@@ -0,0 +1,71 @@
+import pytest
+from qdrant_client.models import FieldCondition, MatchAny, PointStruct, Range
+
+from app.database.local_store import LocalVectorStore
+from app.database.vector_db import (
+    PAYLOAD_INDEXES,
+    QdrantDatabaseClient,
+    build_log_filter,
+)
+from app.settings import QDRANT_VECTOR_SIZE
+
+Client = getattr(QdrantDatabaseClient, "__wrapped__")
+
+POINTS = [
+    (1, [1.0, 0.0], {"level": "ERROR", "service": "api", "job": "test", "ts": 100}),
+    (2, [0.9, 0.1], {"level": "error", "service": "web", "job": "test", "ts": 200}),
+    (3, [0.8, 0.2], {"level": "INFO", "service": "api", "job": "test", "ts": 300}),
+    (4, [0.7, 0.3], {"level": "ERROR", "service": "api", "job": "other", "ts": 400}),
+]
+
+
+def test_no_condition_builds_no_filter():
+    assert build_log_filter() is None
+
+
+def test_levels_match_their_common_spellings():
+    query_filter = build_log_filter(levels=["warn"], since_ns=10)
+    assert query_filter is not None
+    level, ts = query_filter.must  # type: ignore[misc]
+    assert isinstance(level, FieldCondition) and isinstance(level.match, MatchAny)
+    assert level.match.any == ["WARN", "Warn", "warn"]
+    assert isinstance(ts, FieldCondition) and ts.range == Range(gte=10, lte=None)
+
+
+def padded(vector: list[float]) -> list[float]:
+    return vector + [0.0] * (QDRANT_VECTOR_SIZE - len(vector))
+
+
+@pytest.fixture
+def client(tmp_path):
+    client = Client(collection_name="logs", partitioned=False, backend="local")
+    client.qdrant_client = LocalVectorStore(str(tmp_path))
+    client.create_collection()
+    client.qdrant_client.upsert(
+        "logs",
+        points=[
+            PointStruct(id=point_id, vector=padded(vector), payload=payload) for point_id, vector, payload in POINTS
+        ],
+    )
+    return client
+
+
+def ids(points) -> list[int]:
+    return [point.id for point in points]
+
+
+def test_collections_get_the_payload_indexes(client):
+    assert set(client.qdrant_client.get_collection("logs").payload_schema) == set(PAYLOAD_INDEXES)
+
+
+def test_search_filters_on_the_indexed_fields(client):
+    query = padded([1.0, 0.0])
+    assert ids(client.search(query_vector=query, limit=10)) == [1, 2, 3, 4]
+    assert ids(client.search(query_vector=query, limit=10, levels=["ERROR"])) == [1, 2, 4]
+    assert ids(client.search(query_vector=query, limit=10, levels=["error"], services=["api"], job="test")) == [1]
+    assert ids(client.search(query_vector=query, limit=10, since_ns=200, until_ns=300)) == [2, 3]
+
+
+def test_search_needs_a_query(client):
+    with pytest.raises(ValueError):
+        client.search()
@@ -0,0 +1,201 @@
+import asyncio
+import time
+
+import pytest
+
+from app.connectors import (
+    NANOSECONDS,
+    LokiEntry,
+    LokiShardError,
+    ShardPlanner,
+    aiter_loki_logs_sharded,
+    amerge_entries,
+)
+from app.log_batch import LogBatch
+from app.tools.loki_client import LokiClient
+from tests.fake_loki import BASE_URL, FakeLoki, make_entries
+
+
+async def aiter(entries):
+    for entry in entries:
+        yield entry
+
+
+def entry(ts: int) -> LokiEntry:
+    return LokiEntry(ts, f"line {ts}", {"job": "test"})
+
+
+async def collect(iterator) -> list:
+    return [item async for item in iterator]
+
+
+def test_plan_covers_the_range_in_both_directions():
+    planner = ShardPlanner(shard_seconds=3)
+    start, end = 0, 10 * NANOSECONDS
+    forward = list(planner.plan(start, end))
+    backward = list(planner.plan(start, end, reverse=True))
+
+    assert forward[0][0] == start and forward[-1][1] == end
+    assert all(a[1] == b[0] for a, b in zip(forward, forward[1:]))
+    assert backward[0][1] == end and backward[-1][0] == start
+    assert all(a[0] == b[1] for a, b in zip(backward, backward[1:]))
+
+
+def test_plan_cuts_later_shards_with_the_learnt_size():
+    planner = ShardPlanner(shard_seconds=1, min_shard_seconds=1, max_shard_seconds=100)
+    shards = planner.plan(0, 100 * NANOSECONDS)
+    first = next(shards)
+    planner.shard_seconds = 10
+    second = next(shards)
+    assert first[1] - first[0] == NANOSECONDS
+    assert second == (NANOSECONDS, 11 * NANOSECONDS)
+
+
+def test_record_moves_towards_the_target_latency_within_bounds():
+    planner = ShardPlanner(shard_seconds=60, target_latency_seconds=2, min_shard_seconds=10, max_shard_seconds=600)
+    # 60s of logs took 6s: the ideal shard is 20s, so the size moves halfway there.
+    planner.record(60 * NANOSECONDS, 6)
+    assert planner.shard_seconds == 40
+    for _ in range(5):
+        planner.record(int(planner.shard_seconds * NANOSECONDS), 1000)
+    assert planner.shard_seconds == 10
+    planner.record(10 * NANOSECONDS, 0.001)
+    assert planner.shard_seconds == 600
+
+
+def test_merge_interleaves_overlapping_sources_in_order():
+    sources = [(1, aiter([entry(1), entry(4), entry(7)])), (2, aiter([entry(2), entry(3), entry(9)]))]
+    merged = asyncio.run(collect(amerge_entries(sources)))
+    assert [e.timestamp for e in merged] == [1, 2, 3, 4, 7, 9]
+
+    sources = [(9, aiter([entry(9), entry(3)])), (8, aiter([entry(8), entry(4), entry(1)]))]
+    merged = asyncio.run(collect(amerge_entries(sources, reverse=True)))
+    assert [e.timestamp for e in merged] == [9, 8, 4, 3, 1]
+
+
+def test_merge_takes_sources_only_when_it_reaches_them() -> None:
+    taken: list[int] = []
+    progress: list[tuple[int, int]] = []
+
+    def sources():
+        for bound in (0, 10, 20):
+            taken.append(bound)
+            yield bound, aiter([entry(bound + 1), entry(bound + 2)])
+
+    async def run():
+        async for merged in amerge_entries(sources()):
+            progress.append((merged.timestamp, len(taken)))
+
+    asyncio.run(run())
+    # Each source is taken when the merge reaches the bound of the one before it.
+    assert progress == [(1, 2), (2, 2), (11, 3), (12, 3), (21, 3), (22, 3)]
+
+
+def test_sharded_fetch_yields_every_line_in_order():
+    start_ns = time.time_ns() - 3600 * NANOSECONDS
+    loki = FakeLoki(make_entries(50, start_ns=start_ns, step_ns=NANOSECONDS // 2))
+    end_ns = start_ns + 30 * NANOSECONDS
+
+    async def fetch(direction: str) -> list[int]:
+        planner = ShardPlanner(shard_seconds=2, parallelism=3, min_shard_seconds=1, max_shard_seconds=2)
+        entries = aiter_loki_logs_sharded(
+            loki.async_session(), BASE_URL, "test", start_ns, end_ns, planner=planner, page_size=3, direction=direction
+        )
+        return [e.timestamp for e in await collect(entries)]
+
+    expected = [e.timestamp for e in loki.entries]
+    assert asyncio.run(fetch("forward")) == expected
+    assert asyncio.run(fetch("backward")) == expected[::-1]
+
+
+def test_a_failed_shard_raises_after_the_lines_before_it() -> None:
+    start_ns = time.time_ns() - 3600 * NANOSECONDS
+    failed_ns = start_ns + 30 * NANOSECONDS
+    loki = FakeLoki(
+        make_entries(100, start_ns=start_ns),
+        fails=lambda params: failed_ns <= int(params["start"]) < failed_ns + 10 * NANOSECONDS,
+    )
+    planner = ShardPlanner(shard_seconds=10, parallelism=2, min_shard_seconds=10, max_shard_seconds=10)
+    timestamps: list[int] = []
+
+    async def fetch() -> None:
+        entries = aiter_loki_logs_sharded(
+            loki.async_session(), BASE_URL, "test", start_ns, start_ns + 100 * NANOSECONDS, planner=planner
+        )
+        async for e in entries:
+            timestamps.append(e.timestamp)
+
+    with pytest.raises(LokiShardError) as error:
+        asyncio.run(fetch())
+    assert error.value.start_ns == failed_ns
+    assert timestamps == [e.timestamp for e in loki.entries[:30]]
+    # Only the shards up to the one started alongside the failed one were requested.
+    assert max(int(r["start"]) for r in loki.range_requests()) < failed_ns + 20 * NANOSECONDS
+
+
+def test_sharded_fetch_resizes_shards_during_the_query():
+    start_ns = time.time_ns() - 3600 * NANOSECONDS
+    loki = FakeLoki(make_entries(100, start_ns=start_ns))
+    # The fake answers at once, so the planner grows shards towards the maximum as they finish.
+    planner = ShardPlanner(
+        shard_seconds=1, parallelism=1, target_latency_seconds=10, min_shard_seconds=1, max_shard_seconds=50
+    )
+    entries = asyncio.run(
+        collect(
+            aiter_loki_logs_sharded(
+                loki.async_session(), BASE_URL, "test", start_ns, start_ns + 100 * NANOSECONDS, planner=planner
+            )
+        )
+    )
+    assert len(entries) == 100
+    assert len(loki.range_requests()) < 10
+
+
+class FakeDatabase:
+    def __init__(self) -> None:
+        self.lines: list[str] = []
+
+    def upsert_log_batch(self, batch: LogBatch) -> None:
+        self.lines.extend(e.line for e in batch)
+
+
+def test_upsert_fetches_from_the_watermark_in_shards():
+    start_ns = time.time_ns() - 3600 * NANOSECONDS
+    loki = FakeLoki(make_entries(20, start_ns=start_ns, step_ns=60 * NANOSECONDS))
+    client = LokiClient(BASE_URL, "sharded-upsert")
+    client._async_session = loki.async_session()
+    client.database_client = FakeDatabase()  # type: ignore[assignment]
+    client.shard_planner = ShardPlanner(shard_seconds=600, parallelism=2, min_shard_seconds=600)
+
+    assert asyncio.run(client.aupsert_logs(hours=2, batch_size=7)) == 20
+    assert client.database_client.lines == [f"line {i}" for i in range(20)]
+    assert len({(r["start"], r["end"]) for r in loki.range_requests()}) > 1
+    # Everything is behind the watermark now.
+    assert asyncio.run(client.aupsert_logs(hours=2)) == 0
+
+
+def test_backfill_does_not_move_the_watermark_past_a_failed_shard():
+    start_ns = time.time_ns() - 3600 * NANOSECONDS
+    failed_ns = start_ns + 600 * NANOSECONDS
+    loki = FakeLoki(
+        make_entries(20, start_ns=start_ns, step_ns=60 * NANOSECONDS),
+        fails=lambda params: failed_ns <= int(params["start"]) < failed_ns + 300 * NANOSECONDS,
+    )
+    client = LokiClient(BASE_URL, "sharded-failure")
+    client._async_session = loki.async_session()
+    client.database_client = FakeDatabase()  # type: ignore[assignment]
+    client.shard_planner = ShardPlanner(shard_seconds=300, parallelism=2, min_shard_seconds=300, max_shard_seconds=300)
+    end_ns = start_ns + 1200 * NANOSECONDS
+
+    with pytest.raises(LokiShardError):
+        asyncio.run(client.backfill_logs(start_ns, end_ns, batch_size=4, watermark=client.watermark()))
+    assert client.database_client.lines == [f"line {i}" for i in range(8)]
+    watermark = client.watermark()
+    assert watermark.last_seen_ns is not None and watermark.last_seen_ns < failed_ns
+
+    # Once Loki answers again, the next run fetches the missing lines and nothing twice.
+    loki.fails = None
+    watermark = client.watermark()
+    resume_ns = watermark.start_ns(start_ns)
+    assert asyncio.run(client.backfill_logs(resume_ns, end_ns, batch_size=4, watermark=watermark)) == 12
+    assert client.database_client.lines == [f"line {i}" for i in range(20)]
@@ -0,0 +1,91 @@
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+from app.database import vector_db
+from app.database.known_ids import KnownIds
+from app.database.local_store import LocalVectorStore
+from app.database.partitions import (
+    DAY_NS,
+    day_start_ns,
+    expired,
+    oldest_kept_day,
+    overlapping,
+    parse_partition_day,
+    partition_day,
+    partition_name,
+)
+from app.database.vector_db import QdrantDatabaseClient
+from app.settings import QDRANT_VECTOR_SIZE
+
+# The class behind the singleton, so each test gets its own client.
+Client = getattr(QdrantDatabaseClient, "__wrapped__")
+
+
+def unreachable_client(partitioned: bool = True):
+    return Client(host="http://127.0.0.1:1", collection_name="test_logs", partitioned=partitioned, backend="qdrant")
+
+
+def test_setup_survives_unreachable_qdrant():
+    client = unreachable_client()
+    assert client.setup() is client
+
+
+def test_drop_expired_partitions_without_qdrant_drops_nothing():
+    assert unreachable_client().drop_expired_partitions(retention_days=1) == []
+
+
+def test_partition_names_round_trip():
+    day = date(2024, 2, 29)
+    assert partition_name("logs", day) == "logs_20240229"
+    assert parse_partition_day("logs", "logs_20240229") == day
+    assert parse_partition_day("logs", "logs_20240230") is None
+    assert parse_partition_day("logs", "other_20240229") is None
+    assert parse_partition_day("logs", "logs") is None
+
+
+def test_partitions_overlapping_a_window_newest_first():
+    partitions = {partition_name("logs", date(2024, 1, d)): date(2024, 1, d) for d in (1, 2, 3)}
+    jan_2 = day_start_ns(date(2024, 1, 2))
+    assert overlapping(partitions, jan_2, jan_2 + DAY_NS - 1) == ["logs_20240102"]
+    assert overlapping(partitions, jan_2 - 1, None) == ["logs_20240103", "logs_20240102", "logs_20240101"]
+    assert overlapping(partitions, None, jan_2 - 1) == ["logs_20240101"]
+
+
+def test_partitions_past_the_retention_expire():
+    partitions = {partition_name("logs", date(2024, 1, d)): date(2024, 1, d) for d in (1, 2, 3)}
+    now_ns = day_start_ns(date(2024, 1, 3)) + 1
+    assert oldest_kept_day(2, now_ns) == date(2024, 1, 2)
+    assert expired(partitions, 2, now_ns) == ["logs_20240101"]
+
+
+def embed(texts: list, batch_size=None):
+    yield np.ones((len(texts), QDRANT_VECTOR_SIZE), dtype=np.float32)
+
+
+def test_points_go_to_the_partition_of_their_day(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_db, "generate_embedding_batches", embed)
+    client = Client(collection_name="logs", partitioned=True, backend="local")
+    client.qdrant_client = LocalVectorStore(str(tmp_path))
+    client.known_ids = KnownIds()
+    today = partition_day(time.time_ns())
+    yesterday = today - timedelta(days=1)
+    payloads = [{"ts": day_start_ns(day) + i, "level": "ERROR"} for i, day in enumerate([today, yesterday, today])]
+    client.upsert(["a", "b", "c"], payloads)
+
+    assert client.list_partitions() == {
+        partition_name("logs", today): today,
+        partition_name("logs", yesterday): yesterday,
+    }
+    assert client.qdrant_client.count(partition_name("logs", today)).count == 2
+    results = client.search(query_vector=np.ones(QDRANT_VECTOR_SIZE), limit=10, since_ns=day_start_ns(today))
+    assert sorted(point.payload["ts"] for point in results) == [payloads[0]["ts"], payloads[2]["ts"]]
+    assert len(client.search(query_vector=np.ones(QDRANT_VECTOR_SIZE), limit=10)) == 3
+
+    assert len(client.known_ids) == 3
+    assert client.drop_expired_partitions(retention_days=1, now_ns=time.time_ns()) == [
+        partition_name("logs", yesterday)
+    ]
+    assert list(client.list_partitions()) == [partition_name("logs", today)]
+    assert len(client.known_ids) == 2
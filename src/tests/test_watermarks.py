@@ -0,0 +1,70 @@
+import asyncio
+import time
+
+from app.connectors import NANOSECONDS, LokiEntry
+from app.tools.loki_client import LokiClient
+from app.tools.watermarks import LokiWatermark
+from tests.fake_loki import BASE_URL, FakeLoki, make_entries
+
+
+def loki_client(loki: FakeLoki, job_name: str) -> LokiClient:
+    client = LokiClient(BASE_URL, job_name)
+    client._async_session = loki.async_session()
+    return client
+
+
+def gather_lines(client: LokiClient, max_entries: int | None = None) -> list[str]:
+    [entries] = asyncio.run(client.gather_loki_logs([{}], hours=2, max_entries=max_entries, since_watermark=True))
+    client.commit_watermarks()
+    return [entry.line for entry in entries]
+
+
+def test_is_new_drops_lines_seen_in_the_overlap(tmp_path):
+    path = str(tmp_path / "watermarks.json")
+    entries = make_entries(3, start_ns=10 * NANOSECONDS)
+    watermark = LokiWatermark(BASE_URL, "job", "query", path=path, overlap_seconds=60)
+    watermark.advance(entries[:2])
+    watermark.save()
+
+    reloaded = LokiWatermark(BASE_URL, "job", "query", path=path, overlap_seconds=60)
+    assert reloaded.last_seen_ns == entries[1].timestamp
+    assert reloaded.start_ns(0) == entries[1].timestamp - 60 * NANOSECONDS
+    assert [reloaded.is_new(entry) for entry in entries] == [False, False, True]
+    # A different line at an already seen timestamp is still new.
+    assert reloaded.is_new(LokiEntry(entries[1].timestamp, "other", entries[1].stream))
+
+
+def test_watermarks_of_different_queries_do_not_overwrite_each_other(tmp_path):
+    path = str(tmp_path / "watermarks.json")
+    first = LokiWatermark(BASE_URL, "job", "first", path=path)
+    second = LokiWatermark(BASE_URL, "job", "second", path=path)
+    first.advance(make_entries(1, start_ns=1))
+    second.advance(make_entries(1, start_ns=2))
+    first.save()
+    second.save()
+
+    assert LokiWatermark(BASE_URL, "job", "first", path=path).last_seen_ns == 1
+    assert LokiWatermark(BASE_URL, "job", "second", path=path).last_seen_ns == 2
+
+
+def test_capped_watermark_reads_resume_without_losing_lines():
+    start_ns = time.time_ns() - 3600 * NANOSECONDS
+    loki = FakeLoki(make_entries(10, start_ns=start_ns))
+    client = loki_client(loki, "capped")
+
+    assert gather_lines(client, max_entries=4) == ["line 0", "line 1", "line 2", "line 3"]
+    assert gather_lines(client, max_entries=4) == ["line 4", "line 5", "line 6", "line 7"]
+    assert gather_lines(client, max_entries=4) == ["line 8", "line 9"]
+    assert gather_lines(client, max_entries=4) == []
+    assert all(request["direction"] == "forward" for request in loki.range_requests())
+
+
+def test_uncommitted_watermarks_are_read_again():
+    start_ns = time.time_ns() - 3600 * NANOSECONDS
+    loki = FakeLoki(make_entries(3, start_ns=start_ns))
+    client = loki_client(loki, "uncommitted")
+
+    asyncio.run(client.gather_loki_logs([{}], hours=2, since_watermark=True))
+    client._pending_watermarks = []
+    assert gather_lines(client) == ["line 0", "line 1", "line 2"]
+    assert gather_lines(client) == []